@@ -0,0 +1,374 @@
+"""ASGI serving mode: the /api/login, /api/cars, /api/bookings and
+/api/customers contract of main.py on FastAPI.
+
+Run with `uvicorn asgi:app --workers 4`. On Postgres, list queries go
+through an asyncpg pool, so a slow query waits on the event loop instead
+of holding a worker thread. Writes still go through the helpers in
+database.py on the threadpool, so overlap checks and any other
+write-side logic stay in one place. Without DATABASE_URL (SQLite),
+reads also run the sync helpers on the threadpool.
+"""
+import os
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import asyncpg
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.sessions import SessionMiddleware
+
+from database import (Database, DatabaseUnavailable, add_booking, add_customer,
+                      blacklist_customer, check_permission,
+                      BookingConflictError, cars_page_query,
+                      bookings_page_query, customers_page_query, _run_page,
+                      translation_catalog, price_booking, PricingError,
+                      register_write_listener)
+from dialect import ASYNCPG
+from log_config import configure_logging
+from translation_cache import request_language
+import serializers
+from response_cache import ResponseCache, etag_matches
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 1000
+
+# asyncpg errors meaning Postgres could not be reached, not a bad query
+_UNREACHABLE = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError,
+                asyncpg.CannotConnectNowError)
+ENFORCE_PERMISSIONS = os.getenv('ENFORCE_PERMISSIONS',
+                                '').lower() in ('1', 'true', 'yes')
+
+
+class SerializedJSONResponse(JSONResponse):
+    """JSONResponse encoded with serializers.dumps (dates, Decimals,
+    orjson when installed)."""
+
+    def render(self, content):
+        return serializers.dumps(content)
+
+
+async def _init_connection(conn):
+    # Return JSONB columns (cars.rates, cars.features) as Python objects
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name,
+                                  encoder=json.dumps,
+                                  decoder=json.loads,
+                                  schema='pg_catalog')
+
+
+class AsyncDatabase:
+    pool = None
+
+    @classmethod
+    async def connect(cls):
+        database_url = os.getenv('DATABASE_URL')
+        if not database_url:
+            logger.info("No DATABASE_URL; async reads use the SQLite pool")
+            return
+        settings = dict(max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                        timeout=float(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+                        init=_init_connection)
+        try:
+            cls.pool = await asyncpg.create_pool(
+                database_url,
+                min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+                **settings)
+        except (asyncpg.PostgresError, OSError) as e:
+            # Start anyway; an empty pool connects on first acquire, so
+            # reads recover by themselves once Postgres is back
+            logger.error("asyncpg pool could not connect: %s", e)
+            cls.pool = await asyncpg.create_pool(database_url,
+                                                 min_size=0,
+                                                 **settings)
+
+    @classmethod
+    async def close(cls):
+        if cls.pool is not None:
+            await cls.pool.close()
+            cls.pool = None
+
+    @classmethod
+    async def run_page(cls, page):
+        """Async counterpart of database._run_page for a PageQuery.
+
+        Raises DatabaseUnavailable when Postgres cannot be reached.
+        """
+        if cls.pool is None:
+            return await run_in_threadpool(_run_page, page)
+        try:
+            async with cls.pool.acquire() as conn:
+                rows = await conn.fetch(ASYNCPG.compile(page.query),
+                                        *page.params)
+        except _UNREACHABLE as e:
+            # Fail fast everywhere, cached pages included, until it is back
+            Database._connection_lost(e)
+            raise DatabaseUnavailable(f"PostgreSQL is unavailable: {e}") from e
+        except asyncpg.PostgresError as e:
+            logger.error("Error getting %s page: %s", page.table, e)
+            return [], None
+        return page.finish([dict(r) for r in rows])
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Schema is created by `python database.py migrate`, not at startup
+    await AsyncDatabase.connect()
+    yield
+    await AsyncDatabase.close()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=SerializedJSONResponse)
+app.add_middleware(SessionMiddleware,
+                   secret_key=os.getenv('SECRET_KEY', 'your_secret_key_here'))
+
+
+async def _(request, string, **variables):
+    """main.py's gettext: the cached DB catalog of the request's language
+    (request_language), else the string itself."""
+    lang_code = request_language(request.session.get('language'),
+                                 request.headers.get('accept-language'))
+    translated = await run_in_threadpool(translation_catalog.lookup, lang_code,
+                                         string, string)
+    return translated % variables if variables else translated
+
+
+def _error(message, status_code):
+    return SerializedJSONResponse({
+        'status': 'error',
+        'message': message
+    },
+                                  status_code=status_code)
+
+
+async def _authorize(request, permission):
+    """Return an error response, or None if the vendor may proceed."""
+    session = request.session
+    if 'username' not in session or session.get('role') != 'vendor':
+        return _error('Unauthorized', 401)
+    if ENFORCE_PERMISSIONS and not await run_in_threadpool(
+            check_permission, session['username'], permission):
+        return _error('Forbidden', 403)
+    return None
+
+
+# Same cache as main.py's cached_response, one per worker process
+response_cache = ResponseCache(max_entries=int(
+    os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024')),
+                               ttl=float(os.getenv('RESPONSE_CACHE_TTL',
+                                                   '30')))
+register_write_listener(response_cache.invalidate)
+
+
+def _page_args(request):
+    """Read limit/after/fields query parameters, raising ValueError if bad."""
+    args = request.query_params
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit must be an integer') from None
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    after = args.get('after') or None
+    fields = args.get('fields')
+    fields = [f.strip() for f in fields.split(',')
+              if f.strip()] if fields else None
+    return limit, after, fields
+
+
+async def _page_response(request, build_query, *args, **kwargs):
+    try:
+        limit, after, fields = _page_args(request)
+        page = build_query(*args,
+                           limit=limit,
+                           after=after,
+                           fields=fields,
+                           **kwargs)
+    except ValueError as e:
+        return _error(str(e), 400)
+    rows, next_cursor = await AsyncDatabase.run_page(page)
+    return SerializedJSONResponse({
+        'status': 'success',
+        'data': rows,
+        'next_cursor': next_cursor
+    })
+
+
+@app.exception_handler(DatabaseUnavailable)
+async def database_unavailable(request: Request, exc: DatabaseUnavailable):
+    logger.error("Request failed, database unavailable: %s", exc)
+    return _error('Database unavailable', 503)
+
+
+@app.get('/healthz')
+async def healthz():
+    """Liveness: the event loop is serving; the database is not checked."""
+    return {'status': 'ok'}
+
+
+@app.get('/readyz')
+async def readyz():
+    """Readiness: the database answers and the schema is migrated."""
+    state = await run_in_threadpool(Database.health)
+    return SerializedJSONResponse(
+        {
+            'status': 'ready' if state['ready'] else 'unavailable',
+            'database': state
+        },
+        status_code=200 if state['ready'] else 503)
+
+
+@app.post('/api/login')
+async def api_login(request: Request):
+    form = await request.form()
+    username = form.get('username')
+    if username == 'vendor1' and form.get('password') == 'vendorpass':
+        request.session.update(username=username, role='vendor', vendor_id=1)
+        return {
+            'status':
+            'success',
+            'message':
+            await _(request,
+                    'Welcome to RentMaster, %(username)s!',
+                    username=username)
+        }
+    return _error(await _(request, 'Invalid credentials'), 401)
+
+
+@app.post('/api/logout')
+async def api_logout(request: Request):
+    request.session.clear()
+    return {
+        'status': 'success',
+        'message': await _(request, 'Logged out successfully')
+    }
+
+
+async def _cached_page_response(request, table, build_query, *args, **kwargs):
+    """_page_response for GETs through response_cache, with ETags; a 503
+    rather than a cached page while the database is unavailable."""
+    if request.method != 'GET':
+        return await _page_response(request, build_query, *args, **kwargs)
+    Database.check_available()
+    vendor_id = request.session.get('vendor_id')
+    key = (request.url.path, vendor_id,
+           tuple(sorted(request.query_params.multi_items())))
+    cached = response_cache.get(key)
+    if cached is None:
+        generation = response_cache.generation(table)
+        response = await _page_response(request, build_query, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        etag = response_cache.put(key, table, vendor_id, response.body,
+                                  generation)
+    else:
+        etag, body = cached
+        response = Response(body, media_type='application/json')
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'private, no-cache',
+        'Vary': 'Cookie'
+    }
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
+
+@app.get('/api/cars')
+async def api_get_cars(request: Request):
+    denied = await _authorize(request, 'cars')
+    if denied:
+        return denied
+    return await _cached_page_response(request, 'cars', cars_page_query,
+                                       request.session.get('vendor_id'))
+
+
+@app.api_route('/api/bookings', methods=['GET', 'POST'])
+async def api_bookings(request: Request):
+    denied = await _authorize(request, 'bookings')
+    if denied:
+        return denied
+    vendor_id = request.session.get('vendor_id')
+    if request.method == 'POST':
+        form = await request.form()
+        insurance = [i for i in form.getlist('insurance') if i]
+        try:
+            cost = await run_in_threadpool(price_booking, vendor_id,
+                                           form.get('car_id'),
+                                           form.get('start_date'),
+                                           form.get('end_date'), insurance)
+        except PricingError as e:
+            return _error(str(e), 400)
+        if cost is None:
+            return _error('Pricing is unavailable', 500)
+        try:
+            added = await run_in_threadpool(add_booking, vendor_id,
+                                            form.get('car_id'),
+                                            form.get('user_name'),
+                                            form.get('start_date'),
+                                            form.get('end_date'),
+                                            form.get('duration'), cost,
+                                            form.get('contract_number'),
+                                            form.get('payment_type'),
+                                            form.get('account_id'))
+        except BookingConflictError:
+            return _error(
+                await _(request,
+                        'This car is already booked for the selected dates'),
+                409)
+        except ValueError as e:
+            return _error(str(e), 400)
+        if not added:
+            return _error('Could not add booking', 500)
+        return {
+            'status': 'success',
+            'message': await _(request, 'Booking added successfully!')
+        }
+    return await _page_response(request,
+                                bookings_page_query,
+                                vendor_id,
+                                future_only=False)
+
+
+@app.api_route('/api/customers', methods=['GET', 'POST'])
+async def api_customers(request: Request):
+    denied = await _authorize(request, 'customers')
+    if denied:
+        return denied
+    vendor_id = request.session.get('vendor_id')
+    if request.method == 'POST':
+        form = await request.form()
+        if form.get('add_customer'):
+            try:
+                rating = int(form.get('rating'))
+            except (TypeError, ValueError):
+                return _error('rating must be an integer', 400)
+            await run_in_threadpool(add_customer, vendor_id, form.get('name'),
+                                    form.get('email'), form.get('phone'),
+                                    form.get('id_number'),
+                                    form.get('license_number'),
+                                    form.get('license_country'),
+                                    form.get('license_expiry'), rating)
+            return {
+                'status': 'success',
+                'message': await _(request, 'Customer added successfully!')
+            }
+        elif form.get('blacklist') or form.get('unblacklist'):
+            await run_in_threadpool(blacklist_customer,
+                                    form.get('customer_id'),
+                                    bool(form.get('blacklist')))
+            return {
+                'status':
+                'success',
+                'message':
+                await _(request, 'Customer status updated successfully!')
+            }
+    return await _cached_page_response(request, 'customers',
+                                       customers_page_query, vendor_id)
@@ -0,0 +1,408 @@
+"""Benchmark suite for the database.py helpers and the Flask /api routes.
+
+Seeds a synthetic dataset, times each helper and route, and writes one
+JSON document with p50/p95/p99 latency and throughput per benchmark:
+
+    python benchmarks/bench.py --scale small --output before.json
+    python benchmarks/bench.py --scale small --output after.json --baseline before.json
+
+SQLite runs use a scratch database file (--db-file), rebuilt on each
+run. Postgres runs use DATABASE_URL and need --reset, because seeding
+truncates the vendors, cars, customers, bookings and transactions
+tables. Pass --skip-seed to reuse a dataset seeded by an earlier run.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Bookings to seed at each scale
+SCALES = {'small': 1_000, 'medium': 100_000, 'large': 1_000_000}
+BOOKINGS_PER_CAR = 50
+CUSTOMERS_PER_CAR = 5
+BOOKING_DAYS = 3
+SEED_BATCH_SIZE = 5_000
+FIRST_BOOKING_DATE = datetime.date(2024, 1, 1)
+CAR_COLUMNS = ('vendor_id', 'name', 'rates', 'mileage', 'fuel_level', 'year',
+               'status', 'type', 'features')
+BOOKING_COLUMNS = ('vendor_id', 'car_id', 'user_name', 'start_date',
+                   'end_date', 'duration', 'cost', 'contract_number',
+                   'payment_type', 'account_id')
+TRANSACTION_COLUMNS = ('tenant_id', 'category', 'amount', 'description',
+                       'vat_amount', 'payment_type', 'date')
+SEED_TABLES = ('vendors', 'cars', 'customers', 'bookings', 'transactions')
+
+
+def _percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+def summarize(name, kind, latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'name': name,
+        'kind': kind,
+        'iterations': len(latencies),
+        'ops_per_second': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(_percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+
+
+def _insert_many(cursor, db, table, columns, rows):
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    if db.is_postgres:
+        from psycopg2 import extras
+        extras.execute_values(cursor.raw, sql + "%s", rows, page_size=1000)
+    else:
+        cursor.executemany(sql + f"({', '.join(['%s'] * len(columns))})", rows)
+
+
+def _flush_rows(db, table, columns, rows):
+    for start in range(0, len(rows), SEED_BATCH_SIZE):
+        with db.cursor() as cursor:
+            _insert_many(cursor, db, table, columns,
+                         rows[start:start + SEED_BATCH_SIZE])
+
+
+def _car_row(db, car, vendor_id, rng):
+    rates = db.dialect.json({'daily': rng.randint(30, 150)})
+    features = db.dialect.json(['GPS'])
+    car_type = rng.choice(('Sedan', 'SUV', 'Hatchback', 'Van'))
+    return (vendor_id, f"Car {car}", rates, rng.randint(0, 200_000),
+            rng.randint(0, 100), rng.randint(2010, 2024), 'Available',
+            car_type, features)
+
+
+def seed(database, bookings, vendors, rng):
+    """Insert `bookings` non-overlapping bookings spread over `vendors`.
+
+    Every car gets BOOKINGS_PER_CAR back-to-back bookings, and every
+    booking a matching transaction. Returns the row count per table.
+    """
+    db = database.db
+    if db.is_postgres:
+        with db.cursor() as cursor:
+            cursor.execute(
+                f"TRUNCATE {', '.join(SEED_TABLES)} RESTART IDENTITY CASCADE")
+    cars = max(vendors, -(-bookings // BOOKINGS_PER_CAR))
+
+    _flush_rows(db, 'vendors', ('name', 'email', 'country', 'status'),
+                [(f"Vendor {v}", f"vendor{v}@bench.local", 'US', 'Active')
+                 for v in range(1, vendors + 1)])
+
+    car_vendor = [(car - 1) % vendors + 1 for car in range(1, cars + 1)]
+    rows = [
+        _car_row(db, car, car_vendor[car - 1], rng)
+        for car in range(1, cars + 1)
+    ]
+    _flush_rows(db, 'cars', CAR_COLUMNS, rows)
+
+    customers = cars * CUSTOMERS_PER_CAR
+    _flush_rows(db, 'customers', ('vendor_id', 'name', 'email', 'rating'),
+                [((c - 1) % vendors + 1, f"Customer {c}",
+                  f"customer{c}@bench.local", rng.randint(1, 5))
+                 for c in range(1, customers + 1)])
+
+    booking_rows = []
+    transaction_rows = []
+    for n in range(bookings):
+        car = n % cars + 1
+        start = FIRST_BOOKING_DATE + datetime.timedelta(days=(n // cars) *
+                                                        BOOKING_DAYS)
+        end = start + datetime.timedelta(days=BOOKING_DAYS)
+        cost = float(rng.randint(90, 450))
+        vendor_id = car_vendor[car - 1]
+        booking_rows.append(
+            (vendor_id, car, f"Customer {rng.randint(1, customers)}",
+             start.isoformat(), end.isoformat(), str(BOOKING_DAYS), cost,
+             f"BENCH-{n}", 'card', None))
+        transaction_rows.append(
+            (vendor_id, 'Rental', cost, f"Booking BENCH-{n}", cost * 0.2,
+             'card', start.isoformat()))
+        if len(booking_rows) >= SEED_BATCH_SIZE:
+            _flush_rows(db, 'bookings', BOOKING_COLUMNS, booking_rows)
+            _flush_rows(db, 'transactions', TRANSACTION_COLUMNS,
+                        transaction_rows)
+            booking_rows, transaction_rows = [], []
+    if booking_rows:
+        _flush_rows(db, 'bookings', BOOKING_COLUMNS, booking_rows)
+        _flush_rows(db, 'transactions', TRANSACTION_COLUMNS, transaction_rows)
+    # Rows went in behind the helpers' backs; catch the aggregates up
+    database.rebuild_dashboard_aggregates()
+    return table_counts(db)
+
+
+def table_counts(db):
+    counts = {}
+    with db.cursor() as cursor:
+        for table in SEED_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = cursor.fetchone()[0]
+    return counts
+
+
+def run_benchmark(name, kind, fn, iterations, max_seconds):
+    """Call fn() up to `iterations` times or until `max_seconds` pass."""
+    fn()  # warm caches and the connection pool
+    latencies = []
+    started = time.perf_counter()
+    deadline = started + max_seconds
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - call_started)
+        if call_started > deadline:
+            break
+    return summarize(name, kind, latencies, time.perf_counter() - started)
+
+
+class _NewBookings:
+    """Hands out fresh, non-overlapping booking rows past the seeded range.
+
+    With `step` > 1 only cars 1, 1 + step, ... are used, i.e. the cars of
+    vendor 1 when cars are dealt out round-robin to `step` vendors.
+    """
+
+    def __init__(self, cars, prefix, base, step=1):
+        self.cars = (cars + step - 1) // step
+        self.prefix = prefix
+        self.base = base
+        self.step = step
+        self.n = 0
+
+    def next(self):
+        n = self.n
+        self.n += 1
+        start = self.base + datetime.timedelta(days=(n // self.cars) *
+                                               BOOKING_DAYS)
+        end = start + datetime.timedelta(days=BOOKING_DAYS)
+        return (n % self.cars * self.step + 1, start.isoformat(),
+                end.isoformat(), f"{self.prefix}-{n}")
+
+
+def helper_benchmarks(database, vendors, cars, rng):
+    """(name, callable) pairs for the database.py helpers, reads first."""
+    vendor = lambda: rng.randint(1, vendors)
+    window = lambda: FIRST_BOOKING_DATE + datetime.timedelta(days=rng.randint(
+        0, BOOKINGS_PER_CAR * BOOKING_DAYS))
+    new_bookings = _NewBookings(cars, f"BENCH-H{int(time.time())}",
+                                datetime.date(2100, 1, 1))
+
+    def available_cars():
+        start = window()
+        database.get_available_cars(
+            vendor(),
+            start.isoformat(),
+            (start + datetime.timedelta(days=BOOKING_DAYS)).isoformat(),
+            limit=50)
+
+    def add_booking():
+        car_id, start, end, contract = new_bookings.next()
+        database.add_booking(
+            (car_id - 1) % vendors + 1, car_id, 'Bench', start, end,
+            str(BOOKING_DAYS), 100.0, contract, 'card', None)
+
+    return [
+        ('get_cars', lambda: database.get_cars(vendor())),
+        ('get_cars_page', lambda: database.get_cars_page(vendor(), limit=50)),
+        ('get_bookings', lambda: database.get_bookings(vendor())),
+        ('get_bookings_page',
+         lambda: database.get_bookings_page(vendor(), limit=50)),
+        ('get_available_cars', available_cars),
+        ('get_customers_page',
+         lambda: database.get_customers_page(vendor(), limit=50)),
+        ('get_transactions', lambda: database.get_transactions(vendor())),
+        ('get_dashboard_summary', lambda: database.get_dashboard_summary(
+            vendor(), FIRST_BOOKING_DATE, FIRST_BOOKING_DATE + datetime.
+            timedelta(days=90))),
+        ('add_booking', add_booking),
+    ]
+
+
+def route_benchmarks(client, vendors, cars):
+    """(name, callable) pairs for /api routes via the Flask test client.
+
+    The client is logged in as vendor 1, so writes and quotes use its cars.
+    """
+    new_bookings = _NewBookings(cars, f"BENCH-R{int(time.time())}",
+                                datetime.date(2200, 1, 1), vendors)
+
+    def get(path):
+
+        def call():
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+
+        return call
+
+    def post_booking():
+        car_id, start, end, contract = new_bookings.next()
+        response = client.post('/api/bookings',
+                               data={
+                                   'car_id': car_id,
+                                   'user_name': 'Bench',
+                                   'start_date': start,
+                                   'end_date': end,
+                                   'duration': BOOKING_DAYS,
+                                   'contract_number': contract,
+                                   'payment_type': 'card',
+                               })
+        assert response.status_code in (200, 409), response.status_code
+
+    availability = (
+        f"/api/availability?start_date={FIRST_BOOKING_DATE}"
+        f"&end_date={FIRST_BOOKING_DATE + datetime.timedelta(days=7)}"
+        "&limit=50")
+    quotes = (
+        f"/api/quotes?start_date={FIRST_BOOKING_DATE}"
+        f"&end_date={FIRST_BOOKING_DATE + datetime.timedelta(days=7)}"
+        "&car_ids=" +
+        ','.join(str(car_id) for car_id in range(1, 50 * vendors, vendors)))
+    return [
+        ('GET /api/cars', get('/api/cars?limit=50')),
+        ('GET /api/bookings', get('/api/bookings?limit=50')),
+        ('GET /api/availability', get(availability)),
+        ('GET /api/customers', get('/api/customers?limit=50')),
+        ('GET /api/dashboard/summary',
+         get(f"/api/dashboard/summary?start_date={FIRST_BOOKING_DATE}")),
+        ('GET /api/quotes (50 cars)', get(quotes)),
+        ('POST /api/bookings', post_booking),
+    ]
+
+
+def compare(results, baseline):
+    """Per-benchmark p50/p95 change against an earlier run, in percent."""
+    previous = {r['name']: r for r in baseline['results']}
+    changes = {}
+    for result in results:
+        before = previous.get(result['name'])
+        if before is None:
+            continue
+        changes[result['name']] = {
+            key:
+            round((result[key] - before[key]) / before[key] *
+                  100, 1) if before[key] else None
+            for key in ('p50_ms', 'p95_ms', 'ops_per_second')
+        }
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]))
+    parser.add_argument('--backend',
+                        choices=('sqlite', 'postgres'),
+                        default='sqlite')
+    parser.add_argument('--scale', choices=tuple(SCALES), default='small')
+    parser.add_argument('--vendors', type=int, default=10)
+    parser.add_argument('--db-file',
+                        default=os.path.join(tempfile.gettempdir(),
+                                             'rentmaster_bench.db'))
+    parser.add_argument('--reset',
+                        action='store_true',
+                        help="Allow seeding to truncate Postgres tables")
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--max-seconds',
+                        type=float,
+                        default=10.0,
+                        help="Time budget per benchmark")
+    parser.add_argument('--only',
+                        choices=('helpers', 'routes'),
+                        help="Run only one group of benchmarks")
+    parser.add_argument('--random-seed', type=int, default=1)
+    parser.add_argument('--output', help="Write JSON here instead of stdout")
+    parser.add_argument('--baseline',
+                        help="Earlier JSON output to compare against")
+    args = parser.parse_args()
+
+    if args.backend == 'sqlite':
+        os.environ.pop('DATABASE_URL', None)
+        if not args.skip_seed and os.path.exists(args.db_file):
+            os.remove(args.db_file)
+    elif not os.getenv('DATABASE_URL'):
+        parser.error("--backend postgres needs DATABASE_URL")
+    elif not args.skip_seed and not args.reset:
+        parser.error("seeding Postgres truncates tables; pass --reset")
+
+    rng = random.Random(args.random_seed)
+    import database
+    database.Database.db_file = args.db_file
+    try:
+        database.init_db()
+    except database.DatabaseUnavailable as e:
+        sys.exit(str(e))
+    db = database.db
+
+    seed_started = time.perf_counter()
+    if args.skip_seed:
+        counts = table_counts(db)
+    else:
+        counts = seed(database, SCALES[args.scale], args.vendors, rng)
+    seed_seconds = time.perf_counter() - seed_started
+    cars = counts['cars']
+
+    results = []
+    if args.only != 'routes':
+        for name, fn in helper_benchmarks(database, args.vendors, cars, rng):
+            results.append(
+                run_benchmark(name, 'helper', fn, args.iterations,
+                              args.max_seconds))
+    if args.only != 'helpers':
+        import main as web
+        client = web.app.test_client()
+        client.post('/api/login',
+                    data={
+                        'username': 'vendor1',
+                        'password': 'vendorpass'
+                    })
+        for name, fn in route_benchmarks(client, args.vendors, cars):
+            results.append(
+                run_benchmark(name, 'route', fn, args.iterations,
+                              args.max_seconds))
+
+    report = {
+        'meta': {
+            'backend': db.dialect.name,
+            'scale': args.scale,
+            'vendors': args.vendors,
+            'rows': counts,
+            'seed_seconds': round(seed_seconds, 2),
+            'iterations': args.iterations,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'started_at':
+            datetime.datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['vs_baseline'] = compare(results, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
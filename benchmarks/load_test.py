@@ -0,0 +1,100 @@
+"""Concurrent load test for the /api endpoints.
+
+Logs in once per worker thread and hammers one GET endpoint, then prints
+throughput and latency percentiles. Point it at the Flask server and the
+ASGI server in turn to compare the two:
+
+    gunicorn -w 4 main:app -b :5000
+    uvicorn asgi:app --workers 4 --port 8000
+    python benchmarks/load_test.py --url http://localhost:5000 --url http://localhost:8000
+"""
+import argparse
+import json
+import threading
+import time
+import http.cookiejar
+import urllib.parse
+import urllib.request
+
+
+def _percentile_ms(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return round(sorted_values[index] * 1000, 2)
+
+
+def _opener(base_url, username, password):
+    opener = urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    body = urllib.parse.urlencode({
+        'username': username,
+        'password': password
+    }).encode()
+    opener.open(f"{base_url}/api/login", data=body).read()
+    return opener
+
+
+def run(base_url, path, concurrency, duration, username, password):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        opener = _opener(base_url, username, password)
+        local = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                opener.open(f"{base_url}{path}").read()
+            except OSError:
+                failed += 1
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'url': base_url + path,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': _percentile_ms(latencies, 50),
+        'p95_ms': _percentile_ms(latencies, 95),
+        'p99_ms': _percentile_ms(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url',
+                        action='append',
+                        required=True,
+                        help="Server base URL; repeat to compare servers")
+    parser.add_argument('--path', default='/api/cars?limit=50')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--username', default='vendor1')
+    parser.add_argument('--password', default='vendorpass')
+    args = parser.parse_args()
+    for url in args.url:
+        result = run(url.rstrip('/'), args.path, args.concurrency,
+                     args.duration, args.username, args.password)
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark API response serialization on one large page of rows.
+
+Encodes the same {'status', 'data', 'next_cursor'} payload the /api
+routes return, built from rows shaped like a Postgres cars query (int,
+text, JSONB dict, Decimal, date, timestamp), and compares:
+
+    before            dict(row) per row, then Flask's default jsonify
+    stdlib            rows zipped with the columns, stdlib C encoder
+    orjson            rows zipped with the columns, orjson (if installed)
+
+    python benchmarks/serialize_bench.py --rows 10000 --output serialize.json
+"""
+import argparse
+import datetime
+import decimal
+import json
+import os
+import platform
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import serializers
+from bench import run_benchmark
+
+COLUMNS = ('id', 'vendor_id', 'name', 'rates', 'mileage', 'fuel_level', 'year',
+           'status', 'type', 'features', 'cost', 'available_from',
+           'updated_at')
+
+
+def make_rows(count, rng):
+    """Tuples as psycopg2 returns them for a cars-like SELECT."""
+    first_day = datetime.date(2024, 1, 1)
+    started = datetime.datetime(2024, 1, 1, 8, 0)
+    rows = []
+    for i in range(count):
+        rates = {
+            'daily': rng.randint(30, 150),
+            'weekly': rng.randint(180, 900)
+        }
+        rows.append(
+            (i, rng.randint(1, 10), f"Car {i}", rates, rng.randint(0, 200_000),
+             rng.randint(0, 100), rng.randint(2010, 2024),
+             rng.choice(('Available', 'Rented', 'Maintenance')),
+             rng.choice(('Sedan', 'SUV', 'Van')), ['GPS', 'Bluetooth'],
+             decimal.Decimal(rng.randint(3000, 45000)) / 100,
+             first_day + datetime.timedelta(days=i % 365),
+             started + datetime.timedelta(minutes=i)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]))
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--max-seconds', type=float, default=10.0)
+    parser.add_argument('--random-seed', type=int, default=1)
+    parser.add_argument('--output', help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, random.Random(args.random_seed))
+    # What a RealDictCursor hands back before the route copies each row
+    dict_rows = [dict(zip(COLUMNS, row)) for row in rows]
+    flask_json = DefaultJSONProvider(Flask(__name__))
+
+    def before():
+        data = [dict(row) for row in dict_rows]
+        flask_json.dumps({
+            'status': 'success',
+            'data': data,
+            'next_cursor': None
+        }).encode()
+
+    def zipped(serializer):
+
+        def encode():
+            # What _run_page builds from the cursor's tuples
+            data = [dict(zip(COLUMNS, row)) for row in rows]
+            serializer.dumps({
+                'status': 'success',
+                'data': data,
+                'next_cursor': None
+            })
+
+        return encode
+
+    cases = [('before', before),
+             ('stdlib', zipped(serializers.StdlibSerializer()))]
+    if serializers.orjson is not None:
+        cases.append(('orjson', zipped(serializers.OrjsonSerializer())))
+
+    results = [
+        run_benchmark(name, 'serialize', fn, args.iterations, args.max_seconds)
+        for name, fn in cases
+    ]
+    baseline = results[0]['p50_ms']
+    for result in results:
+        result['speedup_vs_before'] = round(baseline / result['p50_ms'], 2)
+
+    report = {
+        'meta': {
+            'rows': args.rows,
+            'iterations': args.iterations,
+            'python': platform.python_version(),
+            'orjson': getattr(serializers.orjson, '__version__', None),
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import csv
+import io
+import json
+import time
+import sqlite3
+import logging
+
+import psycopg2
+from psycopg2 import extras
+
+from database import (db, check_booking_overlap, record_car_status_changes,
+                      record_booking_revenue, BookingConflictError,
+                      fleet_state, change_feed, _record_changes, _notify_write)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+# Per-table import spec: required columns, optional columns and how to
+# coerce each raw value. vendor_id is never taken from the upload.
+IMPORT_SPECS = {
+    'cars': {
+        'required': ('name', 'rates'),
+        'optional': ('insurance', 'mileage', 'fuel_level', 'year', 'status',
+                     'type', 'features'),
+        'int': ('mileage', 'fuel_level', 'year'),
+        'float': (),
+        'json': ('rates', 'features'),
+    },
+    'customers': {
+        'required': ('name', ),
+        'optional': ('email', 'phone', 'id_number', 'license_number',
+                     'license_country', 'license_expiry', 'rating'),
+        'int': ('rating', ),
+        'float': (),
+        'json': (),
+    },
+    'bookings': {
+        'required': ('car_id', 'start_date', 'end_date'),
+        'optional': ('user_name', 'duration', 'cost', 'contract_number',
+                     'payment_type', 'account_id'),
+        'int': ('car_id', 'account_id'),
+        'float': ('cost', ),
+        'json': (),
+    },
+}
+
+_DB_ERRORS = (psycopg2.Error, sqlite3.Error, BookingConflictError)
+
+
+class ImportRowError(ValueError):
+    """A single uploaded row could not be parsed or validated."""
+
+
+def iter_csv(stream):
+    """Yield (line_number, row) pairs from a binary CSV stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_ndjson(stream):
+    """Yield (line_number, row) pairs from a binary NDJSON stream.
+
+    Lines that are not valid JSON objects are yielded as ImportRowError so
+    the importer can report them without stopping.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, ImportRowError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line_number, ImportRowError("Expected a JSON object")
+            continue
+        yield line_number, row
+
+
+class BulkImporter:
+    """Stream parsed rows into one table in batched, single-commit inserts.
+
+    Each batch goes in with one statement (execute_values on Postgres,
+    executemany on SQLite). If the batch fails, it is replayed row by row
+    under savepoints so the good rows still land and each bad row is
+    reported with its line number.
+    """
+
+    def __init__(self, table, vendor_id, batch_size=DEFAULT_BATCH_SIZE):
+        if table not in IMPORT_SPECS:
+            raise ValueError(f"Bulk import is not supported for {table}")
+        self.table = table
+        self.vendor_id = vendor_id
+        self.batch_size = batch_size
+        self.spec = IMPORT_SPECS[table]
+        self.columns = (
+            'vendor_id', ) + self.spec['required'] + self.spec['optional']
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def _coerce(self, row):
+        missing = [
+            c for c in self.spec['required'] if row.get(c) in (None, '')
+        ]
+        if missing:
+            raise ImportRowError(
+                f"Missing required column(s): {', '.join(missing)}")
+        values = [self.vendor_id]
+        for column in self.columns[1:]:
+            value = row.get(column)
+            if value == '':
+                value = None
+            if value is not None:
+                try:
+                    if column in self.spec['int']:
+                        value = int(value)
+                    elif column in self.spec['float']:
+                        value = float(value)
+                    elif column in self.spec['json']:
+                        if isinstance(value, str):
+                            value = json.loads(value)
+                        value = db.dialect.json(value)
+                except ValueError as e:
+                    raise ImportRowError(f"Invalid {column}: {e}") from e
+            values.append(value)
+        return tuple(values)
+
+    def _record_error(self, line_number, error):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': str(error)})
+
+    def _insert_sql(self):
+        return f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES "
+
+    def _insert_batch(self, cursor, values):
+        if db.is_postgres:
+            extras.execute_values(cursor.raw,
+                                  self._insert_sql() + "%s",
+                                  values,
+                                  page_size=len(values))
+        else:
+            placeholders = ", ".join(["%s"] * len(self.columns))
+            cursor.executemany(self._insert_sql() + f"({placeholders})",
+                               values)
+
+    @property
+    def _checks_overlap(self):
+        return self.table == 'bookings' and not db.is_postgres
+
+    def _insert_row(self, cursor, row_values):
+        if self._checks_overlap:
+            # car_id, start_date and end_date follow vendor_id in self.columns
+            car_id, start_date, end_date = row_values[1:4]
+            check_booking_overlap(cursor, car_id, start_date, end_date)
+        placeholders = ", ".join(["%s"] * len(self.columns))
+        cursor.execute(self._insert_sql() + f"({placeholders})", row_values)
+
+    def _record_aggregates(self, cursor, values):
+        """Keep the dashboard aggregates in step with the inserted rows."""
+        if self.table == 'cars':
+            status = self.columns.index('status')
+            record_car_status_changes(cursor,
+                                      [(v[0], v[status], 1) for v in values])
+        elif self.table == 'bookings':
+            start = self.columns.index('start_date')
+            cost = self.columns.index('cost')
+            record_booking_revenue(cursor,
+                                   [(v[0], v[start], v[cost]) for v in values])
+
+    def _begin(self, cursor):
+        if not db.is_postgres:
+            cursor.execute("BEGIN IMMEDIATE")
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        values = [v for _, v in batch]
+        # SQLite bookings need the overlap check per row, which the row
+        # path does inside the same write transaction.
+        if not self._checks_overlap:
+            try:
+                with db.cursor() as cursor:
+                    self._begin(cursor)
+                    self._insert_batch(cursor, values)
+                    self._record_aggregates(cursor, values)
+                self.inserted += len(batch)
+                return
+            except _DB_ERRORS as e:
+                logger.info(
+                    "Batch insert into %s failed (%s); retrying row by row",
+                    self.table, e)
+        inserted = []
+        with db.cursor() as cursor:
+            self._begin(cursor)
+            for line_number, row_values in batch:
+                cursor.execute("SAVEPOINT bulk_row")
+                try:
+                    self._insert_row(cursor, row_values)
+                except _DB_ERRORS as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT bulk_row")
+                    self._record_error(line_number, e)
+                else:
+                    inserted.append(row_values)
+                cursor.execute("RELEASE SAVEPOINT bulk_row")
+            self._record_aggregates(cursor, inserted)
+        self.inserted += len(inserted)
+
+    def run(self, rows):
+        """Import (line_number, row) pairs and return a summary report."""
+        started = time.perf_counter()
+        batch = []
+        for line_number, row in rows:
+            self.received += 1
+            if isinstance(row, Exception):
+                self._record_error(line_number, row)
+                continue
+            try:
+                batch.append((line_number, self._coerce(row)))
+            except ImportRowError as e:
+                self._record_error(line_number, e)
+                continue
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        self._flush(batch)
+        if self.inserted:
+            if self.table in ('cars', 'bookings'):
+                fleet_state.invalidate(self.vendor_id)
+            with db.cursor() as cursor:
+                changes = _record_changes(cursor, 'reload', self.table,
+                                          self.vendor_id, [None])
+            change_feed.publish(changes)
+            _notify_write(self.table, self.vendor_id)
+        elapsed = time.perf_counter() - started
+        return {
+            'table':
+            self.table,
+            'received':
+            self.received,
+            'inserted':
+            self.inserted,
+            'failed':
+            self.failed,
+            'errors':
+            self.errors,
+            'elapsed_seconds':
+            round(elapsed, 3),
+            'rows_per_second':
+            round(self.inserted / elapsed, 1) if elapsed else None,
+        }
@@ -0,0 +1,276 @@
+import os
+import json
+import random
+import select
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CHANGE_OPS = ('insert', 'update', 'delete', 'reload')
+
+# Events per NOTIFY; Postgres caps a payload at 8000 bytes
+_NOTIFY_CHUNK = 100
+
+
+def change_event(op, table, vendor_id, row_id=None):
+    """A change event. `reload` (row_id None) means many rows of `table`
+    changed at once, e.g. a bulk import, and clients should re-fetch it."""
+    if op not in CHANGE_OPS:
+        raise ValueError(f"Unknown change op: {op}")
+    return {'op': op, 'table': table, 'vendor_id': vendor_id, 'id': row_id}
+
+
+class Subscription:
+    """Events for one client, read with get(); see ChangeFeed.subscribe."""
+
+    def __init__(self, feed, vendor_id, tables, max_queued):
+        self._feed = feed
+        self.vendor_id = vendor_id
+        self.tables = tables
+        self.max_queued = max_queued
+        self._cond = threading.Condition(threading.Lock())
+        self._queue = deque()
+        self.closed = False
+
+    def wants(self, event):
+        if event['op'] == 'reset':
+            return True
+        if self.tables is not None and event['table'] not in self.tables:
+            return False
+        return (self.vendor_id is None
+                or event['vendor_id'] in (None, self.vendor_id))
+
+    def _put(self, events):
+        with self._cond:
+            if len(self._queue) + len(events) > self.max_queued:
+                # Too slow to keep up; tell it to start over instead
+                self._queue.clear()
+                self._queue.append(self._feed.reset_event())
+            else:
+                self._queue.extend(events)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Wait up to `timeout` seconds; return the queued events, or []."""
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            events = list(self._queue)
+            self._queue.clear()
+            return events
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+        self._feed._unsubscribe(self)
+
+
+class ChangeFeed:
+    """In-process broker of row-level change events.
+
+    `publish(events)` numbers events and hands each to the subscriptions
+    that want it: those of its vendor, or of every vendor (None). Events
+    of no vendor in particular go to everyone. The last `backlog` events
+    are kept so a client that reconnects with the id of the last event
+    it saw gets what it missed. When they are gone, or the id comes from
+    another process, it gets a `reset` event and must re-fetch instead.
+
+    Event ids carry this process's `origin`, which also marks its own
+    NOTIFYs so ChangeRelay does not publish them twice.
+    """
+
+    def __init__(self, backlog=1000, max_queued=1000, max_subscribers=1000):
+        self.max_queued = max_queued
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._backlog = deque(maxlen=backlog)
+        self._subscribers = set()
+        self._seq = 0
+        self._token = os.urandom(4).hex()
+        self.published = 0
+        self.resets = 0
+
+    @property
+    def origin(self):
+        # Workers forked after import share the token, not the pid
+        return f"{self._token}.{os.getpid()}"
+
+    def _event_id(self, seq):
+        return f"{self.origin}:{seq}"
+
+    def reset_event(self):
+        with self._lock:
+            self.resets += 1
+            return {'op': 'reset', 'event_id': self._event_id(self._seq)}
+
+    def publish(self, events):
+        if not events:
+            return
+        with self._lock:
+            numbered = []
+            for event in events:
+                self._seq += 1
+                event = dict(event, event_id=self._event_id(self._seq))
+                self._backlog.append((self._seq, event))
+                numbered.append(event)
+            subscribers = list(self._subscribers)
+            self.published += len(numbered)
+        for subscription in subscribers:
+            wanted = [e for e in numbered if subscription.wants(e)]
+            if wanted:
+                subscription._put(wanted)
+
+    def subscribe(self, vendor_id, last_event_id=None, tables=None):
+        """Return a Subscription to `vendor_id`'s events (None: all).
+
+        `tables` limits it to those tables. With `last_event_id` the
+        events published after that one are queued first. Raises
+        OverflowError when `max_subscribers` are connected.
+        """
+        subscription = Subscription(self, vendor_id,
+                                    None if tables is None else set(tables),
+                                    self.max_queued)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise OverflowError(
+                    f"Change feed has {self.max_subscribers} subscribers")
+            self._subscribers.add(subscription)
+            missed = (None if last_event_id is None else
+                      self._missed(last_event_id))
+        if missed is None and last_event_id is not None:
+            subscription._put([self.reset_event()])
+        elif missed:
+            subscription._put([e for e in missed if subscription.wants(e)])
+        return subscription
+
+    def _missed(self, last_event_id):
+        """Backlog events after `last_event_id`, or None if unknown."""
+        origin, _, seq = last_event_id.rpartition(':')
+        if origin != self.origin or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self._seq:
+            return None
+        if seq < self._seq and (not self._backlog
+                                or self._backlog[0][0] > seq + 1):
+            return None
+        return [event for n, event in self._backlog if n > seq]
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    # NOTIFY payloads
+
+    def notify_payloads(self, events):
+        """JSON payloads announcing `events` to other processes."""
+        for i in range(0, len(events), _NOTIFY_CHUNK):
+            chunk = events[i:i + _NOTIFY_CHUNK]
+            yield json.dumps(
+                {
+                    'origin':
+                    self.origin,
+                    'events': [[e['op'], e['table'], e['vendor_id'], e['id']]
+                               for e in chunk]
+                },
+                separators=(',', ':'))
+
+    def publish_payload(self, payload):
+        """Publish the events of another process's NOTIFY payload."""
+        message = json.loads(payload)
+        if message.get('origin') == self.origin:
+            return
+        self.publish([change_event(*event) for event in message['events']])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self.published,
+                'resets': self.resets,
+                'backlog': len(self._backlog),
+            }
+
+
+class ChangeRelay:
+    """Publishes other processes' NOTIFYs on `channel` into a ChangeFeed.
+
+    `connect()` returns a new psycopg2 connection, used only to LISTEN.
+    The thread reconnects with backoff when it drops; events sent while
+    it was down are lost, so subscribers get a `reset` then.
+    """
+
+    def __init__(self,
+                 connect,
+                 feed,
+                 channel,
+                 poll_interval=5.0,
+                 max_retry_delay=30.0):
+        self._connect = connect
+        self.feed = feed
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.max_retry_delay = max_retry_delay
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.connected = False
+        self.received = 0
+
+    def start(self):
+        """Start listening; called by the first subscription, safe to
+        call more than once."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run,
+                                            name='change-relay',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        delay = 1.0
+        listened = False
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.channel}")
+                self.connected = True
+                if listened:
+                    logger.info("Change feed relay reconnected")
+                    self.feed.publish([{'op': 'reset'}])
+                listened = True
+                delay = 1.0
+                self._listen(conn)
+            except Exception as e:
+                logger.error("Change feed relay failed: %s", e)
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if not select.select([conn], [], [], self.poll_interval)[0]:
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self.received += 1
+                try:
+                    self.feed.publish_payload(notify.payload)
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning("Ignoring malformed change notify: %s", e)
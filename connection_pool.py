@@ -0,0 +1,230 @@
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class PoolClosed(Exception):
+    """Raised when checking out from a pool that has been closed."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections.
+
+    `connect` is a zero-argument factory returning a new connection and
+    `is_alive` (optional) is called on checkout to decide whether an idle
+    connection can be handed out again. Connections that fail the check are
+    discarded and replaced transparently. `on_checkout` (optional) is called
+    with the seconds each successful checkout spent waiting. With
+    `thread_affinity`, a thread gets back the idle connection it last
+    released when there is one, so per-connection caches stay warm.
+    """
+
+    def __init__(self,
+                 connect,
+                 min_size=1,
+                 max_size=10,
+                 timeout=30.0,
+                 is_alive=None,
+                 health_check_interval=30.0,
+                 reset=None,
+                 on_checkout=None,
+                 thread_affinity=False):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(
+                f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self._connect = connect
+        self._is_alive = is_alive
+        self._reset = reset
+        self._on_checkout = on_checkout
+        self._thread_affinity = thread_affinity
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Condition(threading.Lock())
+        # (connection, last_used, releasing thread id) triples, LIFO
+        self._idle = deque()
+        self._in_use = set()
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+        for _ in range(min_size):
+            self._idle.append((self._open(), time.monotonic(), None))
+
+    def _open(self):
+        conn = self._connect()
+        with self._lock:
+            self._size += 1
+        return conn
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug("Error closing pooled connection: %s", e)
+
+    def _healthy(self, conn, last_used):
+        if self._is_alive is None:
+            return True
+        if time.monotonic() - last_used < self.health_check_interval:
+            return self._is_alive(conn, full=False)
+        return self._is_alive(conn, full=True)
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            conn = None
+            last_used = None
+            create = False
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise PoolClosed("Connection pool is closed")
+                    if self._idle:
+                        conn, last_used = self._pop_idle()
+                        break
+                    if self._size < self.max_size:
+                        # Reserve the slot now, open outside the lock
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"Timed out after {timeout:.1f}s waiting for a "
+                            f"connection ({self._size} in use)")
+                    self._waiting += 1
+                    try:
+                        self._lock.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._healthy(conn, last_used):
+                logger.warning("Discarding unhealthy pooled connection")
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._lock:
+                self._in_use.add(conn)
+                self._checkouts += 1
+                self._total_wait += waited
+                if waited > self._max_wait:
+                    self._max_wait = waited
+            if self._on_checkout is not None:
+                self._on_checkout(waited)
+            return conn
+
+    def _pop_idle(self):
+        if self._thread_affinity:
+            thread_id = threading.get_ident()
+            for index in range(len(self._idle) - 1, -1, -1):
+                if self._idle[index][2] == thread_id:
+                    conn, last_used, _ = self._idle[index]
+                    del self._idle[index]
+                    return conn, last_used
+        conn, last_used, _ = self._idle.pop()
+        return conn, last_used
+
+    def release(self, conn, discard=False):
+        with self._lock:
+            if conn not in self._in_use:
+                return
+            self._in_use.discard(conn)
+        if not discard and self._reset is not None:
+            try:
+                self._reset(conn)
+            except Exception as e:
+                logger.warning("Resetting pooled connection failed: %s", e)
+                discard = True
+        if discard or self._closed:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic(), threading.get_ident()))
+            self._lock.notify()
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._lock:
+            self._size -= 1
+            self._discarded += 1
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, discard=not self._is_usable(conn))
+            raise
+        else:
+            self.release(conn)
+
+    def _is_usable(self, conn):
+        if self._is_alive is None:
+            return True
+        try:
+            return self._is_alive(conn, full=False)
+        except Exception:
+            return False
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = [conn for conn, _, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def stats(self):
+        with self._lock:
+            checkouts = self._checkouts
+            avg_wait = self._total_wait / checkouts if checkouts else 0.0
+            return {
+                'size': self._size,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': checkouts,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'avg_wait_ms': avg_wait * 1000,
+                'max_wait_ms': self._max_wait * 1000,
+            }
@@ -0,0 +1,162 @@
+import re
+import logging
+
+from database import (db, CUSTOMER_SEARCH_TEXT, DB_ERRORS, encode_cursor,
+                      decode_cursor, _tenant_filter)
+
+logger = logging.getLogger(__name__)
+
+# Trigram indexes cannot narrow anything shorter
+MIN_QUERY_LENGTH = 3
+
+# Fraction of the query's trigrams a fuzzy match must share with the
+# customer's name, phone, email or license number
+FUZZY_THRESHOLD = 0.4
+
+# SQLite: best-ranked FTS5 trigram matches re-scored per fuzzy search
+FUZZY_CANDIDATES = 500
+
+# SQLite: trigrams found in more customers than this (the 'lic' of every
+# license number, '555' of every phone) are left out of fuzzy candidate
+# queries; they match nearly everything and make bm25 rank the table
+FUZZY_COMMON_TRIGRAM_DOCS = 20000
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def _trigrams(text):
+    """Trigrams of each alphanumeric word, padded like pg_trgm's."""
+    trigrams = set()
+    for word in _WORD.findall(text):
+        word = f"  {word} "
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def _like_prefix(term):
+    escaped = term.replace('\\', '\\\\').replace('%',
+                                                 '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+def _filters(vendor_id, blacklisted):
+    conditions, params = _tenant_filter('c.vendor_id', vendor_id)
+    if blacklisted is not None:
+        conditions.append("c.blacklisted = %s")
+        params.append(blacklisted)
+    return conditions, params
+
+
+def _search_postgres(term, vendor_id, blacklisted, limit, offset):
+    conditions, params = _filters(vendor_id, blacklisted)
+    prefix = _like_prefix(term)
+    conditions.append(
+        f"({CUSTOMER_SEARCH_TEXT} LIKE %s OR %s <%% {CUSTOMER_SEARCH_TEXT})")
+    params += ['%' + prefix, term]
+    query = f"""SELECT c.*, word_similarity(%s, {CUSTOMER_SEARCH_TEXT}) AS score,
+        (lower(c.name) LIKE %s OR lower(c.license_number) LIKE %s) AS prefix_match
+        FROM customers c WHERE {' AND '.join(conditions)}
+        ORDER BY prefix_match DESC, score DESC, c.id LIMIT %s OFFSET %s"""
+    with db.cursor(dict_rows=True) as cursor:
+        cursor.execute("SET LOCAL pg_trgm.word_similarity_threshold = %s",
+                       (FUZZY_THRESHOLD, ))
+        cursor.execute(query,
+                       [term, prefix, prefix] + params + [limit + 1, offset])
+        rows = [dict(r) for r in cursor.fetchall()]
+    for row in rows:
+        del row['prefix_match']
+        row['score'] = round(row['score'], 3)
+    return rows
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _fuzzy_candidates(cursor, where, params, term):
+    """Best bm25 matches for any of the term's selective FTS trigrams."""
+    fts_trigrams = sorted({term[i:i + 3] for i in range(len(term) - 2)})
+    cursor.execute(
+        "SELECT term, doc FROM customers_search_vocab WHERE term IN (%s)" %
+        ', '.join(['%s'] * len(fts_trigrams)), fts_trigrams)
+    selective = [
+        row['term'] for row in cursor.fetchall()
+        if row['doc'] <= FUZZY_COMMON_TRIGRAM_DOCS
+    ]
+    if not selective:
+        return []
+    cursor.execute(
+        f"""SELECT c.* FROM customers_search JOIN customers c ON c.id = customers_search.rowid
+        WHERE {where} ORDER BY bm25(customers_search) LIMIT %s""",
+        params + [' OR '.join(map(_fts_phrase, selective)), FUZZY_CANDIDATES])
+    return cursor.fetchall()
+
+
+def _search_sqlite(term, vendor_id, blacklisted, limit, offset):
+    """Substring matches first, then fuzzy ones if the page is not full.
+
+    The substring pass is a single FTS5 phrase query. Only when it runs
+    out is the fuzzier OR of the term's selective trigrams run, and its
+    best candidates are scored here like pg_trgm's word_similarity.
+    """
+    conditions, params = _filters(vendor_id, blacklisted)
+    conditions.append("customers_search MATCH %s")
+    where = ' AND '.join(conditions)
+    prefix = _like_prefix(term)
+    wanted = offset + limit + 1
+    with db.cursor(dict_rows=True) as cursor:
+        cursor.execute(
+            f"""SELECT c.* FROM customers_search JOIN customers c ON c.id = customers_search.rowid
+            WHERE {where}
+            ORDER BY (lower(c.name) LIKE %s ESCAPE '\\' OR lower(c.license_number) LIKE %s ESCAPE '\\') DESC,
+            bm25(customers_search), c.id LIMIT %s""",
+            params + [_fts_phrase(term), prefix, prefix, wanted])
+        rows = [dict(r, score=1.0) for r in cursor.fetchall()]
+        if len(rows) < wanted:
+            query_trigrams = _trigrams(term)
+            candidates = _fuzzy_candidates(cursor, where, params, term)
+            seen = {row['id'] for row in rows}
+            fuzzy = []
+            for candidate in candidates:
+                if candidate['id'] in seen:
+                    continue
+                text = ' '.join(candidate[column] or ''
+                                for column in ('name', 'phone', 'email',
+                                               'license_number')).lower()
+                score = len(query_trigrams
+                            & _trigrams(text)) / len(query_trigrams)
+                if score >= FUZZY_THRESHOLD:
+                    fuzzy.append(dict(candidate, score=round(score, 3)))
+            fuzzy.sort(key=lambda row: (-row['score'], row['id']))
+            rows += fuzzy
+    return rows[offset:offset + limit + 1]
+
+
+def search_customers(vendor_id, query, limit=20, after=None, blacklisted=None):
+    """Ranked customer matches on name, phone, email or license number.
+
+    Customers whose name or license number starts with `query` come
+    first, then other substring matches, then typo-tolerant matches that
+    share enough trigrams with it. `blacklisted` (True/False) filters on
+    the flag. Each row carries a `score` from 0 to 1. Returns (rows,
+    next_cursor) like the page helpers, ([], None) on a database error,
+    and raises ValueError for a query shorter than MIN_QUERY_LENGTH or a
+    bad cursor.
+    """
+    term = ' '.join((query or '').lower().split())
+    if len(term) < MIN_QUERY_LENGTH:
+        raise ValueError(
+            f"Search query must be at least {MIN_QUERY_LENGTH} characters")
+    offset = decode_cursor(after) if after else 0
+    try:
+        if db.is_postgres:
+            rows = _search_postgres(term, vendor_id, blacklisted, limit,
+                                    offset)
+        else:
+            rows = _search_sqlite(term, vendor_id, blacklisted, limit, offset)
+    except DB_ERRORS as e:
+        logger.error("Error searching customers: %s", e)
+        return [], None
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(offset + limit)
+    return rows, None
@@ -1,98 +1,613 @@
 import psycopg2
+from psycopg2 import errors as pg_errors
 from psycopg2 import extras
 import sqlite3
+import json
 import os
+import uuid
+import atexit
 import time
+import random
 import logging
+import threading
+import re
+import base64
+import datetime
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from connection_pool import ConnectionPool
+from dialect import POSTGRES, SQLITE, DialectCursor
+from translation_cache import TranslationCatalog
+from permissions import PermissionResolver
+from instrumentation import QueryMetrics
+from report_cache import ReportCache
+from pricing import PricingError, RateCache, rental_days
+from ledger import LedgerWriter
+from prepared import PreparedStatements
+from fleet_state import FleetState
+from change_feed import ChangeFeed, ChangeRelay, change_event
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-print("Debug: File database.py is loading")
+# Per-helper query timings served at /metrics. Statements slower than
+# SLOW_QUERY_MS are logged; QUERY_METRICS=0 switches the cursor hook off.
+query_metrics = QueryMetrics(
+    slow_query_ms=float(os.getenv('SLOW_QUERY_MS', '200')))
+_observe_queries = os.getenv('QUERY_METRICS',
+                             '1').lower() not in ('0', 'false', 'no')
+
+# The fixed CRUD statements, PREPAREd once per Postgres connection and
+# run with EXECUTE. PREPARED_STATEMENTS=0 for poolers in transaction mode.
+prepared_statements = PreparedStatements(
+    enabled=os.getenv('PREPARED_STATEMENTS', '1').lower() not in ('0', 'false',
+                                                                  'no'))
+
+
+def _pool_settings():
+    return dict(min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+                max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+                health_check_interval=float(
+                    os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30')),
+                on_checkout=query_metrics.on_checkout)
+
+
+def _postgres_alive(conn, full=False):
+    if conn.closed:
+        return False
+    if not full:
+        return True
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _postgres_reset(conn):
+    if conn.closed:
+        raise psycopg2.InterfaceError("connection already closed")
+    status = conn.get_transaction_status()
+    if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+
+
+def _sqlite_alive(conn, full=False):
+    if not full:
+        return True
+    try:
+        conn.execute("SELECT 1")
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _sqlite_reset(conn):
+    if conn.in_transaction:
+        conn.rollback()
+
+
+_SQLITE_JOURNAL_MODES = ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY')
+_SQLITE_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def _sqlite_settings():
+    settings = dict(
+        journal_mode=os.getenv('SQLITE_JOURNAL_MODE', 'WAL').upper(),
+        synchronous=os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper(),
+        busy_timeout_ms=int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        cache_size_kb=int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536')),
+        mmap_size=int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))))
+    if settings['journal_mode'] not in _SQLITE_JOURNAL_MODES:
+        raise ValueError(
+            f"Unsupported SQLITE_JOURNAL_MODE {settings['journal_mode']!r}")
+    if settings['synchronous'] not in _SQLITE_SYNCHRONOUS:
+        raise ValueError(
+            f"Unsupported SQLITE_SYNCHRONOUS {settings['synchronous']!r}")
+    return settings
+
+
+_SQLITE_WRITE = re.compile(
+    r"\s*(?:INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER|BEGIN\s+IMMEDIATE"
+    r"|BEGIN\s+EXCLUSIVE)\b", re.IGNORECASE)
+
+
+class _SQLiteWriteGate:
+    """sqlite3 cursor that takes the process's writer lock before its
+    first write, holding it until Database.cursor commits.
+
+    SQLite has one writer per file. Queueing this process's writers on a
+    lock, then opening each write transaction with BEGIN IMMEDIATE, stops
+    them busy-waiting on the file lock and means no read transaction is
+    ever upgraded. WAL readers are not blocked meanwhile. Writers in other
+    processes still meet on the file lock, bounded by busy_timeout.
+    """
+
+    __slots__ = ('_cursor', '_lock', '_timeout', 'holds_lock')
+
+    def __init__(self, cursor, lock, timeout):
+        self._cursor = cursor
+        self._lock = lock
+        self._timeout = timeout
+        self.holds_lock = False
+
+    def _before(self, sql):
+        if self.holds_lock or not _SQLITE_WRITE.match(sql):
+            return
+        if not self._lock.acquire(timeout=self._timeout):
+            raise sqlite3.OperationalError(
+                "database is locked (timed out waiting for the writer lock)")
+        self.holds_lock = True
+        if (not self._cursor.connection.in_transaction
+                and not sql.lstrip().upper().startswith('BEGIN')):
+            self._cursor.execute("BEGIN IMMEDIATE")
+
+    def execute(self, sql, *params):
+        self._before(sql)
+        return self._cursor.execute(sql, *params)
+
+    def executemany(self, sql, seq_of_params):
+        self._before(sql)
+        return self._cursor.executemany(sql, seq_of_params)
+
+    def release(self):
+        if self.holds_lock:
+            self.holds_lock = False
+            self._lock.release()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# Schema changes applied on top of the CREATE TABLE baseline, in order.
+# Each migration runs once per database inside its own transaction and is
+# recorded in schema_migrations.
+Migration = namedtuple('Migration', 'version description postgres sqlite')
+
+_TENANT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_bookings_vendor_start ON bookings (vendor_id, start_date)",
+    "CREATE INDEX IF NOT EXISTS idx_bookings_car_dates ON bookings (car_id, start_date, end_date)",
+    "CREATE INDEX IF NOT EXISTS idx_cars_vendor_status ON cars (vendor_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_customers_vendor ON customers (vendor_id)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_tenant_date ON transactions (tenant_id, date)",
+    "CREATE INDEX IF NOT EXISTS idx_translations_lang_key ON translations (lang_code, key)",
+]
+
+# Half-open [start_date, end_date) ranges: a car returned on a date can be
+# picked up again the same day. The exclusion constraint's GiST index also
+# serves the availability search.
+_BOOKING_OVERLAP_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    """ALTER TABLE bookings ADD CONSTRAINT bookings_no_overlap
+       EXCLUDE USING gist (car_id WITH =, daterange(start_date, end_date, '[)') WITH &&)
+       WHERE (car_id IS NOT NULL AND start_date IS NOT NULL AND end_date IS NOT NULL)""",
+]
+
+# check_permission has always joined against users; create it
+_USERS_POSTGRES = [
+    """CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        tenant_id INTEGER,
+        username TEXT UNIQUE NOT NULL,
+        role_id INTEGER REFERENCES roles(id)
+    )""",
+]
+_USERS_SQLITE = [
+    """CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tenant_id INTEGER,
+        username TEXT UNIQUE NOT NULL,
+        role_id INTEGER
+    )""",
+]
+
+# Per-vendor aggregates behind /api/dashboard/summary. The write helpers
+# keep them current in the same transaction as the row they change; the
+# migration backfills them from the existing rows. Bookings count towards
+# the day they start, transactions towards the day they were recorded.
+_DASHBOARD_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS vendor_car_status_counts (
+    vendor_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    cars INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (vendor_id, status)
+);
+CREATE TABLE IF NOT EXISTS vendor_daily_revenue (
+    vendor_id INTEGER NOT NULL,
+    day {day_type} NOT NULL,
+    bookings INTEGER NOT NULL DEFAULT 0,
+    booking_revenue {amount_type} NOT NULL DEFAULT 0,
+    transactions INTEGER NOT NULL DEFAULT 0,
+    transaction_amount {amount_type} NOT NULL DEFAULT 0,
+    vat_amount {amount_type} NOT NULL DEFAULT 0,
+    PRIMARY KEY (vendor_id, day)
+)'''
+_DASHBOARD_BACKFILL = '''
+INSERT INTO vendor_car_status_counts (vendor_id, status, cars)
+    SELECT vendor_id, COALESCE(status, 'Unknown'), COUNT(*) FROM cars
+    WHERE vendor_id IS NOT NULL GROUP BY 1, 2;
+INSERT INTO vendor_daily_revenue (vendor_id, day, bookings, booking_revenue)
+    SELECT vendor_id, {booking_day}, COUNT(*), COALESCE(SUM(cost), 0)
+    FROM bookings WHERE vendor_id IS NOT NULL AND {booking_day} IS NOT NULL
+    GROUP BY 1, 2;
+INSERT INTO vendor_daily_revenue
+    (vendor_id, day, transactions, transaction_amount, vat_amount)
+    SELECT tenant_id, {transaction_day}, COUNT(*), SUM(amount),
+           COALESCE(SUM(vat_amount), 0)
+    FROM transactions
+    WHERE tenant_id IS NOT NULL AND {transaction_day} IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (vendor_id, day) DO UPDATE SET
+        transactions = excluded.transactions,
+        transaction_amount = excluded.transaction_amount,
+        vat_amount = excluded.vat_amount'''
+_DASHBOARD_POSTGRES = dict(day_type='DATE',
+                           amount_type='DOUBLE PRECISION',
+                           booking_day='start_date',
+                           transaction_day='date::date')
+_DASHBOARD_SQLITE = dict(day_type='TEXT',
+                         amount_type='REAL',
+                         booking_day='date(start_date)',
+                         transaction_day='date(date)')
+
+
+def _dashboard_statements(backend, *templates):
+    return [
+        statement for template in templates
+        for statement in template.format(**backend).split(';')
+    ]
+
+
+# Customer search (customer_search.py). Postgres gets a trigram GIN index
+# over one expression joining the searchable columns, which serves both
+# substring (LIKE) and fuzzy (<%) matches; queries must use the same
+# expression. SQLite gets an FTS5 trigram index (SQLite 3.34+) kept in
+# step with customers by triggers.
+CUSTOMER_SEARCH_TEXT = (
+    "lower(coalesce(name, '') || ' ' || coalesce(phone, '')"
+    " || ' ' || coalesce(email, '') || ' ' ||"
+    " coalesce(license_number, ''))")
+_CUSTOMER_SEARCH_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS idx_customers_search_trgm ON customers USING gin (({CUSTOMER_SEARCH_TEXT}) gin_trgm_ops)",
+]
+_CUSTOMER_SEARCH_SQLITE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS customers_search USING fts5(
+        name, phone, email, license_number,
+        content='customers', content_rowid='id', tokenize='trigram')""",
+    # Documents per trigram, so fuzzy search can skip near-universal ones
+    "CREATE VIRTUAL TABLE IF NOT EXISTS customers_search_vocab USING fts5vocab(customers_search, 'row')",
+    """CREATE TRIGGER IF NOT EXISTS customers_search_insert AFTER INSERT ON customers BEGIN
+        INSERT INTO customers_search (rowid, name, phone, email, license_number)
+        VALUES (new.id, new.name, new.phone, new.email, new.license_number);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customers_search_delete AFTER DELETE ON customers BEGIN
+        INSERT INTO customers_search (customers_search, rowid, name, phone, email, license_number)
+        VALUES ('delete', old.id, old.name, old.phone, old.email, old.license_number);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customers_search_update
+    AFTER UPDATE OF name, phone, email, license_number ON customers BEGIN
+        INSERT INTO customers_search (customers_search, rowid, name, phone, email, license_number)
+        VALUES ('delete', old.id, old.name, old.phone, old.email, old.license_number);
+        INSERT INTO customers_search (rowid, name, phone, email, license_number)
+        VALUES (new.id, new.name, new.phone, new.email, new.license_number);
+    END""",
+    "INSERT INTO customers_search (customers_search) VALUES ('rebuild')",
+]
+
+# Ledger entries (ledger.py) carry a client-side id, so a spool replayed
+# after a crash cannot insert a transaction twice
+_TRANSACTION_LEDGER_ID = [
+    "ALTER TABLE transactions ADD COLUMN ledger_id TEXT",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_ledger_id ON transactions (ledger_id)",
+]
+
+MIGRATIONS = [
+    Migration(1, 'tenant-scoped indexes', _TENANT_INDEXES, _TENANT_INDEXES),
+    # SQLite checks overlaps in add_booking against idx_bookings_car_dates
+    Migration(2, 'booking overlap exclusion', _BOOKING_OVERLAP_POSTGRES, []),
+    Migration(3, 'users table', _USERS_POSTGRES, _USERS_SQLITE),
+    Migration(
+        4, 'vendor dashboard aggregates',
+        _dashboard_statements(_DASHBOARD_POSTGRES, _DASHBOARD_SCHEMA,
+                              _DASHBOARD_BACKFILL),
+        _dashboard_statements(_DASHBOARD_SQLITE, _DASHBOARD_SCHEMA,
+                              _DASHBOARD_BACKFILL)),
+    Migration(5, 'customer search indexes', _CUSTOMER_SEARCH_POSTGRES,
+              _CUSTOMER_SEARCH_SQLITE),
+    Migration(6, 'transaction ledger ids', _TRANSACTION_LEDGER_ID,
+              _TRANSACTION_LEDGER_ID),
+]
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent workers migrate once
+_MIGRATION_LOCK_KEY = 7_240_113
+
+
+class BookingConflictError(Exception):
+    """Raised when a booking overlaps an existing booking of the same car."""
+
+
+class DatabaseUnavailable(Exception):
+    """Raised while DATABASE_URL is set but PostgreSQL cannot be reached."""
+
+
+# Errors a helper logs and turns into its empty result. DatabaseUnavailable
+# is not one of them, so an outage reaches the callers' 503 handlers.
+DB_ERRORS = (psycopg2.Error, sqlite3.Error)
+
+
+def _reconnect_settings():
+    return dict(connect_timeout=int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+                min_delay=float(os.getenv('DB_RECONNECT_MIN_DELAY', '0.5')),
+                max_delay=float(os.getenv('DB_RECONNECT_MAX_DELAY', '30')))
 
 
 class Database:
-    _instance = None
-    is_postgres = False  # Default value, will be set by initialize
-    db_file = 'rentmaster.db'  # File-based SQLite fallback
+    """Connection pool for the configured backend, opened on first use.
+
+    With DATABASE_URL set the backend is PostgreSQL and only PostgreSQL:
+    if it cannot be reached, callers get DatabaseUnavailable straight
+    away while one background thread retries with exponential backoff.
+    Without DATABASE_URL the SQLite file `db_file` is used. Tables and
+    migrations are not created here; run `python database.py migrate`.
+    """
+    pool = None
+    dialect = SQLITE
+    is_postgres = False  # Set from DATABASE_URL by configure
+    db_file = 'rentmaster.db'  # Used when DATABASE_URL is not set
+    available = True
+    last_error = None
+    _lock = threading.RLock()
+    _reconnect_thread = None
+    # One writing transaction at a time per process on SQLite, waited for
+    # as long as busy_timeout
+    _sqlite_writer = threading.Lock()
+    _sqlite_write_timeout = 5.0
+
+    @classmethod
+    def configure(cls):
+        """Pick the backend from the environment without connecting."""
+        cls.is_postgres = bool(os.getenv('DATABASE_URL'))
+        cls.dialect = POSTGRES if cls.is_postgres else SQLITE
+        cls.dialect.register_adapters()
 
     @classmethod
     def initialize(cls):
-        print("Debug: Entering initialize method")
-        if cls._instance is None:
-            database_url = os.getenv('DATABASE_URL')
-            if not database_url:
-                print("ERROR: DATABASE_URL environment variable not found!")
-                print(
-                    "Please add your PostgreSQL connection string to the Secrets tab."
-                )
-                cls._fallback_to_sqlite()
+        """Open the pool if it is not open; raise DatabaseUnavailable if
+        PostgreSQL is down (a reconnect is then already under way)."""
+        with cls._lock:
+            if cls.pool is not None and not cls.pool.closed:
                 return
-            max_retries = 3
-            retry_delay = 2
-            for attempt in range(max_retries):
-                try:
-                    print(
-                        f"Debug: Attempting to connect to database (Attempt {attempt + 1}/{max_retries})"
-                    )
-                    cls._instance = cls()
-                    cls._instance.connection = psycopg2.connect(database_url)
-                    cls._instance.connection.autocommit = True
-                    print("Successfully connected to PostgreSQL database")
-                    cls.is_postgres = True
-                    return
-                except psycopg2.OperationalError as e:
-                    logger.error(
-                        f"Connection attempt {attempt + 1}/{max_retries} failed: {e}"
-                    )
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                    else:
-                        logger.warning(
-                            "Max retries reached for PostgreSQL. Falling back to SQLite."
-                        )
-                        cls._fallback_to_sqlite()
-                        return
+            cls.configure()
+            if not cls.is_postgres:
+                cls._open_sqlite()
+                return
+            if cls._reconnect_thread is not None:
+                raise DatabaseUnavailable(
+                    f"PostgreSQL is unavailable: {cls.last_error}")
+            cls._open_postgres()
 
     @classmethod
-    def _fallback_to_sqlite(cls):
-        print("Debug: Falling back to SQLite")
-        cls._instance = cls()
-        cls._instance.connection = sqlite3.connect(cls.db_file)
-        cls._instance.connection.row_factory = sqlite3.Row
-        cls.is_postgres = False
-        cls.setup_tables_sqlite()
-        print("Debug: SQLite fallback initialized")
+    def _connect_postgres(cls):
+        try:
+            return psycopg2.connect(
+                os.getenv('DATABASE_URL'),
+                connect_timeout=_reconnect_settings()['connect_timeout'])
+        except psycopg2.OperationalError as e:
+            cls._connection_lost(e)
+            raise DatabaseUnavailable(f"PostgreSQL is unavailable: {e}") from e
 
     @classmethod
-    def get_connection(cls):
-        print("Debug: Entering get_connection method")
-        if cls._instance is None:
-            cls.initialize()
+    def _open_postgres(cls):
+        cls.pool = ConnectionPool(cls._connect_postgres,
+                                  is_alive=_postgres_alive,
+                                  reset=_postgres_reset,
+                                  **_pool_settings())
+        cls.available = True
+        logger.info("Connected to PostgreSQL database")
 
-        if cls._instance is None:
-            logger.warning(
-                "WARNING: Using fallback in-memory SQLite database due to initialization failure!"
-            )
-            cls._fallback_to_sqlite()
+    @classmethod
+    def _connect_sqlite(cls):
+        settings = _sqlite_settings()
+        # Pooled connections move between threads, but never concurrently
+        conn = sqlite3.connect(cls.db_file,
+                               timeout=settings['busy_timeout_ms'] / 1000,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers run while a write commits; NORMAL syncs at
+        # checkpoints only, which WAL keeps crash-safe. cache_size is per
+        # connection (negative means KiB); the mmap is shared by all.
+        mode = conn.execute(
+            f"PRAGMA journal_mode = {settings['journal_mode']}").fetchone()[0]
+        if mode.upper() != settings['journal_mode']:
+            logger.warning("SQLite journal_mode is %s, not %s", mode,
+                           settings['journal_mode'])
+        conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+        conn.execute(f"PRAGMA cache_size = -{settings['cache_size_kb']:d}")
+        conn.execute(f"PRAGMA mmap_size = {settings['mmap_size']:d}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    @classmethod
+    def _open_sqlite(cls):
+        if cls.pool is not None:
+            cls.pool.close()
+        cls._sqlite_write_timeout = (_sqlite_settings()['busy_timeout_ms'] /
+                                     1000)
+        cls.pool = ConnectionPool(cls._connect_sqlite,
+                                  is_alive=_sqlite_alive,
+                                  reset=_sqlite_reset,
+                                  thread_affinity=True,
+                                  **_pool_settings())
+        logger.debug("SQLite database %s opened", cls.db_file)
+
+    @classmethod
+    def _connection_lost(cls, error):
+        """Fail fast from now on and start reconnecting in the background."""
+        with cls._lock:
+            cls.available = False
+            cls.last_error = str(error).strip()
+            if cls._reconnect_thread is not None:
+                return
+            logger.error("PostgreSQL connection failed: %s", cls.last_error)
+            cls._reconnect_thread = threading.Thread(target=cls._reconnect,
+                                                     name='db-reconnect',
+                                                     daemon=True)
+            cls._reconnect_thread.start()
+
+    @classmethod
+    def _reconnect(cls):
+        settings = _reconnect_settings()
+        delay = settings['min_delay']
+        attempt = 0
+        while True:
+            # Jitter keeps the workers of one host from retrying in step
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+            try:
+                conn = psycopg2.connect(
+                    os.getenv('DATABASE_URL'),
+                    connect_timeout=settings['connect_timeout'])
+                conn.close()
+                with cls._lock:
+                    if cls.pool is not None:
+                        # Its idle connections went down with the server
+                        cls.pool.close()
+                    cls._open_postgres()
+                    cls.available = True
+                    cls.last_error = None
+                    cls._reconnect_thread = None
+                logger.info("PostgreSQL reachable again after %s attempts",
+                            attempt)
+                return
+            except (psycopg2.OperationalError, DatabaseUnavailable) as e:
+                cls.last_error = str(e).strip()
+                delay = min(delay * 2, settings['max_delay'])
+                logger.warning(
+                    "PostgreSQL still unavailable (attempt %s), retrying in "
+                    "up to %.1fs: %s", attempt, delay, cls.last_error)
+
+    @classmethod
+    def check_available(cls):
+        """Raise DatabaseUnavailable while a reconnect is under way."""
+        if not cls.available:
+            raise DatabaseUnavailable(
+                f"PostgreSQL is unavailable: {cls.last_error}")
 
-        # Check if connection is still active and reconnect if closed
-        if cls._instance.connection.closed:
-            logger.warning(
-                "Database connection closed. Attempting to reconnect...")
+    @classmethod
+    @contextmanager
+    def get_connection(cls, timeout=None):
+        """Check a connection out of the pool for the duration of the block.
+
+        A psycopg2 error that leaves the connection closed means the server
+        went away: it is raised as DatabaseUnavailable and a reconnect
+        starts, so requests fail fast until the server is back.
+        """
+        cls.check_available()
+        if cls.pool is None or cls.pool.closed:
             cls.initialize()
-            if cls._instance.connection.closed:
-                logger.error("Reconnection failed. Using existing fallback.")
-                cls._fallback_to_sqlite()
 
-        return cls._instance.connection
+        with cls.pool.connection(timeout) as conn:
+            try:
+                yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                if not conn.closed:
+                    raise
+                cls._connection_lost(e)
+                raise DatabaseUnavailable(
+                    f"PostgreSQL is unavailable: {e}") from e
+
+    @classmethod
+    @contextmanager
+    def cursor(cls, dict_rows=False, name=None):
+        """Yield a cursor inside a transaction that commits when the block exits.
+
+        Statements are written with %s placeholders and compiled for the
+        active backend by its dialect. Any exception rolls the transaction
+        back and is re-raised; the connection goes back to the pool either
+        way. Passing `name` asks for a server-side cursor where supported.
+        """
+        with cls.get_connection() as conn:
+            observer = query_metrics if _observe_queries else None
+            raw = cls.dialect.cursor(conn, dict_rows, name)
+            if not cls.is_postgres:
+                raw = _SQLiteWriteGate(raw, cls._sqlite_writer,
+                                       cls._sqlite_write_timeout)
+            cursor = DialectCursor(raw, cls.dialect, observer)
+            try:
+                yield cursor
+                conn.commit()
+            except BaseException:
+                try:
+                    conn.rollback()
+                except Exception as e:
+                    # A dead connection cannot roll back; keep the error
+                    # that killed it
+                    logger.debug("Rollback failed: %s", e)
+                raise
+            finally:
+                cursor.close()
+                if not cls.is_postgres:
+                    raw.release()
+
+    @classmethod
+    def pool_stats(cls):
+        if cls.pool is None:
+            return {}
+        stats = cls.pool.stats()
+        stats['backend'] = cls.dialect.name
+        return stats
+
+    @classmethod
+    def health(cls, timeout=2.0):
+        """Database state for the readiness probe; never raises.
+
+        `ready` means a connection answered within `timeout` seconds and
+        every migration in MIGRATIONS has been applied.
+        """
+        state = {
+            'backend': cls.dialect.name,
+            'connected': False,
+            'schema_version': None,
+            'latest_schema_version': MIGRATIONS[-1].version,
+        }
+        try:
+            with cls.get_connection(timeout) as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                    state['connected'] = True
+                    cursor.execute(
+                        "SELECT MAX(version) FROM schema_migrations")
+                    state['schema_version'] = cursor.fetchone()[0]
+                finally:
+                    cursor.close()
+        except Exception as e:
+            # A missing schema_migrations table leaves schema_version None
+            logger.warning("Database health check failed: %s", e)
+        state['reconnecting'] = cls._reconnect_thread is not None
+        state['ready'] = (state['connected'] and state['schema_version']
+                          == state['latest_schema_version'])
+        return state
 
     @staticmethod
     def setup_tables_sqlite():
-        print("Debug: Entering setup_tables_sqlite")
-        conn = Database._instance.connection
-        c = conn.cursor()
+        logger.debug("Entering setup_tables_sqlite")
+        with Database.cursor() as c:
+            Database._create_tables_sqlite(c)
+        Database.migrate()
+        logger.debug("setup_tables_sqlite completed")
+
+    @staticmethod
+    def _create_tables_sqlite(c):
         c.execute('''CREATE TABLE IF NOT EXISTS vendors (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -189,126 +704,460 @@ class Database:
             key TEXT NOT NULL,
             value TEXT NOT NULL
         )''')
-        conn.commit()
-        print("Debug: setup_tables_sqlite completed")
 
     @staticmethod
     def setup_tables():
-        print("Debug: setup_tables function is defined and being executed")
-        conn = Database.get_connection()
-        c = conn.cursor()
+        Database.initialize()
         if Database.is_postgres:
-            c.execute('''CREATE TABLE IF NOT EXISTS vendors (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                email TEXT UNIQUE,
-                mobile TEXT,
-                country TEXT NOT NULL,
-                city TEXT,
-                sales_agent TEXT,
-                branch TEXT,
-                status TEXT NOT NULL,
-                sales_stage TEXT DEFAULT 'Lead',
-                address TEXT,
-                phone TEXT,
-                website TEXT,
-                description TEXT,
-                account_id INTEGER REFERENCES accounts(id)
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS cars (
-                id SERIAL PRIMARY KEY,
-                vendor_id INTEGER REFERENCES vendors(id),
-                name TEXT NOT NULL,
-                rates JSONB NOT NULL,
-                insurance TEXT,
-                mileage INTEGER,
-                fuel_level INTEGER,
-                year INTEGER,
-                status TEXT,
-                type TEXT,
-                features JSONB
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS bookings (
-                id SERIAL PRIMARY KEY,
-                vendor_id INTEGER REFERENCES vendors(id),
-                car_id INTEGER REFERENCES cars(id),
-                user_name TEXT,
-                start_date DATE,
-                end_date DATE,
-                duration TEXT,
-                cost REAL,
-                contract_number TEXT UNIQUE,
-                payment_type TEXT,
-                account_id INTEGER
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS roles (
-                id SERIAL PRIMARY KEY,
-                tenant_id INTEGER,
-                name TEXT NOT NULL,
-                permissions TEXT NOT NULL
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS customers (
-                id SERIAL PRIMARY KEY,
-                vendor_id INTEGER REFERENCES vendors(id),
-                name TEXT NOT NULL,
-                email TEXT,
-                phone TEXT,
-                id_number TEXT,
-                license_number TEXT,
-                license_country TEXT,
-                license_expiry DATE,
-                rating INTEGER,
-                blacklisted BOOLEAN DEFAULT FALSE
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS transactions (
-                id SERIAL PRIMARY KEY,
-                tenant_id INTEGER,
-                category TEXT NOT NULL,
-                amount REAL NOT NULL,
-                description TEXT,
-                vat_amount REAL DEFAULT 0,
-                account_id INTEGER,
-                payment_type TEXT,
-                date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS accounts (
-                id SERIAL PRIMARY KEY,
-                tenant_id INTEGER,
-                account_type TEXT NOT NULL,
-                account_name TEXT NOT NULL
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS pos_machines (
-                id SERIAL PRIMARY KEY,
-                tenant_id INTEGER,
-                serial_number TEXT NOT NULL,
-                account_id INTEGER REFERENCES accounts(id)
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS languages (
-                id SERIAL PRIMARY KEY,
-                code TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL
-            )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS translations (
-                id SERIAL PRIMARY KEY,
-                lang_code TEXT REFERENCES languages(code),
-                key TEXT NOT NULL,
-                value TEXT NOT NULL
-            )''')
-            conn.commit()
-            print("Debug: setup_tables for PostgreSQL completed")
+            with Database.cursor() as c:
+                Database._create_tables_postgres(c)
+            Database.migrate()
+            logger.debug("setup_tables for PostgreSQL completed")
         else:
-            print("Debug: Delegating to setup_tables_sqlite")
+            logger.debug("Delegating to setup_tables_sqlite")
             Database.setup_tables_sqlite()
-        print("Debug: setup_tables completed")
+        logger.debug("setup_tables completed")
+
+    @classmethod
+    def migrate(cls):
+        """Apply every migration in MIGRATIONS not yet recorded as applied."""
+        with cls.cursor() as c:
+            c.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''')
+        for migration in MIGRATIONS:
+            with cls.cursor() as c:
+                if cls.is_postgres:
+                    c.execute("SELECT pg_advisory_xact_lock(%s)",
+                              (_MIGRATION_LOCK_KEY, ))
+                c.execute("SELECT 1 FROM schema_migrations WHERE version = %s",
+                          (migration.version, ))
+                if c.fetchone():
+                    continue
+                statements = (migration.postgres
+                              if cls.is_postgres else migration.sqlite)
+                for statement in statements:
+                    c.execute(statement)
+                c.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (migration.version, migration.description))
+            logger.info("Applied migration %s: %s", migration.version,
+                        migration.description)
+
+    @staticmethod
+    def _create_tables_postgres(c):
+        c.execute('''CREATE TABLE IF NOT EXISTS vendors (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE,
+            mobile TEXT,
+            country TEXT NOT NULL,
+            city TEXT,
+            sales_agent TEXT,
+            branch TEXT,
+            status TEXT NOT NULL,
+            sales_stage TEXT DEFAULT 'Lead',
+            address TEXT,
+            phone TEXT,
+            website TEXT,
+            description TEXT,
+            account_id INTEGER REFERENCES accounts(id)
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS cars (
+            id SERIAL PRIMARY KEY,
+            vendor_id INTEGER REFERENCES vendors(id),
+            name TEXT NOT NULL,
+            rates JSONB NOT NULL,
+            insurance TEXT,
+            mileage INTEGER,
+            fuel_level INTEGER,
+            year INTEGER,
+            status TEXT,
+            type TEXT,
+            features JSONB
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS bookings (
+            id SERIAL PRIMARY KEY,
+            vendor_id INTEGER REFERENCES vendors(id),
+            car_id INTEGER REFERENCES cars(id),
+            user_name TEXT,
+            start_date DATE,
+            end_date DATE,
+            duration TEXT,
+            cost REAL,
+            contract_number TEXT UNIQUE,
+            payment_type TEXT,
+            account_id INTEGER
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS roles (
+            id SERIAL PRIMARY KEY,
+            tenant_id INTEGER,
+            name TEXT NOT NULL,
+            permissions TEXT NOT NULL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS customers (
+            id SERIAL PRIMARY KEY,
+            vendor_id INTEGER REFERENCES vendors(id),
+            name TEXT NOT NULL,
+            email TEXT,
+            phone TEXT,
+            id_number TEXT,
+            license_number TEXT,
+            license_country TEXT,
+            license_expiry DATE,
+            rating INTEGER,
+            blacklisted BOOLEAN DEFAULT FALSE
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS transactions (
+            id SERIAL PRIMARY KEY,
+            tenant_id INTEGER,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            vat_amount REAL DEFAULT 0,
+            account_id INTEGER,
+            payment_type TEXT,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS accounts (
+            id SERIAL PRIMARY KEY,
+            tenant_id INTEGER,
+            account_type TEXT NOT NULL,
+            account_name TEXT NOT NULL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS pos_machines (
+            id SERIAL PRIMARY KEY,
+            tenant_id INTEGER,
+            serial_number TEXT NOT NULL,
+            account_id INTEGER REFERENCES accounts(id)
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS languages (
+            id SERIAL PRIMARY KEY,
+            code TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS translations (
+            id SERIAL PRIMARY KEY,
+            lang_code TEXT REFERENCES languages(code),
+            key TEXT NOT NULL,
+            value TEXT NOT NULL
+        )''')
 
 
-# Global Database instance
+# Global Database instance; the pool opens on first use
 db = Database()
+Database.configure()
+
+# Columns that may be requested through field projection, per table
+TABLE_COLUMNS = {
+    'cars': ('id', 'vendor_id', 'name', 'rates', 'insurance', 'mileage',
+             'fuel_level', 'year', 'status', 'type', 'features'),
+    'bookings':
+    ('id', 'vendor_id', 'car_id', 'user_name', 'start_date', 'end_date',
+     'duration', 'cost', 'contract_number', 'payment_type', 'account_id'),
+    'customers': ('id', 'vendor_id', 'name', 'email', 'phone', 'id_number',
+                  'license_number', 'license_country', 'license_expiry',
+                  'rating', 'blacklisted'),
+}
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {token!r}") from e
+
+
+def _projection(table, fields):
+    if not fields:
+        return '*'
+    unknown = [f for f in fields if f not in TABLE_COLUMNS[table]]
+    if unknown:
+        raise ValueError(f"Unknown field(s) for {table}: {', '.join(unknown)}")
+    # id is always selected, the next cursor is built from it
+    return ", ".join(['id'] + [f for f in fields if f != 'id'])
+
+
+def _tenant_filter(column, tenant_id):
+    """Return (conditions, params) restricting `column` to one tenant.
+
+    A None tenant means "all tenants" and yields no condition at all rather
+    than `column = %s OR %s IS NULL`, which the planner cannot match to an
+    index.
+    """
+    if tenant_id is None:
+        return [], []
+    return [f"{column} = %s"], [tenant_id]
+
+
+def _where(conditions):
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+class PageQuery(namedtuple('PageQuery', 'table query params limit')):
+    """A keyset-paginated SELECT, independent of who executes it."""
+
+    def finish(self, rows):
+        """Trim the look-ahead row and return (rows, next_cursor)."""
+        if self.limit is not None and len(rows) > self.limit:
+            rows = rows[:self.limit]
+            return rows, encode_cursor(rows[-1]['id'])
+        return rows, None
+
+
+def _page_query(table, fields, conditions, params, limit, after):
+    """Build a PageQuery; the id bound, ordering and limit are added here.
+
+    One extra row is requested to learn whether a further page exists.
+    """
+    query = f"SELECT {_projection(table, fields)} FROM {table}"
+    if after is not None:
+        conditions = conditions + ["id > %s"]
+        params = params + [decode_cursor(after)]
+    query += _where(conditions) + " ORDER BY id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params = params + [limit + 1]
+    return PageQuery(table, query, params, limit)
+
+
+def _run_page(page):
+    """Execute a PageQuery on the pool and return (rows, next_cursor).
+
+    Rows are fetched as plain tuples and zipped with the column names,
+    which is cheaper than a dict cursor (RealDictCursor builds each row
+    in Python).
+    """
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(page.query, page.params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except DB_ERRORS as e:
+        logger.error("Error getting %s page: %s", page.table, e)
+        return [], None
+    return page.finish(rows)
+
+
+_CAR_STATUS_UPSERT = """INSERT INTO vendor_car_status_counts (vendor_id, status, cars) VALUES (%s, %s, %s)
+ON CONFLICT (vendor_id, status) DO UPDATE SET cars = vendor_car_status_counts.cars + excluded.cars"""
+_BOOKING_REVENUE_UPSERT = """INSERT INTO vendor_daily_revenue (vendor_id, day, bookings, booking_revenue) VALUES (%s, %s, %s, %s)
+ON CONFLICT (vendor_id, day) DO UPDATE SET bookings = vendor_daily_revenue.bookings + excluded.bookings,
+booking_revenue = vendor_daily_revenue.booking_revenue + excluded.booking_revenue"""
+_TRANSACTION_REVENUE_UPSERT = """INSERT INTO vendor_daily_revenue (vendor_id, day, transactions, transaction_amount, vat_amount) VALUES (%s, CURRENT_DATE, 1, %s, %s)
+ON CONFLICT (vendor_id, day) DO UPDATE SET transactions = vendor_daily_revenue.transactions + 1,
+transaction_amount = vendor_daily_revenue.transaction_amount + excluded.transaction_amount,
+vat_amount = vendor_daily_revenue.vat_amount + excluded.vat_amount"""
+
+
+def record_car_status_changes(cursor, changes):
+    """Apply (vendor_id, status, delta) changes to vendor_car_status_counts.
+
+    Runs on the caller's cursor so the counts commit or roll back with the
+    car rows they describe.
+    """
+    totals = Counter()
+    for vendor_id, status, delta in changes:
+        if vendor_id is None:
+            continue
+        totals[(vendor_id, 'Unknown' if status is None else status)] += delta
+    rows = [key + (delta, ) for key, delta in totals.items() if delta]
+    if rows:
+        prepared_statements.execute(cursor,
+                                    _CAR_STATUS_UPSERT,
+                                    rows,
+                                    many=True)
+
+
+def record_booking_revenue(cursor, bookings):
+    """Add (vendor_id, start_date, cost) bookings to vendor_daily_revenue."""
+    totals = {}
+    for vendor_id, start_date, cost in bookings:
+        if vendor_id is None or start_date is None:
+            continue
+        key = (vendor_id, str(start_date)[:10])  # dates and ISO strings
+        count, revenue = totals.get(key, (0, 0.0))
+        totals[key] = (count + 1, revenue + float(cost or 0))
+    if totals:
+        prepared_statements.execute(
+            cursor,
+            _BOOKING_REVENUE_UPSERT,
+            [key + value for key, value in totals.items()],
+            many=True)
+
+
+def rebuild_dashboard_aggregates():
+    """Recompute the dashboard aggregate tables from the raw rows.
+
+    For rows written behind the helpers' backs (manual SQL, restores).
+    """
+    backend = _DASHBOARD_POSTGRES if db.is_postgres else _DASHBOARD_SQLITE
+    with db.cursor() as cursor:
+        if db.is_postgres:
+            cursor.execute(
+                "LOCK TABLE vendor_car_status_counts, vendor_daily_revenue")
+        else:
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("DELETE FROM vendor_car_status_counts")
+        cursor.execute("DELETE FROM vendor_daily_revenue")
+        for statement in _dashboard_statements(backend, _DASHBOARD_BACKFILL):
+            cursor.execute(statement)
+
+
+_REVENUE_FIELDS = ('bookings', 'booking_revenue', 'transactions',
+                   'transaction_amount', 'vat_amount')
+
+
+def get_dashboard_summary(vendor_id,
+                          start_date=None,
+                          end_date=None,
+                          upcoming_limit=10):
+    """Fleet, revenue and upcoming-booking summary for one vendor.
+
+    Counts and revenue come from the aggregate tables; `start_date` and
+    `end_date` (inclusive, default the last 30 days) bound the daily and
+    monthly revenue series. Only the next `upcoming_limit` bookings are
+    read from the bookings table itself.
+    """
+    today = datetime.date.today()
+    end_date = end_date or today
+    start_date = start_date or end_date - datetime.timedelta(days=29)
+    try:
+        with db.cursor(dict_rows=True) as cursor:
+            cursor.execute(
+                "SELECT status, cars FROM vendor_car_status_counts WHERE vendor_id = %s AND cars > 0 ORDER BY status",
+                (vendor_id, ))
+            cars_by_status = {
+                r['status']: r['cars']
+                for r in cursor.fetchall()
+            }
+            cursor.execute(
+                "SELECT day, bookings, booking_revenue, transactions, transaction_amount, vat_amount FROM vendor_daily_revenue WHERE vendor_id = %s AND day >= %s AND day <= %s ORDER BY day",
+                (vendor_id, start_date.isoformat(), end_date.isoformat()))
+            daily = [dict(r, day=str(r['day'])) for r in cursor.fetchall()]
+            cursor.execute(
+                "SELECT COALESCE(SUM(bookings), 0) AS bookings FROM vendor_daily_revenue WHERE vendor_id = %s AND day >= %s",
+                (vendor_id, today.isoformat()))
+            upcoming_count = cursor.fetchone()['bookings']
+            cursor.execute(
+                "SELECT * FROM bookings WHERE vendor_id = %s AND start_date >= %s ORDER BY start_date, id LIMIT %s",
+                (vendor_id, today.isoformat(), upcoming_limit))
+            upcoming = [dict(r) for r in cursor.fetchall()]
+    except DB_ERRORS as e:
+        logger.error("Error getting dashboard summary: %s", e)
+        return None
+
+    monthly = {}
+    totals = dict.fromkeys(_REVENUE_FIELDS, 0)
+    for row in daily:
+        month = monthly.setdefault(row['day'][:7],
+                                   dict.fromkeys(_REVENUE_FIELDS, 0))
+        for field in _REVENUE_FIELDS:
+            month[field] += row[field]
+            totals[field] += row[field]
+    return {
+        'cars_by_status': cars_by_status,
+        'total_cars': sum(cars_by_status.values()),
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'revenue': {
+            'daily': daily,
+            'monthly':
+            [dict(month=m, **v) for m, v in sorted(monthly.items())],
+            'totals': totals,
+        },
+        'vat_total': totals['vat_amount'],
+        'upcoming_bookings': {
+            'count': upcoming_count,
+            'next': upcoming,
+        },
+    }
+
+
+_write_listeners = []
+
+
+def register_write_listener(listener):
+    """Call `listener(table, tenant_id)` after each committed write.
+
+    Helpers that write cars, customers or bookings report the table and
+    the tenant whose rows changed, or None when the change is not tied to
+    one tenant. Listeners run on the writing thread and must be quick;
+    their errors are logged, never raised into the write.
+    """
+    _write_listeners.append(listener)
+
+
+def _notify_write(table, tenant_id=None):
+    for listener in _write_listeners:
+        try:
+            listener(table, tenant_id)
+        except Exception as e:
+            logger.error("Write listener failed for %s: %s", table, e)
+
+
+# Row-level changes to cars, bookings and customers, streamed to clients
+# by /api/changes. On Postgres every write also NOTIFYs its changes on
+# CHANGE_FEED_CHANNEL, and each worker's relay publishes the others'.
+change_feed = ChangeFeed(
+    backlog=int(os.getenv('CHANGE_FEED_BACKLOG', '1000')),
+    max_queued=int(os.getenv('CHANGE_FEED_MAX_QUEUED', '1000')),
+    max_subscribers=int(os.getenv('CHANGE_FEED_MAX_SUBSCRIBERS', '1000')))
+_CHANGE_FEED_CHANNEL = os.getenv('CHANGE_FEED_CHANNEL', 'rentmaster_changes')
+if not re.fullmatch(r'[a-z_][a-z0-9_]*', _CHANGE_FEED_CHANNEL):
+    raise ValueError(
+        f"CHANGE_FEED_CHANNEL must be a lowercase identifier, not {_CHANGE_FEED_CHANNEL!r}"
+    )
+
+
+def _connect_listener():
+    return psycopg2.connect(
+        os.getenv('DATABASE_URL'),
+        connect_timeout=_reconnect_settings()['connect_timeout'])
+
+
+change_relay = ChangeRelay(_connect_listener, change_feed,
+                           _CHANGE_FEED_CHANNEL)
+
+
+def _record_changes(cursor, op, table, vendor_id, row_ids):
+    """Change events for rows written in `cursor`'s transaction.
+
+    On Postgres they are NOTIFYed in that transaction, so other workers
+    only hear of them if it commits. The caller publishes them to
+    change_feed once it has.
+    """
+    events = [change_event(op, table, vendor_id, row_id) for row_id in row_ids]
+    if db.is_postgres:
+        for payload in change_feed.notify_payloads(events):
+            cursor.execute("SELECT pg_notify(%s, %s)",
+                           (_CHANGE_FEED_CHANNEL, payload))
+    return events
+
+
+def subscribe_changes(vendor_id, last_event_id=None, tables=None):
+    """Subscribe to the change feed (see ChangeFeed.subscribe), starting
+    the relay of other workers' changes on Postgres."""
+    if db.is_postgres:
+        change_relay.start()
+    return change_feed.subscribe(vendor_id, last_event_id, tables)
 
 
 # Module-level functions with implementation using the db instance
 def init_db():
-    print("Debug: Entering init_db")
+    """Create the tables and apply pending migrations.
+
+    Run once per deploy with `python database.py migrate`, not from the
+    web workers.
+    """
+    logger.debug("Entering init_db")
     Database.setup_tables()
 
 
@@ -322,39 +1171,30 @@ def add_vendor(name,
                status='Lead',
                sales_stage='Lead'):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO vendors (name, email, mobile, country, city, sales_agent, branch, status, sales_stage) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        cursor.execute(query, (name, email, mobile, country, city, sales_agent,
-                               branch, status, sales_stage))
-        conn.commit()
-        print(f"Debug: Vendor {name} added successfully")
-    except Exception as e:
-        logger.error(f"Error adding vendor: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO vendors (name, email, mobile, country, city, sales_agent, branch, status, sales_stage) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+            cursor.execute(query, (name, email, mobile, country, city,
+                                   sales_agent, branch, status, sales_stage))
+        logger.debug("Vendor %s added successfully", name)
+    except DB_ERRORS as e:
+        logger.error("Error adding vendor: %s", e)
 
 
 def get_vendors(filters=None):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM vendors"
-        if filters:
-            conditions = [f"{k} = %s" for k in filters.keys()]
-            query += " WHERE " + " AND ".join(conditions)
-            cursor.execute(query, list(filters.values()))
-        else:
-            cursor.execute(query)
-        vendors = cursor.fetchall()
-        return [dict(v) for v in vendors
-                ] if db.is_postgres else [dict(v) for v in vendors]
-    except Exception as e:
-        logger.error(f"Error getting vendors: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            query = "SELECT * FROM vendors"
+            if filters:
+                conditions = [f"{k} = %s" for k in filters.keys()]
+                query += " WHERE " + " AND ".join(conditions)
+                cursor.execute(query, list(filters.values()))
+            else:
+                cursor.execute(query)
+            vendors = cursor.fetchall()
+        return [dict(v) for v in vendors]
+    except DB_ERRORS as e:
+        logger.error("Error getting vendors: %s", e)
         return []
-    finally:
-        cursor.close()
 
 
 def update_vendor(vendor_id,
@@ -367,37 +1207,28 @@ def update_vendor(vendor_id,
                   branch=None,
                   status=None,
                   sales_stage=None):
+    updates = {
+        k: v
+        for k, v in locals().items() if v is not None and k != 'vendor_id'
+    }
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        updates = {
-            k: v
-            for k, v in locals().items() if v is not None and k != 'vendor_id'
-            and k != 'conn' and k != 'cursor'
-        }
         if updates:
             set_clause = ", ".join([f"{k} = %s" for k in updates.keys()])
             query = f"UPDATE vendors SET {set_clause} WHERE id = %s"
-            cursor.execute(query, list(updates.values()) + [vendor_id])
-            conn.commit()
-            print(f"Debug: Vendor {vendor_id} updated successfully")
-    except Exception as e:
-        logger.error(f"Error updating vendor: {e}")
-    finally:
-        cursor.close()
+            with db.cursor() as cursor:
+                cursor.execute(query, list(updates.values()) + [vendor_id])
+            logger.debug("Vendor %s updated successfully", vendor_id)
+    except DB_ERRORS as e:
+        logger.error("Error updating vendor: %s", e)
 
 
 def remove_vendor(vendor_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM vendors WHERE id = %s", (vendor_id, ))
-        conn.commit()
-        print(f"Debug: Vendor {vendor_id} removed successfully")
-    except Exception as e:
-        logger.error(f"Error removing vendor: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            cursor.execute("DELETE FROM vendors WHERE id = %s", (vendor_id, ))
+        logger.debug("Vendor %s removed successfully", vendor_id)
+    except DB_ERRORS as e:
+        logger.error("Error removing vendor: %s", e)
 
 
 def add_car(vendor_id,
@@ -411,34 +1242,42 @@ def add_car(vendor_id,
             type=None,
             features=None):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO cars (vendor_id, name, rates, insurance, mileage, fuel_level, year, status, type, features) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        cursor.execute(query, (vendor_id, name, rates, insurance, mileage,
-                               fuel_level, year, status, type, features))
-        conn.commit()
-        print(f"Debug: Car {name} added successfully")
-    except Exception as e:
-        logger.error(f"Error adding car: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO cars (vendor_id, name, rates, insurance, mileage, fuel_level, year, status, type, features) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id"
+            prepared_statements.execute(
+                cursor, query, (vendor_id, name, rates, insurance, mileage,
+                                fuel_level, year, status, type, features))
+            car_id = cursor.fetchone()[0]
+            record_car_status_changes(cursor, [(vendor_id, status, 1)])
+            changes = _record_changes(cursor, 'insert', 'cars', vendor_id,
+                                      [car_id])
+        fleet_state.car_changed(vendor_id, car_id, status)
+        change_feed.publish(changes)
+        _notify_write('cars', vendor_id)
+        logger.debug("Car %s added successfully", name)
+    except DB_ERRORS as e:
+        logger.error("Error adding car: %s", e)
 
 
 def get_cars(vendor_id=None):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM cars WHERE vendor_id = %s OR %s IS NULL"
-        cursor.execute(query, (vendor_id, vendor_id))
-        cars = cursor.fetchall()
-        return [dict(c)
-                for c in cars] if db.is_postgres else [dict(c) for c in cars]
-    except Exception as e:
-        logger.error(f"Error getting cars: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            conditions, params = _tenant_filter('vendor_id', vendor_id)
+            cursor.execute("SELECT * FROM cars" + _where(conditions), params)
+            cars = cursor.fetchall()
+        return [dict(c) for c in cars]
+    except DB_ERRORS as e:
+        logger.error("Error getting cars: %s", e)
         return []
-    finally:
-        cursor.close()
+
+
+def cars_page_query(vendor_id=None, limit=None, after=None, fields=None):
+    conditions, params = _tenant_filter('vendor_id', vendor_id)
+    return _page_query('cars', fields, conditions, params, limit, after)
+
+
+def get_cars_page(vendor_id=None, limit=None, after=None, fields=None):
+    return _run_page(cars_page_query(vendor_id, limit, after, fields))
 
 
 def update_car(car_id,
@@ -452,168 +1291,480 @@ def update_car(car_id,
                type=None,
                features=None):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "UPDATE cars SET name = %s, rates = %s, insurance = %s, mileage = %s, fuel_level = %s, status = %s, year = %s, type = %s, features = %s WHERE id = %s"
-        cursor.execute(query, (name, rates, insurance, mileage, fuel_level,
-                               status, year, type, features, car_id))
-        conn.commit()
-        print(f"Debug: Car {car_id} updated successfully")
-    except Exception as e:
-        logger.error(f"Error updating car: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            previous = _lock_car(cursor, car_id)
+            query = "UPDATE cars SET name = %s, rates = %s, insurance = %s, mileage = %s, fuel_level = %s, status = %s, year = %s, type = %s, features = %s WHERE id = %s"
+            cursor.execute(query, (name, rates, insurance, mileage, fuel_level,
+                                   status, year, type, features, car_id))
+            if previous is not None and previous[1] != status:
+                vendor_id, old_status = previous
+                record_car_status_changes(cursor, [(vendor_id, old_status, -1),
+                                                   (vendor_id, status, 1)])
+            changes = [] if previous is None else _record_changes(
+                cursor, 'update', 'cars', previous[0], [car_id])
+        rate_cache.invalidate(car_id)
+        if previous is not None:
+            fleet_state.car_changed(previous[0], car_id, status)
+        change_feed.publish(changes)
+        _notify_write('cars', previous[0] if previous else None)
+        logger.debug("Car %s updated successfully", car_id)
+    except DB_ERRORS as e:
+        logger.error("Error updating car: %s", e)
 
 
 def remove_car(car_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM cars WHERE id = %s", (car_id, ))
-        conn.commit()
-        print(f"Debug: Car {car_id} removed successfully")
-    except Exception as e:
-        logger.error(f"Error removing car: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            previous = _lock_car(cursor, car_id)
+            cursor.execute("DELETE FROM cars WHERE id = %s", (car_id, ))
+            if previous is not None:
+                vendor_id, old_status = previous
+                record_car_status_changes(cursor,
+                                          [(vendor_id, old_status, -1)])
+            changes = [] if previous is None else _record_changes(
+                cursor, 'delete', 'cars', previous[0], [car_id])
+        rate_cache.invalidate(car_id)
+        if previous is not None:
+            fleet_state.car_removed(previous[0], car_id)
+        change_feed.publish(changes)
+        _notify_write('cars', previous[0] if previous else None)
+        logger.debug("Car %s removed successfully", car_id)
+    except DB_ERRORS as e:
+        logger.error("Error removing car: %s", e)
+
+
+def _lock_car(cursor, car_id):
+    """Return the car's (vendor_id, status), locking it until commit."""
+    if db.is_postgres:
+        prepared_statements.execute(
+            cursor,
+            "SELECT vendor_id, status FROM cars WHERE id = %s FOR UPDATE",
+            (car_id, ))
+    else:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT vendor_id, status FROM cars WHERE id = %s",
+                       (car_id, ))
+    return cursor.fetchone()
+
+
+def _load_car_rates(car_ids):
+    placeholders = ', '.join(['%s'] * len(car_ids))
+    with db.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id, vendor_id, rates FROM cars WHERE id IN ({placeholders})",
+            list(car_ids))
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+
+# Parsed cars.rates per car; update_car/remove_car invalidate it
+rate_cache = RateCache(_load_car_rates,
+                       max_cars=int(os.getenv('RATE_CACHE_MAX_CARS', '10000')),
+                       ttl=float(os.getenv('RATE_CACHE_TTL', '300')))
+
+
+def _load_fleet(vendor_id, day):
+    conditions, params = _tenant_filter('vendor_id', vendor_id)
+    with db.cursor() as cursor:
+        cursor.execute("SELECT id, status FROM cars" + _where(conditions),
+                       params)
+        cars = [tuple(row) for row in cursor.fetchall()]
+        conditions.append("end_date > %s")
+        cursor.execute(
+            "SELECT car_id, start_date, end_date FROM bookings" +
+            _where(conditions), params + [day])
+        bookings = [tuple(row) for row in cursor.fetchall()]
+    return cars, bookings
+
+
+# Today's state of each car (Available/Rented/Maintenance) per vendor, kept
+# current by update_car, remove_car and add_booking and swept at midnight
+fleet_state = FleetState(_load_fleet,
+                         ttl=float(os.getenv('FLEET_STATE_TTL', '300')),
+                         sweep_interval=float(
+                             os.getenv('FLEET_SWEEP_INTERVAL', '60')))
+
+
+def get_fleet_board(vendor_id):
+    """Fleet state of each of the vendor's cars with counts per state,
+    from the in-memory view; None on a database error."""
+    try:
+        return fleet_state.board(vendor_id)
+    except DB_ERRORS as e:
+        logger.error("Error getting fleet board: %s", e)
+        return None
+
+
+def quote_cars(vendor_id, car_ids, start_date, end_date, insurance=()):
+    """Price each car for the same rental, in the order given.
+
+    Rates come from rate_cache, so pricing a page of cars takes at most
+    one query. Each quote has the car_id and either the price breakdown
+    from RateTable.quote or an `error` (unknown car, another vendor's car,
+    unpriceable rates, insurance not offered). Returns None on a database
+    error; raises ValueError if end_date is not after start_date.
+    """
+    days = rental_days(start_date, end_date)
+    try:
+        tables = rate_cache.get_many(car_ids)
+    except DB_ERRORS as e:
+        logger.error("Error loading car rates: %s", e)
+        return None
+    quotes = []
+    for car_id in car_ids:
+        owner, table = tables.get(car_id, (None, None))
+        if table is None or (vendor_id is not None and owner != vendor_id):
+            quotes.append({'car_id': car_id, 'error': 'Car not found'})
+            continue
+        try:
+            if isinstance(table, PricingError):
+                raise table
+            quotes.append(dict(car_id=car_id, **table.quote(days, insurance)))
+        except PricingError as e:
+            quotes.append({'car_id': car_id, 'error': str(e)})
+    return quotes
+
+
+def price_booking(vendor_id, car_id, start_date, end_date, insurance=()):
+    """Server-side total for one booking, from the car's rates.
+
+    Takes the car id and YYYY-MM-DD dates as posted by a booking form.
+    Raises PricingError if they are invalid or the car cannot be priced;
+    returns None on a database error.
+    """
+    try:
+        car_id = int(car_id)
+        start_date = datetime.date.fromisoformat(start_date)
+        end_date = datetime.date.fromisoformat(end_date)
+    except (TypeError, ValueError):
+        raise PricingError("car_id and YYYY-MM-DD start_date and end_date "
+                           "are required") from None
+    if end_date <= start_date:
+        raise PricingError("end_date must be after start_date")
+    quotes = quote_cars(vendor_id, [car_id], start_date, end_date, insurance)
+    if quotes is None:
+        return None
+    if 'error' in quotes[0]:
+        raise PricingError(quotes[0]['error'])
+    return quotes[0]['total']
+
+
+def _booking_overlap_condition(start_date, end_date):
+    """SQL condition (aliased `b`) matching bookings that overlap a range."""
+    if db.is_postgres:
+        condition = ("b.start_date IS NOT NULL AND b.end_date IS NOT NULL"
+                     " AND daterange(b.start_date, b.end_date, '[)')"
+                     " && daterange(%s::date, %s::date, '[)')")
+        return condition, [start_date, end_date]
+    return "b.start_date < %s AND b.end_date > %s", [end_date, start_date]
+
+
+def check_booking_overlap(cursor, car_id, start_date, end_date):
+    """Raise BookingConflictError if the car has a booking in the range.
+
+    Only needed on SQLite, where the caller must hold the write lock
+    (BEGIN IMMEDIATE); Postgres enforces the bookings_no_overlap constraint.
+    """
+    overlap, params = _booking_overlap_condition(start_date, end_date)
+    cursor.execute(
+        f"SELECT 1 FROM bookings b WHERE b.car_id = %s AND {overlap} LIMIT 1",
+        [car_id] + params)
+    if cursor.fetchone():
+        raise BookingConflictError(
+            f"Car {car_id} is already booked between {start_date} and {end_date}"
+        )
+
+
+def _booking_values(car_id, start_date, end_date, account_id):
+    """Form values of a booking as (car_id, start_date, end_date,
+    account_id); raises ValueError for values the database would reject."""
+    try:
+        car_id = int(car_id)
+        start_date, end_date = (value if isinstance(value, datetime.date) else
+                                datetime.date.fromisoformat(value)
+                                for value in (start_date, end_date))
+        account_id = None if account_id in (None, '') else int(account_id)
+    except (TypeError, ValueError):
+        raise ValueError(
+            "car_id and account_id must be integers, start_date and "
+            "end_date YYYY-MM-DD dates") from None
+    if end_date <= start_date:
+        raise ValueError("end_date must be after start_date")
+    return car_id, start_date, end_date, account_id
 
 
 def add_booking(vendor_id, car_id, user_name, start_date, end_date, duration,
                 cost, contract_number, payment_type, account_id):
+    """Insert a booking, raising BookingConflictError if the car is taken.
+
+    Postgres enforces this with the bookings_no_overlap constraint. On
+    SQLite the check and the insert run under one write lock
+    (BEGIN IMMEDIATE) so two requests cannot both pass the check.
+    Returns False if the insert failed; raises ValueError for a booking
+    the database would reject.
+    """
+    car_id, start_date, end_date, account_id = _booking_values(
+        car_id, start_date, end_date, account_id)
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO bookings (vendor_id, car_id, user_name, start_date, end_date, duration, cost, contract_number, payment_type, account_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        cursor.execute(
-            query, (vendor_id, car_id, user_name, start_date, end_date,
-                    duration, cost, contract_number, payment_type, account_id))
-        conn.commit()
-        print(f"Debug: Booking {contract_number} added successfully")
-    except Exception as e:
-        logger.error(f"Error adding booking: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            if not db.is_postgres:
+                cursor.execute("BEGIN IMMEDIATE")
+                check_booking_overlap(cursor, car_id, start_date, end_date)
+            query = "INSERT INTO bookings (vendor_id, car_id, user_name, start_date, end_date, duration, cost, contract_number, payment_type, account_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id"
+            prepared_statements.execute(
+                cursor, query,
+                (vendor_id, car_id, user_name, start_date, end_date, duration,
+                 cost, contract_number, payment_type, account_id))
+            booking_id = cursor.fetchone()[0]
+            record_booking_revenue(cursor, [(vendor_id, start_date, cost)])
+            changes = _record_changes(cursor, 'insert', 'bookings', vendor_id,
+                                      [booking_id])
+        fleet_state.booking_added(vendor_id, car_id, start_date, end_date)
+        change_feed.publish(changes)
+        _notify_write('bookings', vendor_id)
+        logger.debug("Booking %s added successfully", contract_number)
+        return True
+    except pg_errors.ExclusionViolation as e:
+        raise BookingConflictError(
+            f"Car {car_id} is already booked between {start_date} and {end_date}"
+        ) from e
+    except DB_ERRORS as e:
+        logger.error("Error adding booking: %s", e)
+        return False
 
 
 def get_bookings(vendor_id, filters=None, future_only=False):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM bookings WHERE vendor_id = %s OR %s IS NULL"
-        params = [vendor_id, vendor_id]
-        if future_only:
-            query += " AND start_date > CURRENT_DATE"
-        if filters:
-            conditions = [f"{k} = %s" for k in filters.keys()]
-            query += " AND " + " AND ".join(conditions)
-            params.extend(filters.values())
-        cursor.execute(query, params)
-        bookings = cursor.fetchall()
-        return [dict(b) for b in bookings
-                ] if db.is_postgres else [dict(b) for b in bookings]
-    except Exception as e:
-        logger.error(f"Error getting bookings: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            conditions, params = _tenant_filter('vendor_id', vendor_id)
+            if future_only:
+                conditions.append("start_date > CURRENT_DATE")
+            if filters:
+                conditions.extend(f"{k} = %s" for k in filters.keys())
+                params.extend(filters.values())
+            cursor.execute("SELECT * FROM bookings" + _where(conditions),
+                           params)
+            bookings = cursor.fetchall()
+        return [dict(b) for b in bookings]
+    except DB_ERRORS as e:
+        logger.error("Error getting bookings: %s", e)
         return []
-    finally:
-        cursor.close()
+
+
+def bookings_page_query(vendor_id,
+                        limit=None,
+                        after=None,
+                        fields=None,
+                        future_only=False):
+    conditions, params = _tenant_filter('vendor_id', vendor_id)
+    if future_only:
+        conditions.append("start_date > CURRENT_DATE")
+    return _page_query('bookings', fields, conditions, params, limit, after)
+
+
+def get_bookings_page(vendor_id,
+                      limit=None,
+                      after=None,
+                      fields=None,
+                      future_only=False):
+    return _run_page(
+        bookings_page_query(vendor_id, limit, after, fields, future_only))
+
+
+def available_cars_query(vendor_id,
+                         start_date,
+                         end_date,
+                         car_type=None,
+                         status=None,
+                         features=None,
+                         limit=None,
+                         after=None,
+                         fields=None):
+    """Cars with no booking overlapping [start_date, end_date), as a PageQuery.
+
+    `features` is a list of values that must all appear in the car's
+    features array.
+    """
+    conditions, params = _tenant_filter('vendor_id', vendor_id)
+    if car_type is not None:
+        conditions.append("type = %s")
+        params.append(car_type)
+    if status is not None:
+        conditions.append("status = %s")
+        params.append(status)
+    for feature in features or ():
+        if db.is_postgres:
+            conditions.append("features @> %s::jsonb")
+            params.append(json.dumps([feature]))
+        else:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM json_each(CASE WHEN json_valid(cars.features) THEN cars.features ELSE '[]' END) WHERE value = %s)"
+            )
+            params.append(feature)
+    overlap, overlap_params = _booking_overlap_condition(start_date, end_date)
+    conditions.append(
+        f"NOT EXISTS (SELECT 1 FROM bookings b WHERE b.car_id = cars.id AND {overlap})"
+    )
+    params.extend(overlap_params)
+    return _page_query('cars', fields, conditions, params, limit, after)
+
+
+def get_available_cars(vendor_id,
+                       start_date,
+                       end_date,
+                       car_type=None,
+                       status=None,
+                       features=None,
+                       limit=None,
+                       after=None,
+                       fields=None):
+    return _run_page(
+        available_cars_query(vendor_id, start_date, end_date, car_type, status,
+                             features, limit, after, fields))
 
 
 def add_role(name, permissions, tenant_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO roles (name, permissions, tenant_id) VALUES (%s, %s, %s)"
-        cursor.execute(query, (name, permissions, tenant_id))
-        conn.commit()
-        print(f"Debug: Role {name} added successfully")
-    except Exception as e:
-        logger.error(f"Error adding role: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO roles (name, permissions, tenant_id) VALUES (%s, %s, %s)"
+            cursor.execute(query, (name, permissions, tenant_id))
+        permission_resolver.invalidate()
+        logger.debug("Role %s added successfully", name)
+    except DB_ERRORS as e:
+        logger.error("Error adding role: %s", e)
 
 
 def get_roles(tenant_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM roles WHERE tenant_id = %s OR %s IS NULL"
-        cursor.execute(query, (tenant_id, tenant_id))
-        roles = cursor.fetchall()
-        return [dict(r) for r in roles
-                ] if db.is_postgres else [dict(r) for r in roles]
-    except Exception as e:
-        logger.error(f"Error getting roles: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            conditions, params = _tenant_filter('tenant_id', tenant_id)
+            cursor.execute("SELECT * FROM roles" + _where(conditions), params)
+            roles = cursor.fetchall()
+        return [dict(r) for r in roles]
+    except DB_ERRORS as e:
+        logger.error("Error getting roles: %s", e)
         return []
-    finally:
-        cursor.close()
 
 
-def check_permission(username, permission):
+def add_user(username, role_id, tenant_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        with db.cursor() as cursor:
+            query = "INSERT INTO users (username, role_id, tenant_id) VALUES (%s, %s, %s)"
+            cursor.execute(query, (username, role_id, tenant_id))
+        permission_resolver.invalidate(username)
+        logger.debug("User %s added successfully", username)
+    except DB_ERRORS as e:
+        logger.error("Error adding user: %s", e)
+
+
+def _load_user_permissions(username):
+    with db.cursor() as cursor:
         query = "SELECT permissions FROM roles JOIN users ON roles.id = users.role_id WHERE users.username = %s"
-        cursor.execute(query, (username, ))
+        prepared_statements.execute(cursor, query, (username, ))
         result = cursor.fetchone()
-        if result:
-            permissions = result[0]
-            return permission in permissions.split(',')
-        return False
-    except Exception as e:
-        logger.error(f"Error checking permission: {e}")
+    return result[0] if result else None
+
+
+# Compiled role permissions per user; add_role/add_user invalidate it
+permission_resolver = PermissionResolver(_load_user_permissions,
+                                         ttl=float(
+                                             os.getenv('PERMISSION_CACHE_TTL',
+                                                       '60')))
+
+
+def check_permission(username, permission):
+    try:
+        return permission_resolver.has(username, permission)
+    except DB_ERRORS as e:
+        logger.error("Error checking permission: %s", e)
         return False
-    finally:
-        cursor.close()
 
 
 def add_customer(vendor_id, name, email, phone, id_number, license_number,
                  license_country, license_expiry, rating):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO customers (vendor_id, name, email, phone, id_number, license_number, license_country, license_expiry, rating) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        cursor.execute(
-            query, (vendor_id, name, email, phone, id_number, license_number,
-                    license_country, license_expiry, rating))
-        conn.commit()
-        print(f"Debug: Customer {name} added successfully")
-    except Exception as e:
-        logger.error(f"Error adding customer: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO customers (vendor_id, name, email, phone, id_number, license_number, license_country, license_expiry, rating) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id"
+            prepared_statements.execute(
+                cursor, query,
+                (vendor_id, name, email, phone, id_number, license_number,
+                 license_country, license_expiry, rating))
+            changes = _record_changes(cursor, 'insert', 'customers', vendor_id,
+                                      [cursor.fetchone()[0]])
+        change_feed.publish(changes)
+        _notify_write('customers', vendor_id)
+        logger.debug("Customer %s added successfully", name)
+    except DB_ERRORS as e:
+        logger.error("Error adding customer: %s", e)
 
 
 def get_customers(vendor_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM customers WHERE vendor_id = %s OR %s IS NULL"
-        cursor.execute(query, (vendor_id, vendor_id))
-        customers = cursor.fetchall()
-        return [dict(c) for c in customers
-                ] if db.is_postgres else [dict(c) for c in customers]
-    except Exception as e:
-        logger.error(f"Error getting customers: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            conditions, params = _tenant_filter('vendor_id', vendor_id)
+            cursor.execute("SELECT * FROM customers" + _where(conditions),
+                           params)
+            customers = cursor.fetchall()
+        return [dict(c) for c in customers]
+    except DB_ERRORS as e:
+        logger.error("Error getting customers: %s", e)
         return []
-    finally:
-        cursor.close()
+
+
+def customers_page_query(vendor_id, limit=None, after=None, fields=None):
+    conditions, params = _tenant_filter('vendor_id', vendor_id)
+    return _page_query('customers', fields, conditions, params, limit, after)
+
+
+def get_customers_page(vendor_id, limit=None, after=None, fields=None):
+    return _run_page(customers_page_query(vendor_id, limit, after, fields))
 
 
 def blacklist_customer(customer_id, blacklisted):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "UPDATE customers SET blacklisted = %s WHERE id = %s"
-        cursor.execute(query, (blacklisted, customer_id))
-        conn.commit()
-        print(f"Debug: Customer {customer_id} blacklist status updated")
-    except Exception as e:
-        logger.error(f"Error blacklisting customer: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "UPDATE customers SET blacklisted = %s WHERE id = %s RETURNING id, vendor_id"
+            cursor.execute(query, (blacklisted, customer_id))
+            row = cursor.fetchone()
+            changes = [] if row is None else _record_changes(
+                cursor, 'update', 'customers', row[1], [row[0]])
+        if row is not None:
+            change_feed.publish(changes)
+            _notify_write('customers', row[1])
+        logger.debug("Customer %s blacklist status updated", customer_id)
+    except DB_ERRORS as e:
+        logger.error("Error blacklisting customer: %s", e)
+
+
+# Financial reports (reporting.py) by tenant and date range; add_transaction
+# evicts the reports whose range covers the day it lands on.
+report_cache = ReportCache(max_entries=int(
+    os.getenv('REPORT_CACHE_MAX_ENTRIES', '256')),
+                           ttl=float(os.getenv('REPORT_CACHE_TTL', '300')))
+
+
+def _current_days():
+    """First and last of today's local and UTC dates.
+
+    CURRENT_TIMESTAMP is UTC on SQLite and session-local on Postgres, so a
+    transaction written now may be dated either.
+    """
+    local = datetime.date.today()
+    utc = datetime.datetime.now(datetime.timezone.utc).date()
+    return min(local, utc), max(local, utc)
+
+
+def _transaction_values(category, amount, vat_amount, account_id):
+    """Form values of a transaction as (amount, vat_amount, account_id);
+    raises ValueError for values the database would reject."""
+    if not category:
+        raise ValueError("category is required")
+    try:
+        return (float(amount), float(vat_amount or 0),
+                None if account_id in (None, '') else int(account_id))
+    except (TypeError, ValueError):
+        raise ValueError(
+            "amount and vat_amount must be numbers, account_id an integer"
+        ) from None
 
 
 def add_transaction(tenant_id,
@@ -623,196 +1774,302 @@ def add_transaction(tenant_id,
                     vat_amount=0,
                     account_id=None,
                     payment_type=None):
+    """Insert a transaction; returns False if the insert failed. Raises
+    ValueError for a transaction the database would reject."""
+    amount, vat_amount, account_id = _transaction_values(
+        category, amount, vat_amount, account_id)
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO transactions (tenant_id, category, amount, description, vat_amount, account_id, payment_type) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-        cursor.execute(query, (tenant_id, category, amount, description,
-                               vat_amount, account_id, payment_type))
-        conn.commit()
-        print(f"Debug: Transaction added successfully")
-    except Exception as e:
-        logger.error(f"Error adding transaction: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO transactions (tenant_id, category, amount, description, vat_amount, account_id, payment_type) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+            prepared_statements.execute(
+                cursor, query, (tenant_id, category, amount, description,
+                                vat_amount, account_id, payment_type))
+            if tenant_id is not None:
+                prepared_statements.execute(
+                    cursor, _TRANSACTION_REVENUE_UPSERT,
+                    (tenant_id, amount, vat_amount or 0))
+        report_cache.invalidate(tenant_id, *_current_days())
+        logger.debug("Transaction added successfully")
+        return True
+    except DB_ERRORS as e:
+        logger.error("Error adding transaction: %s", e)
+        return False
+
+
+_LEDGER_COLUMNS = ('ledger_id', 'tenant_id', 'category', 'amount',
+                   'description', 'vat_amount', 'account_id', 'payment_type',
+                   'date')
+_LEDGER_REVENUE_UPSERT = """INSERT INTO vendor_daily_revenue (vendor_id, day, transactions, transaction_amount, vat_amount)
+SELECT tenant_id, {transaction_day}, COUNT(*), SUM(amount), COALESCE(SUM(vat_amount), 0)
+FROM transactions WHERE tenant_id IS NOT NULL AND ledger_id IN ({ids}) GROUP BY 1, 2
+ON CONFLICT (vendor_id, day) DO UPDATE SET transactions = vendor_daily_revenue.transactions + excluded.transactions,
+transaction_amount = vendor_daily_revenue.transaction_amount + excluded.transaction_amount,
+vat_amount = vendor_daily_revenue.vat_amount + excluded.vat_amount"""
+
+
+def _ledger_date(entry):
+    return datetime.datetime.fromisoformat(
+        entry['date']).replace(tzinfo=datetime.timezone.utc)
+
+
+def _write_ledger_transactions(entries):
+    """Insert queued transactions in one transaction (LedgerWriter's
+    write_batch). Entries already inserted, found by ledger_id, are
+    skipped, so replaying a spool is harmless. Raises on failure."""
+    ids = [entry['ledger_id'] for entry in entries]
+    placeholders = ', '.join(['%s'] * len(ids))
+    with db.cursor() as cursor:
+        if not db.is_postgres:
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            f"SELECT ledger_id FROM transactions WHERE ledger_id IN ({placeholders})",
+            ids)
+        existing = {row[0] for row in cursor.fetchall()}
+        rows = []
+        for entry in entries:
+            if entry['ledger_id'] in existing:
+                continue
+            existing.add(entry['ledger_id'])
+            # An aware UTC datetime lands in Postgres' session time zone,
+            # like CURRENT_TIMESTAMP; SQLite stores UTC text
+            date = (_ledger_date(entry) if db.is_postgres else entry['date'])
+            rows.append(
+                tuple(entry[column]
+                      for column in _LEDGER_COLUMNS[:-1]) + (date, ))
+        if not rows:
+            return
+        insert = f"INSERT INTO transactions ({', '.join(_LEDGER_COLUMNS)}) VALUES "
+        if db.is_postgres:
+            extras.execute_values(cursor.raw,
+                                  insert + "%s",
+                                  rows,
+                                  page_size=len(rows))
+        else:
+            cursor.executemany(
+                insert + f"({', '.join(['%s'] * len(_LEDGER_COLUMNS))})", rows)
+        inserted = [row[0] for row in rows]
+        transaction_day = (_DASHBOARD_POSTGRES if db.is_postgres else
+                           _DASHBOARD_SQLITE)['transaction_day']
+        cursor.execute(
+            _LEDGER_REVENUE_UPSERT.format(
+                transaction_day=transaction_day,
+                ids=', '.join(['%s'] * len(inserted))), inserted)
+    days = {}
+    for entry in entries:
+        utc = _ledger_date(entry)
+        days.setdefault(entry['tenant_id'], set()).update(
+            (utc.date(), utc.astimezone().date()))
+    for tenant_id, tenant_days in days.items():
+        report_cache.invalidate(tenant_id, min(tenant_days), max(tenant_days))
+
+
+# Opt-in write-behind path for transactions (LEDGER_WRITE_BEHIND=1):
+# queue_transaction returns once the entry is spooled to LEDGER_SPOOL_DIR
+# and a background thread inserts queued entries in group commits.
+transaction_ledger = None
+_LEDGER_APPEND_TIMEOUT = float(os.getenv('LEDGER_APPEND_TIMEOUT', '5'))
+if os.getenv('LEDGER_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes'):
+    transaction_ledger = LedgerWriter(
+        _write_ledger_transactions,
+        spool_dir=os.getenv('LEDGER_SPOOL_DIR', 'ledger-spool') or None,
+        max_batch=int(os.getenv('LEDGER_MAX_BATCH', '500')),
+        max_delay=float(os.getenv('LEDGER_MAX_DELAY_MS', '50')) / 1000,
+        max_pending=int(os.getenv('LEDGER_MAX_PENDING', '100000')),
+        fsync=os.getenv('LEDGER_SPOOL_FSYNC',
+                        '1').lower() not in ('0', 'false', 'no'),
+        retryable=(DatabaseUnavailable, psycopg2.OperationalError,
+                   sqlite3.OperationalError))
+    atexit.register(transaction_ledger.close,
+                    float(os.getenv('LEDGER_CLOSE_TIMEOUT', '10')))
+
+
+def queue_transaction(tenant_id,
+                      category,
+                      amount,
+                      description,
+                      vat_amount=0,
+                      account_id=None,
+                      payment_type=None):
+    """add_transaction through transaction_ledger; returns the entry's
+    sequence number for transaction_ledger.flush(). Raises ValueError for
+    a transaction the database would reject, TimeoutError if the queue
+    stays full for LEDGER_APPEND_TIMEOUT seconds."""
+    if transaction_ledger is None:
+        raise RuntimeError("LEDGER_WRITE_BEHIND is not enabled")
+    amount, vat_amount, account_id = _transaction_values(
+        category, amount, vat_amount, account_id)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    entry = {
+        'ledger_id': uuid.uuid4().hex,
+        'tenant_id': tenant_id,
+        'category': category,
+        'amount': amount,
+        'description': description,
+        'vat_amount': vat_amount,
+        'account_id': account_id,
+        'payment_type': payment_type,
+        'date': now.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    return transaction_ledger.append(entry, timeout=_LEDGER_APPEND_TIMEOUT)
 
 
 def get_transactions(tenant_id, filters=None):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM transactions WHERE tenant_id = %s OR %s IS NULL"
-        params = [tenant_id, tenant_id]
-        if filters:
-            conditions = [f"{k} = %s" for k in filters.keys()]
-            query += " AND " + " AND ".join(conditions)
-            params.extend(filters.values())
-        cursor.execute(query, params)
-        transactions = cursor.fetchall()
-        return [dict(t) for t in transactions
-                ] if db.is_postgres else [dict(t) for t in transactions]
-    except Exception as e:
-        logger.error(f"Error getting transactions: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            conditions, params = _tenant_filter('tenant_id', tenant_id)
+            if filters:
+                conditions.extend(f"{k} = %s" for k in filters.keys())
+                params.extend(filters.values())
+            cursor.execute("SELECT * FROM transactions" + _where(conditions),
+                           params)
+            transactions = cursor.fetchall()
+        return [dict(t) for t in transactions]
+    except DB_ERRORS as e:
+        logger.error("Error getting transactions: %s", e)
         return []
-    finally:
-        cursor.close()
 
 
 def add_account(tenant_id, account_type, account_name):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO accounts (tenant_id, account_type, account_name) VALUES (%s, %s, %s)"
-        cursor.execute(query, (tenant_id, account_type, account_name))
-        conn.commit()
-        print(f"Debug: Account {account_name} added successfully")
-    except Exception as e:
-        logger.error(f"Error adding account: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO accounts (tenant_id, account_type, account_name) VALUES (%s, %s, %s)"
+            cursor.execute(query, (tenant_id, account_type, account_name))
+        logger.debug("Account %s added successfully", account_name)
+    except DB_ERRORS as e:
+        logger.error("Error adding account: %s", e)
 
 
 def get_accounts(tenant_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM accounts WHERE tenant_id = %s OR %s IS NULL"
-        cursor.execute(query, (tenant_id, tenant_id))
-        accounts = cursor.fetchall()
-        return [dict(a) for a in accounts
-                ] if db.is_postgres else [dict(a) for a in accounts]
-    except Exception as e:
-        logger.error(f"Error getting accounts: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            conditions, params = _tenant_filter('tenant_id', tenant_id)
+            cursor.execute("SELECT * FROM accounts" + _where(conditions),
+                           params)
+            accounts = cursor.fetchall()
+        return [dict(a) for a in accounts]
+    except DB_ERRORS as e:
+        logger.error("Error getting accounts: %s", e)
         return []
-    finally:
-        cursor.close()
 
 
 def add_pos_machine(tenant_id, serial_number, account_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO pos_machines (tenant_id, serial_number, account_id) VALUES (%s, %s, %s)"
-        cursor.execute(query, (tenant_id, serial_number, account_id))
-        conn.commit()
-        print(f"Debug: POS machine {serial_number} added successfully")
-    except Exception as e:
-        logger.error(f"Error adding POS machine: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO pos_machines (tenant_id, serial_number, account_id) VALUES (%s, %s, %s)"
+            cursor.execute(query, (tenant_id, serial_number, account_id))
+        logger.debug("POS machine %s added successfully", serial_number)
+    except DB_ERRORS as e:
+        logger.error("Error adding POS machine: %s", e)
 
 
 def get_pos_machines(tenant_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM pos_machines WHERE tenant_id = %s OR %s IS NULL"
-        cursor.execute(query, (tenant_id, tenant_id))
-        pos_machines = cursor.fetchall()
-        return [dict(p) for p in pos_machines
-                ] if db.is_postgres else [dict(p) for p in pos_machines]
-    except Exception as e:
-        logger.error(f"Error getting POS machines: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            conditions, params = _tenant_filter('tenant_id', tenant_id)
+            cursor.execute("SELECT * FROM pos_machines" + _where(conditions),
+                           params)
+            pos_machines = cursor.fetchall()
+        return [dict(p) for p in pos_machines]
+    except DB_ERRORS as e:
+        logger.error("Error getting POS machines: %s", e)
         return []
-    finally:
-        cursor.close()
 
 
 def add_language(code, name):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO languages (code, name) VALUES (%s, %s)"
-        cursor.execute(query, (code, name))
-        conn.commit()
-        print(f"Debug: Language {name} added successfully")
-    except Exception as e:
-        logger.error(f"Error adding language: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO languages (code, name) VALUES (%s, %s)"
+            cursor.execute(query, (code, name))
+        logger.debug("Language %s added successfully", name)
+    except DB_ERRORS as e:
+        logger.error("Error adding language: %s", e)
 
 
 def get_languages():
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM languages"
-        cursor.execute(query)
-        languages = cursor.fetchall()
-        return [dict(l) for l in languages
-                ] if db.is_postgres else [dict(l) for l in languages]
-    except Exception as e:
-        logger.error(f"Error getting languages: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            query = "SELECT * FROM languages"
+            cursor.execute(query)
+            languages = cursor.fetchall()
+        return [dict(l) for l in languages]
+    except DB_ERRORS as e:
+        logger.error("Error getting languages: %s", e)
         return [{'code': 'en', 'name': 'English'}]  # Default fallback
-    finally:
-        cursor.close()
 
 
 def add_translation(lang_code, key, value):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO translations (lang_code, key, value) VALUES (%s, %s, %s)"
-        cursor.execute(query, (lang_code, key, value))
-        conn.commit()
-        print(f"Debug: Translation for {key} added successfully")
-    except Exception as e:
-        logger.error(f"Error adding translation: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO translations (lang_code, key, value) VALUES (%s, %s, %s)"
+            cursor.execute(query, (lang_code, key, value))
+        translation_catalog.bump(lang_code)
+        logger.debug("Translation for %s added successfully", key)
+    except DB_ERRORS as e:
+        logger.error("Error adding translation: %s", e)
 
 
 def get_translations(lang_code):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor if db.
-                             is_postgres else None)
-        query = "SELECT * FROM translations WHERE lang_code = %s"
-        cursor.execute(query, (lang_code, ))
-        translations = cursor.fetchall()
-        return [dict(t) for t in translations
-                ] if db.is_postgres else [dict(t) for t in translations]
-    except Exception as e:
-        logger.error(f"Error getting translations: {e}")
+        with db.cursor(dict_rows=True) as cursor:
+            query = "SELECT * FROM translations WHERE lang_code = %s ORDER BY id"
+            cursor.execute(query, (lang_code, ))
+            translations = cursor.fetchall()
+        return [dict(t) for t in translations]
+    except DB_ERRORS as e:
+        logger.error("Error getting translations: %s", e)
         return []
-    finally:
-        cursor.close()
+
+
+# Translations change rarely; gettext lookups are served from this cache.
+# The TTL lets other worker processes pick up add_translation writes.
+translation_catalog = TranslationCatalog(
+    get_translations,
+    max_languages=int(os.getenv('TRANSLATION_CACHE_MAX_LANGUAGES', '16')),
+    ttl=float(os.getenv('TRANSLATION_CACHE_TTL', '300')))
 
 
 def add_vendor_detailed(name, city, branch, address, phone, email, website,
                         description, account_id):
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        query = "INSERT INTO vendors (name, city, branch, address, phone, email, website, description, account_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        cursor.execute(query, (name, city, branch, address, phone, email,
-                               website, description, account_id))
-        conn.commit()
-        print(f"Debug: Vendor {name} added with details successfully")
-    except Exception as e:
-        logger.error(f"Error adding vendor detailed: {e}")
-    finally:
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO vendors (name, city, branch, address, phone, email, website, description, account_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+            cursor.execute(query, (name, city, branch, address, phone, email,
+                                   website, description, account_id))
+        logger.debug("Vendor %s added with details successfully", name)
+    except DB_ERRORS as e:
+        logger.error("Error adding vendor detailed: %s", e)
 
 
 # Ensure these functions are exported
 __all__ = [
     'init_db', 'add_vendor', 'get_vendors', 'update_vendor', 'remove_vendor',
-    'add_car', 'get_cars', 'update_car', 'remove_car', 'add_booking',
-    'get_bookings', 'add_role', 'get_roles', 'check_permission',
-    'add_customer', 'get_customers', 'blacklist_customer', 'add_transaction',
-    'get_transactions', 'add_account', 'get_accounts', 'add_pos_machine',
-    'get_pos_machines', 'add_language', 'get_languages', 'add_translation',
-    'get_translations', 'add_vendor_detailed'
+    'add_car', 'get_cars', 'get_cars_page', 'cars_page_query', 'update_car',
+    'remove_car', 'rate_cache', 'fleet_state', 'get_fleet_board',
+    'change_feed', 'subscribe_changes', 'quote_cars', 'price_booking',
+    'PricingError', 'add_booking', 'get_bookings', 'get_bookings_page',
+    'bookings_page_query', 'get_available_cars', 'available_cars_query',
+    'check_booking_overlap', 'BookingConflictError', 'DatabaseUnavailable',
+    'DB_ERRORS', 'add_role', 'get_roles', 'add_user', 'check_permission',
+    'permission_resolver', 'add_customer', 'get_customers',
+    'get_customers_page', 'customers_page_query', 'blacklist_customer',
+    'add_transaction', 'queue_transaction', 'transaction_ledger',
+    'get_transactions', 'report_cache', 'add_account', 'get_accounts',
+    'add_pos_machine', 'get_pos_machines', 'add_language', 'get_languages',
+    'add_translation', 'get_translations', 'translation_catalog',
+    'register_write_listener', 'query_metrics', 'prepared_statements',
+    'record_car_status_changes', 'record_booking_revenue',
+    'rebuild_dashboard_aggregates', 'get_dashboard_summary',
+    'add_vendor_detailed'
 ]
 
-print("Debug: database.py fully loaded")
-
 if __name__ == "__main__":
-    Database.initialize()
-    # setup_tables()  # Use this for new setups
-    # migrate_vendors_table()  # Uncomment and run once if updating an existing schema
+    import sys
+    from log_config import configure_logging
+
+    configure_logging()
+    if sys.argv[1:] != ['migrate']:
+        sys.exit("usage: python database.py migrate")
+    try:
+        init_db()
+    except DatabaseUnavailable as e:
+        sys.exit(str(e))
@@ -0,0 +1,229 @@
+import json
+import re
+import time
+import sqlite3
+import datetime
+from decimal import Decimal
+from functools import lru_cache
+
+from psycopg2 import extras, extensions
+
+# psycopg2 applies %-formatting to the whole statement, quoted text
+# included, so the same two tokens are rewritten everywhere here.
+_PLACEHOLDER = re.compile(r"%%|%s")
+
+
+@lru_cache(maxsize=1024)
+def _to_qmark(sql):
+    return _PLACEHOLDER.sub(lambda m: '?' if m.group(0) == '%s' else '%', sql)
+
+
+class Dialect:
+    """Per-backend rules for turning the repo's %s-style SQL into a statement.
+
+    Helpers in database.py always write psycopg2-style SQL; the dialect
+    compiles it once for its backend and caches the result.
+    """
+    name = None
+
+    def compile(self, sql):
+        return sql
+
+    def cursor(self, conn, dict_rows=False, name=None):
+        return conn.cursor()
+
+    def register_adapters(self):
+        pass
+
+    def json(self, value):
+        """Wrap a dict/list so it can be bound to a JSON column."""
+        return value
+
+
+class PostgresDialect(Dialect):
+    name = 'postgresql'
+
+    def cursor(self, conn, dict_rows=False, name=None):
+        # A name makes psycopg2 declare a server-side cursor, so fetchmany
+        # pulls rows from the server in chunks instead of all at once.
+        factory = extras.RealDictCursor if dict_rows else None
+        return conn.cursor(name=name, cursor_factory=factory)
+
+    def register_adapters(self):
+        # dicts go into the JSONB columns (cars.rates, cars.features)
+        extensions.register_adapter(dict, extras.Json)
+
+    def json(self, value):
+        # lists would otherwise be adapted to ARRAY, not JSONB
+        return extras.Json(value)
+
+
+class SQLiteDialect(Dialect):
+    name = 'sqlite'
+
+    def compile(self, sql):
+        return _to_qmark(sql)
+
+    def cursor(self, conn, dict_rows=False, name=None):
+        # Connections are opened with row_factory=sqlite3.Row, which
+        # already supports dict(row), so no per-cursor factory is needed.
+        # sqlite3 cursors already step through results lazily, so `name`
+        # is ignored.
+        return conn.cursor()
+
+    def register_adapters(self):
+        sqlite3.register_adapter(Decimal, float)
+        sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+        sqlite3.register_adapter(datetime.datetime,
+                                 lambda value: value.isoformat(' '))
+        sqlite3.register_adapter(dict, json.dumps)
+        sqlite3.register_adapter(list, json.dumps)
+
+    def json(self, value):
+        return json.dumps(value)
+
+
+class DialectCursor:
+    """Thin cursor wrapper that compiles each statement for its dialect.
+
+    An optional `observer` (instrumentation.QueryMetrics) hears about every
+    statement: `start(sql)` when it is executed, then `finish()` with the
+    time spent executing and fetching it and its row count once the next
+    statement runs or the cursor is closed.
+    """
+    __slots__ = ('_cursor', '_dialect', '_observer', '_pending')
+
+    def __init__(self, cursor, dialect, observer=None):
+        self._cursor = cursor
+        self._dialect = dialect
+        self._observer = observer
+        self._pending = None  # [token, seconds, rows fetched] of last statement
+
+    def _finish(self, failed=False):
+        token, seconds, rows = self._pending
+        self._pending = None
+        if rows is None:
+            rows = max(self._cursor.rowcount, 0)
+        self._observer.finish(token, seconds, rows, failed)
+
+    def _observe(self, sql, method, args):
+        if self._pending is not None:
+            self._finish()
+        token = self._observer.start(sql)
+        started = time.perf_counter()
+        try:
+            result = method(*args)
+        except Exception:
+            self._pending = [token, time.perf_counter() - started, 0]
+            self._finish(failed=True)
+            raise
+        self._pending = [token, time.perf_counter() - started, None]
+        return result
+
+    def _fetched(self, started, rows):
+        pending = self._pending
+        if pending is None:
+            return
+        pending[1] += time.perf_counter() - started
+        pending[2] = (pending[2] or 0) + rows
+
+    def execute(self, sql, params=None):
+        compiled = self._dialect.compile(sql)
+        args = (compiled, ) if params is None else (compiled, params)
+        if self._observer is None:
+            return self._cursor.execute(*args)
+        return self._observe(sql, self._cursor.execute, args)
+
+    def executemany(self, sql, seq_of_params):
+        args = (self._dialect.compile(sql), seq_of_params)
+        if self._observer is None:
+            return self._cursor.executemany(*args)
+        return self._observe(sql, self._cursor.executemany, args)
+
+    def execute_compiled(self, sql, compiled, params=None, many=False):
+        """Run backend-ready `compiled` in place of `sql`, which is what
+        the observer records, e.g. an EXECUTE of a prepared `sql`."""
+        method = self._cursor.executemany if many else self._cursor.execute
+        args = (compiled, ) if params is None else (compiled, params)
+        if self._observer is None:
+            return method(*args)
+        return self._observe(sql, method, args)
+
+    def fetchone(self):
+        if self._pending is None:
+            return self._cursor.fetchone()
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        if size is None:
+            rows = self._cursor.fetchmany()
+        else:
+            rows = self._cursor.fetchmany(size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def close(self):
+        if self._pending is not None:
+            self._finish()
+        self._cursor.close()
+
+    def __iter__(self):
+        if self._pending is None:
+            return iter(self._cursor)
+        return self._iter_observed()
+
+    def _iter_observed(self):
+        rows = iter(self._cursor)
+        while True:
+            started = time.perf_counter()
+            row = next(rows, None)
+            if row is None:
+                return
+            self._fetched(started, 1)
+            yield row
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def raw(self):
+        return self._cursor
+
+    @property
+    def dialect(self):
+        return self._dialect
+
+
+class AsyncpgDialect(Dialect):
+    """Postgres through asyncpg, which expects numbered $1..$n parameters."""
+    name = 'asyncpg'
+
+    def compile(self, sql):
+        return _to_numbered(sql)
+
+
+@lru_cache(maxsize=1024)
+def _to_numbered(sql):
+    counter = iter(range(1, sql.count('%s') + 1))
+    return _PLACEHOLDER.sub(
+        lambda m: f'${next(counter)}' if m.group(0) == '%s' else '%', sql)
+
+
+POSTGRES = PostgresDialect()
+SQLITE = SQLiteDialect()
+ASYNCPG = AsyncpgDialect()
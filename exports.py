@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+import uuid
+import datetime
+import logging
+
+from database import db, _tenant_filter, _where
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 2000
+
+# Exportable tables: tenant column and the date column used for range filters
+EXPORTS = {
+    'bookings': ('vendor_id', 'start_date'),
+    'transactions': ('tenant_id', 'date'),
+}
+
+
+def iter_export_rows(table,
+                     tenant_id,
+                     start_date=None,
+                     end_date=None,
+                     batch_size=EXPORT_BATCH_SIZE):
+    """Yield the column names, then every matching row as a tuple.
+
+    Rows come from a server-side cursor on Postgres and from fetchmany()
+    on SQLite, so only `batch_size` rows are held in memory at a time.
+    `start_date` and `end_date` are inclusive dates.
+    """
+    tenant_column, date_column = EXPORTS[table]
+    conditions, params = _tenant_filter(tenant_column, tenant_id)
+    if start_date is not None:
+        conditions.append(f"{date_column} >= %s")
+        params.append(start_date.isoformat())
+    if end_date is not None:
+        conditions.append(f"{date_column} < %s")
+        params.append((end_date + datetime.timedelta(days=1)).isoformat())
+    query = f"SELECT * FROM {table}{_where(conditions)} ORDER BY {date_column}, id"
+    with db.cursor(name=f"export_{uuid.uuid4().hex}") as cursor:
+        cursor.execute(query, params)
+        # Named cursors only report a description after the first fetch
+        rows = cursor.fetchmany(batch_size)
+        yield [column[0] for column in cursor.description]
+        while rows:
+            yield from rows
+            rows = cursor.fetchmany(batch_size)
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_chunks(rows, chunk_rows=500):
+    """Encode iter_export_rows() output as CSV text, a few hundred rows per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, chunk_rows=500):
+    """Encode iter_export_rows() output as one JSON object per line."""
+    rows = iter(rows)
+    columns = next(rows)
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), default=_jsonable))
+        if len(lines) >= chunk_rows:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def export_stream(table, tenant_id, fmt, start_date=None, end_date=None):
+    """Return a generator of text chunks for a streaming HTTP response."""
+    rows = iter_export_rows(table, tenant_id, start_date, end_date)
+    chunks = csv_chunks(rows) if fmt == 'csv' else ndjson_chunks(rows)
+
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            # Headers are already sent; all we can do is stop the stream
+            logger.error("Error exporting %s: %s", table, e)
+        finally:
+            # Closing early (client went away) must still hand the pooled
+            # connection back, which happens when `rows` is closed.
+            chunks.close()
+            rows.close()
+
+    return generate()
@@ -0,0 +1,302 @@
+import bisect
+import datetime
+import logging
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+FLEET_STATES = ('Available', 'Rented', 'Maintenance', 'Unknown')
+
+
+def car_state(status, rented):
+    """Fleet state of a car from its `status` column and whether one of
+    its bookings covers today.
+
+    Maintenance wins over a booking; a booking makes an Available car
+    Rented; a car marked Rented by hand stays Rented without one.
+    """
+    if status == 'Maintenance':
+        return 'Maintenance'
+    if rented or status == 'Rented':
+        return 'Rented'
+    if status == 'Available':
+        return 'Available'
+    return 'Unknown'
+
+
+def _day(value):
+    """A date from a date, datetime or ISO string (SQLite stores text)."""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def _car_id(value):
+    """Car ids arrive from forms as strings; the view is keyed by ints."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class _Car:
+    __slots__ = ('status', 'bookings', 'state')
+
+    def __init__(self, status):
+        self.status = status
+        self.bookings = []  # sorted [start, end) days not yet over
+        self.state = None
+
+
+class _View:
+    """One vendor's cars and their states as of `day`."""
+
+    def __init__(self, day):
+        self.day = day
+        self.cars = {}  # car_id -> _Car
+        self.counts = Counter()
+        self.loaded_at = time.monotonic()
+
+    def settle(self, car_id, car):
+        """Drop finished bookings and recompute the car's state.
+
+        Returns (old, new) when the state changed, else None.
+        """
+        bookings = car.bookings
+        while bookings and bookings[0][1] <= self.day:
+            bookings.pop(0)
+        # Bookings of a car never overlap, so only the first can be current
+        rented = bool(bookings) and bookings[0][0] <= self.day
+        old, new = car.state, car_state(car.status, rented)
+        if old == new:
+            return None
+        if old is not None:
+            self.counts[old] -= 1
+        self.counts[new] += 1
+        car.state = new
+        return old, new
+
+    def remove(self, car_id):
+        car = self.cars.pop(car_id, None)
+        if car is not None and car.state is not None:
+            self.counts[car.state] -= 1
+
+
+class FleetState:
+    """Per-vendor in-memory view of which cars are available, rented or in
+    maintenance today.
+
+    `loader(vendor_id, day)` returns (cars, bookings): (car_id, status)
+    for each of the vendor's cars (every car for vendor None) and
+    (car_id, start_date, end_date) for each booking not over by `day`.
+    A view is loaded on first read and then kept current by the write
+    helpers: `car_changed`, `car_removed` and `booking_added` update one
+    car in place, and `invalidate` drops a vendor's view for writes that
+    cannot be applied that way (new cars, bulk imports).
+
+    Bookings are half-open [start_date, end_date) like the overlap check,
+    so a car flips to Rented on its start date and back on its end date.
+    `sweep()` moves every view to today's date; the thread started by
+    `start()` calls it every `sweep_interval` seconds, and a read that
+    finds its view a day behind sweeps it first. `ttl` (seconds,
+    optional) reloads views to pick up writes made by other worker
+    processes.
+    """
+
+    def __init__(self,
+                 loader,
+                 ttl=None,
+                 sweep_interval=60.0,
+                 today=datetime.date.today):
+        self._loader = loader
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._today = today
+        self._lock = threading.Lock()
+        self._views = {}  # vendor_id (None: all vendors) -> _View
+        self._generation = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self.loads = 0
+        self.hits = 0
+        self.transitions = 0
+        self.sweeps = 0
+
+    def start(self):
+        """Start the sweep thread; called by the first read."""
+        with self._lock:
+            if self._thread is not None or not self.sweep_interval:
+                return
+            self._thread = threading.Thread(target=self._run,
+                                            name='fleet-sweep',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error("Fleet state sweep failed: %s", e)
+
+    # Reads
+
+    def _view(self, vendor_id):
+        if self._thread is None:
+            self.start()
+        today = self._today()
+        with self._lock:
+            view = self._views.get(vendor_id)
+            if view is not None and (self.ttl is None or time.monotonic() -
+                                     view.loaded_at < self.ttl):
+                if view.day != today:
+                    self._advance(vendor_id, view, today)
+                self.hits += 1
+                return view
+            generation = self._generation
+        view = self._load(vendor_id, today)
+        with self._lock:
+            # Keep the load only if no write landed while it ran
+            if generation == self._generation:
+                self._views[vendor_id] = view
+            self.loads += 1
+        return view
+
+    def _load(self, vendor_id, today):
+        cars, bookings = self._loader(vendor_id, today)
+        view = _View(today)
+        for car_id, status in cars:
+            view.cars[car_id] = _Car(status)
+        for car_id, start_date, end_date in bookings:
+            car = view.cars.get(car_id)
+            start, end = _day(start_date), _day(end_date)
+            if car is not None and start is not None and end is not None:
+                car.bookings.append((start, end))
+        for car_id, car in view.cars.items():
+            car.bookings.sort()
+            view.settle(car_id, car)
+        return view
+
+    def board(self, vendor_id):
+        """Return {'day', 'counts', 'cars': {car_id: state}} for a vendor."""
+        view = self._view(vendor_id)
+        with self._lock:
+            return {
+                'day': view.day.isoformat(),
+                'counts': {
+                    state: view.counts[state]
+                    for state in FLEET_STATES
+                },
+                'cars': {
+                    car_id: car.state
+                    for car_id, car in view.cars.items()
+                },
+            }
+
+    def state(self, vendor_id, car_id):
+        """Fleet state of one car, or None if the vendor has no such car."""
+        view = self._view(vendor_id)
+        with self._lock:
+            car = view.cars.get(_car_id(car_id))
+            return None if car is None else car.state
+
+    # Writes; each updates the vendor's view and the all-vendor view
+
+    def _views_of(self, vendor_id):
+        self._generation += 1
+        for key in {vendor_id, None}:
+            view = self._views.get(key)
+            if view is not None:
+                yield view
+
+    def car_changed(self, vendor_id, car_id, status):
+        """Record a car's new `status` (update_car)."""
+        car_id = _car_id(car_id)
+        with self._lock:
+            for view in self._views_of(vendor_id):
+                car = view.cars.get(car_id)
+                if car is None:
+                    car = view.cars[car_id] = _Car(status)
+                car.status = status
+                self._record(view.settle(car_id, car))
+
+    def car_removed(self, vendor_id, car_id):
+        car_id = _car_id(car_id)
+        with self._lock:
+            for view in self._views_of(vendor_id):
+                view.remove(car_id)
+
+    def booking_added(self, vendor_id, car_id, start_date, end_date):
+        """Record a new booking of `car_id` for [start_date, end_date)."""
+        try:
+            booking = (_day(start_date), _day(end_date))
+        except ValueError:
+            self.invalidate(vendor_id)
+            return
+        car_id = _car_id(car_id)
+        with self._lock:
+            for view in self._views_of(vendor_id):
+                car = view.cars.get(car_id)
+                if car is None or booking[1] <= view.day:
+                    continue
+                bisect.insort(car.bookings, booking)
+                self._record(view.settle(car_id, car))
+
+    def invalidate(self, vendor_id=None):
+        """Reload a vendor's view on next read, or every view when no
+        vendor is given."""
+        with self._lock:
+            self._generation += 1
+            if vendor_id is None:
+                self._views.clear()
+            else:
+                self._views.pop(vendor_id, None)
+                self._views.pop(None, None)
+
+    # Date boundaries
+
+    def sweep(self):
+        """Move every view to today; return how many cars changed state."""
+        today = self._today()
+        with self._lock:
+            before = self.transitions
+            for vendor_id, view in self._views.items():
+                if view.day != today:
+                    self._advance(vendor_id, view, today)
+            self.sweeps += 1
+            return self.transitions - before
+
+    def _advance(self, vendor_id, view, today):
+        view.day = today
+        changed = 0
+        for car_id, car in view.cars.items():
+            if self._record(view.settle(car_id, car)):
+                changed += 1
+        logger.debug("Fleet of vendor %s moved to %s: %s cars changed state",
+                     vendor_id, today, changed)
+
+    def _record(self, transition):
+        if transition is not None and transition[0] is not None:
+            self.transitions += 1
+            return True
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'vendors': len(self._views),
+                'cars': sum(len(view.cars) for view in self._views.values()),
+                'loads': self.loads,
+                'hits': self.hits,
+                'transitions': self.transitions,
+                'sweeps': self.sweeps,
+            }
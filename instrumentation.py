@@ -0,0 +1,277 @@
+import re
+import sys
+import hashlib
+import logging
+import threading
+import contextlib
+from functools import lru_cache
+
+import dialect
+import prepared
+
+slow_query_logger = logging.getLogger(__name__ + '.slow_queries')
+
+# Upper bounds (seconds) of the latency histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1.0, 2.5, 5.0, 10.0)
+
+# Frames in these files are plumbing, never the helper that ran a query
+_PLUMBING = {
+    dialect.__file__, prepared.__file__, __file__, contextlib.__file__
+}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"%s|\?|\$\d+")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Return (id, normalized text) for a statement.
+
+    Literals and placeholders become `?` and value lists collapse to
+    `(...)`, so statements that differ only in their parameters share one
+    fingerprint.
+    """
+    text = _WHITESPACE.sub(' ', sql).strip()
+    text = _STRING_LITERAL.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _PLACEHOLDERS.sub('?', text)
+    text = _VALUE_LIST.sub('(...)', text)
+    return hashlib.sha1(text.encode()).hexdigest()[:12], text
+
+
+def calling_helper():
+    """Name the public function that issued the current query.
+
+    Walks up from the cursor call, skipping plumbing frames and private
+    functions (_run_page, BulkImporter._flush, ...), and returns a name
+    like `database.get_cars_page`.
+    """
+    frame = sys._getframe(1)
+    fallback = None
+    for _ in range(16):
+        if frame is None:
+            break
+        code = frame.f_code
+        if code.co_filename not in _PLUMBING:
+            name = getattr(code, 'co_qualname', code.co_name)
+            name = f"{frame.f_globals.get('__name__')}.{name}"
+            if code.co_name[0] not in '_<':
+                return name
+            if fallback is None:
+                fallback = name
+        frame = frame.f_back
+    return fallback or 'unknown'
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"',
+                                                   r'\"').replace('\n', r'\n')
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'count', 'sum')
+
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def render(self, name, labels=''):
+        bucket_labels = labels + ',' if labels else ''
+        suffix = f'{{{labels}}}' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS, self.buckets):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{bucket_labels}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{bucket_labels}le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{suffix} {self.sum}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+
+
+class _QueryStats:
+    __slots__ = ('duration', 'rows', 'errors', 'slow')
+
+    def __init__(self):
+        self.duration = _Histogram()
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+
+
+class QueryMetrics:
+    """Per-helper, per-statement timing collected from DialectCursor.
+
+    Used as a DialectCursor observer: `start(sql)` runs when a statement
+    is executed and `finish(...)` once its rows have been fetched, so the
+    duration covers both. Statements slower than `slow_query_ms` are also
+    written to the `instrumentation.slow_queries` log. `on_checkout` is
+    the ConnectionPool hook for time spent waiting on a connection.
+    """
+
+    def __init__(self, slow_query_ms=200.0):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._queries = {}  # (helper, fingerprint id) -> _QueryStats
+        self._statements = {}  # fingerprint id -> normalized text
+        self._checkout_wait = _Histogram()
+
+    def start(self, sql):
+        return calling_helper(), sql
+
+    def finish(self, token, seconds, rows, failed=False):
+        helper, sql = token
+        fingerprint_id, text = fingerprint(sql)
+        slow = (self.slow_query_ms is not None
+                and seconds * 1000 >= self.slow_query_ms)
+        with self._lock:
+            stats = self._queries.get((helper, fingerprint_id))
+            if stats is None:
+                stats = self._queries[(helper, fingerprint_id)] = _QueryStats()
+                self._statements[fingerprint_id] = text
+            stats.duration.observe(seconds)
+            stats.rows += rows
+            stats.errors += failed
+            stats.slow += slow
+        if slow:
+            slow_query_logger.warning(
+                "Slow query (%.1f ms, %s rows) in %s: %s", seconds * 1000,
+                rows, helper, text)
+
+    def on_checkout(self, waited):
+        with self._lock:
+            self._checkout_wait.observe(waited)
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._statements.clear()
+            self._checkout_wait = _Histogram()
+
+    def summary(self):
+        """Per-helper totals, busiest first, for quick inspection."""
+        helpers = {}
+        with self._lock:
+            for (helper, _), stats in self._queries.items():
+                total = helpers.setdefault(
+                    helper, {
+                        'queries': 0,
+                        'seconds': 0.0,
+                        'rows': 0,
+                        'errors': 0,
+                        'slow': 0
+                    })
+                total['queries'] += stats.duration.count
+                total['seconds'] += stats.duration.sum
+                total['rows'] += stats.rows
+                total['errors'] += stats.errors
+                total['slow'] += stats.slow
+        return dict(
+            sorted(helpers.items(), key=lambda item: -item[1]['seconds']))
+
+    def render_prometheus(self, pool_stats=None, prepared_stats=None):
+        """Return all metrics in the Prometheus text exposition format."""
+        duration = [
+            '# HELP rentmaster_db_query_duration_seconds Time spent '
+            'executing statements and fetching their rows.',
+            '# TYPE rentmaster_db_query_duration_seconds histogram'
+        ]
+        rows = [
+            '# HELP rentmaster_db_query_rows_total Rows returned or '
+            'affected by statements.',
+            '# TYPE rentmaster_db_query_rows_total counter'
+        ]
+        errors = [
+            '# HELP rentmaster_db_query_errors_total Statements that '
+            'raised an error.',
+            '# TYPE rentmaster_db_query_errors_total counter'
+        ]
+        slow = [
+            '# HELP rentmaster_db_slow_queries_total Statements slower '
+            'than the slow query threshold.',
+            '# TYPE rentmaster_db_slow_queries_total counter'
+        ]
+        statements = [
+            '# HELP rentmaster_db_statement_info Normalized text '
+            'of each statement fingerprint.',
+            '# TYPE rentmaster_db_statement_info gauge'
+        ]
+        with self._lock:
+            for (helper,
+                 fingerprint_id), stats in sorted(self._queries.items()):
+                labels = f'helper="{_label(helper)}",fingerprint="{fingerprint_id}"'
+                duration.extend(
+                    stats.duration.render(
+                        'rentmaster_db_query_duration_seconds', labels))
+                rows.append(f'rentmaster_db_query_rows_total{{{labels}}} '
+                            f'{stats.rows}')
+                errors.append(f'rentmaster_db_query_errors_total{{{labels}}} '
+                              f'{stats.errors}')
+                slow.append(f'rentmaster_db_slow_queries_total{{{labels}}} '
+                            f'{stats.slow}')
+            for fingerprint_id, text in sorted(self._statements.items()):
+                statements.append(
+                    f'rentmaster_db_statement_info{{fingerprint="{fingerprint_id}",'
+                    f'statement="{_label(text)}"}} 1')
+            checkout = [
+                '# HELP rentmaster_db_pool_checkout_wait_seconds '
+                'Time spent waiting for a pooled connection.',
+                '# TYPE rentmaster_db_pool_checkout_wait_seconds '
+                'histogram'
+            ]
+            checkout.extend(
+                self._checkout_wait.render(
+                    'rentmaster_db_pool_checkout_wait_seconds'))
+        lines = duration + rows + errors + slow + statements + checkout
+        if pool_stats:
+            lines.extend(_render_pool(pool_stats))
+        if prepared_stats:
+            lines.extend(_render_prepared(prepared_stats))
+        return "\n".join(lines) + "\n"
+
+
+def _render_pool(stats):
+    backend = _label(stats.get('backend', ''))
+    lines = []
+    for key in ('size', 'in_use', 'idle', 'waiting', 'max_size'):
+        name = f'rentmaster_db_pool_{key}'
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{{backend="{backend}"}} {stats[key]}')
+    for key in ('checkouts', 'timeouts', 'discarded'):
+        name = f'rentmaster_db_pool_{key}_total'
+        lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{{backend="{backend}"}} {stats[key]}')
+    return lines
+
+
+def _render_prepared(stats):
+    lines = [
+        '# HELP rentmaster_db_prepared_executions_total Executions of '
+        'prepared statements, by whether they had to PREPARE first.',
+        '# TYPE rentmaster_db_prepared_executions_total counter',
+        f'rentmaster_db_prepared_executions_total{{result="hit"}} '
+        f'{stats["hits"]}',
+        f'rentmaster_db_prepared_executions_total{{result="prepare"}} '
+        f'{stats["prepares"]}',
+        f'rentmaster_db_prepared_executions_total{{result="passthrough"}} '
+        f'{stats["passthrough"]}'
+    ]
+    for key in ('statements', 'connections'):
+        name = f'rentmaster_db_prepared_{key}'
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {stats[key]}')
+    return lines
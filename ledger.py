@@ -0,0 +1,354 @@
+import os
+import glob
+import json
+import time
+import fcntl
+import logging
+import threading
+from collections import deque, OrderedDict
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+# Rejected entries remembered for flush(seq) to report
+_REJECTED_KEPT = 1000
+
+
+class LedgerError(Exception):
+    """Raised by flush(seq) when that entry was rejected by the database."""
+
+
+class LedgerClosed(Exception):
+    """Raised when appending to a ledger that has been closed."""
+
+
+class LedgerWriter:
+    """Write-behind queue that commits entries in groups.
+
+    `append(entry)` queues a JSON-serializable dict and returns its
+    sequence number straight away. A background thread hands queued
+    entries to `write_batch(entries)`, which must commit them in one
+    transaction, once `max_batch` are waiting or the oldest has waited
+    `max_delay` seconds. Exceptions of the `retryable` types leave the
+    batch queued and are retried with backoff. Any other exception
+    rejects the entries that fail on their own; the rest are written.
+
+    With `spool_dir`, each entry is appended to a spool file before
+    append() returns, and the file is fsynced when `fsync` is set. Spool
+    files stay locked while their process is alive. A new writer
+    replays the files left by dead processes, so `write_batch` must be
+    idempotent, e.g. keyed on an id carried in the entry.
+
+    `flush(seq)` commits without waiting for the window and blocks until
+    entry `seq` (default: everything appended so far) is written.
+    """
+
+    def __init__(self,
+                 write_batch,
+                 spool_dir=None,
+                 max_batch=500,
+                 max_delay=0.05,
+                 max_pending=100_000,
+                 retryable=(),
+                 fsync=True,
+                 segment_entries=10_000,
+                 max_retry_delay=30.0):
+        self._write_batch = write_batch
+        self.spool_dir = spool_dir
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.retryable = tuple(retryable)
+        self.fsync = fsync
+        self.segment_entries = segment_entries
+        self.max_retry_delay = max_retry_delay
+
+        self._cond = threading.Condition(threading.Lock())
+        self._queue = deque()  # (seq, entry, queued_at)
+        self._last_seq = 0
+        self._done_seq = 0
+        self._flush_seq = 0
+        self._thread = None
+        self._closed = False
+        self._rejected = OrderedDict()  # seq -> error message
+        # Spool segments: [file, last seq in it]; the last is written to
+        self._segments = []
+        self._segment_count = 0
+        self._segment_serial = 0
+        self._token = os.urandom(4).hex()  # tells writers in one process apart
+
+        self.written = 0
+        self.rejected = 0
+        self.batches = 0
+        self.failures = 0
+
+    def start(self):
+        """Replay orphaned spool files and start the writer thread.
+
+        Called by the first append(); safe to call more than once.
+        """
+        with self._cond:
+            if self._thread is not None:
+                return
+            if self._closed:
+                raise LedgerClosed("Ledger is closed")
+            if self.spool_dir is not None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._open_segment()
+                replayed = self._replay_orphans()
+                if replayed:
+                    logger.warning("Replaying %s spooled ledger entries",
+                                   replayed)
+            self._thread = threading.Thread(target=self._run,
+                                            name='ledger-writer',
+                                            daemon=True)
+            self._thread.start()
+
+    def append(self, entry, timeout=None):
+        """Queue `entry` and return its sequence number.
+
+        Blocks while `max_pending` entries are queued (the database is
+        down or falling behind), raising TimeoutError after `timeout`.
+        """
+        if self._thread is None:
+            self.start()
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while len(self._queue) >= self.max_pending and not self._closed:
+                remaining = (None if deadline is None else deadline -
+                             time.monotonic())
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(
+                        f"Ledger queue is full ({self.max_pending} entries)")
+                self._cond.wait(remaining)
+            if self._closed:
+                raise LedgerClosed("Ledger is closed")
+            return self._enqueue(entry, line)
+
+    def _enqueue(self, entry, line):
+        self._last_seq += 1
+        seq = self._last_seq
+        if self._segments:
+            self._spool(line, seq)
+        self._queue.append((seq, entry, time.monotonic()))
+        if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+            self._cond.notify_all()
+        return seq
+
+    def flush(self, seq=None, timeout=None):
+        """Write now and wait for `seq`; False if `timeout` ran out.
+
+        Raises LedgerError if the database rejected that entry.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            seq = self._last_seq if seq is None else seq
+            if seq > self._flush_seq:
+                self._flush_seq = seq
+                self._cond.notify_all()
+            while self._done_seq < seq:
+                remaining = (None if deadline is None else deadline -
+                             time.monotonic())
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            if seq in self._rejected:
+                raise LedgerError(self._rejected[seq])
+        return True
+
+    def close(self, timeout=None):
+        """Stop accepting entries, write what is queued and stop.
+
+        Entries still queued when `timeout` runs out stay in the spool
+        for the next writer to replay.
+        """
+        with self._cond:
+            self._closed = True
+            self._flush_seq = self._last_seq
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            if not self._queue:
+                for f, _ in self._segments:
+                    os.unlink(f.name)
+                    f.close()
+                self._segments.clear()
+
+    # Writer thread
+
+    def _run(self):
+        retry_delay = self.max_delay or 0.05
+        while True:
+            with self._cond:
+                batch = self._next_batch()
+            if batch is None:
+                return
+            processed = self._write(batch)
+            with self._cond:
+                for _ in range(processed):
+                    self._queue.popleft()
+                if processed:
+                    self._done_seq = batch[processed - 1][0]
+                    self._release_segments()
+                    self._cond.notify_all()
+            if processed == len(batch):
+                retry_delay = self.max_delay or 0.05
+                continue
+            if self._closed and self._segments:
+                logger.warning(
+                    "Ledger closed with %s entries left in the "
+                    "spool", len(self._queue))
+                return
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, self.max_retry_delay)
+
+    def _next_batch(self):
+        """Wait for a full batch, the window to pass or a flush."""
+        while not self._queue:
+            if self._closed:
+                return None
+            self._cond.wait()
+        deadline = self._queue[0][2] + self.max_delay
+        while (len(self._queue) < self.max_batch
+               and self._flush_seq < self._queue[0][0] and not self._closed):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+        return list(islice(self._queue, self.max_batch))
+
+    def _write(self, batch):
+        """Write `batch`; return how many leading entries are done."""
+        try:
+            self._write_batch([entry for _, entry, _ in batch])
+        except self.retryable as e:
+            self.failures += 1
+            logger.error("Ledger write of %s entries failed, will retry: %s",
+                         len(batch), e)
+            return 0
+        except Exception as e:
+            if len(batch) == 1:
+                self._reject(batch[0], e)
+                return 1
+            logger.warning(
+                "Ledger batch failed, writing entries one by one: "
+                "%s", e)
+            return self._write_each(batch)
+        self.batches += 1
+        self.written += len(batch)
+        return len(batch)
+
+    def _write_each(self, batch):
+        for done, item in enumerate(batch):
+            try:
+                self._write_batch([item[1]])
+            except self.retryable as e:
+                self.failures += 1
+                logger.error("Ledger write failed, will retry: %s", e)
+                return done
+            except Exception as e:
+                self._reject(item, e)
+            else:
+                self.batches += 1
+                self.written += 1
+        return len(batch)
+
+    def _reject(self, item, error):
+        seq, entry, _ = item
+        logger.error("Ledger entry rejected: %s: %s", error, entry)
+        self.rejected += 1
+        with self._cond:
+            self._rejected[seq] = str(error)
+            while len(self._rejected) > _REJECTED_KEPT:
+                self._rejected.popitem(last=False)
+        if self.spool_dir is not None:
+            path = os.path.join(self.spool_dir, 'ledger-rejected.jsonl')
+            with open(path, 'a') as f:
+                f.write(
+                    json.dumps({
+                        'error': str(error),
+                        'entry': entry
+                    }) + '\n')
+
+    # Spool files
+
+    def _open_segment(self):
+        self._segment_serial += 1
+        path = os.path.join(
+            self.spool_dir,
+            f"ledger-{os.getpid()}-{self._token}-{self._segment_serial}.spool")
+        f = open(path, 'a')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        self._segments.append([f, self._last_seq])
+        self._segment_count = 0
+
+    def _spool(self, line, seq):
+        if self._segment_count >= self.segment_entries:
+            self._open_segment()
+        segment = self._segments[-1]
+        segment[0].write(line)
+        segment[0].flush()
+        if self.fsync:
+            os.fsync(segment[0].fileno())
+        segment[1] = seq
+        self._segment_count += 1
+
+    def _release_segments(self):
+        """Delete spool segments whose entries are all written."""
+        while len(self._segments) > 1 or (self._segments and not self._queue):
+            f, last_seq = self._segments[0]
+            if last_seq > self._done_seq:
+                return
+            if len(self._segments) == 1:
+                # Empty the file being written to instead of replacing it
+                f.truncate(0)
+                self._segment_count = 0
+                return
+            self._segments.pop(0)
+            os.unlink(f.name)
+            f.close()
+
+    def _replay_orphans(self):
+        """Queue the entries of spool files no live process holds."""
+        own = {segment[0].name for segment in self._segments}
+        replayed = 0
+        for path in sorted(
+                glob.glob(os.path.join(self.spool_dir, 'ledger-*.spool'))):
+            if path in own:
+                continue
+            try:
+                f = open(path, 'r+')
+            except FileNotFoundError:
+                continue  # replayed by another process meanwhile
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # its process is alive
+                for line in f:
+                    line = line.rstrip('\n') + '\n'
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A write torn by the crash; it was never acked
+                        logger.warning("Skipping unreadable spool line in %s",
+                                       path)
+                        continue
+                    self._enqueue(entry, line)
+                    replayed += 1
+                os.unlink(path)
+        return replayed
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queued': len(self._queue),
+                'written': self.written,
+                'rejected': self.rejected,
+                'batches': self.batches,
+                'failures': self.failures,
+                'spool_segments': len(self._segments),
+            }
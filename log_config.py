@@ -0,0 +1,129 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+_listener = None
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None,
+                                                 None))) | {'message'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, extras."""
+
+    def format(self, record):
+        ts = datetime.datetime.fromtimestamp(record.created,
+                                             datetime.timezone.utc)
+        entry = {
+            'ts': ts.isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Pass everything at `level` and above, and `rate` of what is below."""
+
+    def __init__(self, level, rate):
+        super().__init__()
+        self.level = level
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= self.level or random.random() < self.rate
+
+
+class _QueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler fully formats each record on the calling thread;
+    here only the message is interpolated (so mutable arguments are
+    captured as they were) and the traceback is rendered to text.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level=None, json_format=None, debug_sample_rate=None):
+    """Route all logging through a queue to a background writer thread.
+
+    Defaults come from the environment: LOG_LEVEL (WARNING), LOG_FORMAT
+    ('json' or 'text', default json) and LOG_DEBUG_SAMPLE_RATE (0.0), the
+    fraction of records below LOG_LEVEL to keep anyway. With no sampling
+    the root logger sits at LOG_LEVEL, so a disabled logger.debug() call
+    returns before its arguments are formatted. An unknown level falls
+    back to WARNING with a warning. Calling this again is a no-op.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    if level is None:
+        level = os.getenv('LOG_LEVEL', 'WARNING')
+    unknown_level = None
+    if isinstance(level, str):
+        name = level.strip().upper()
+        if name.isdigit():
+            level = int(name)
+        elif isinstance(logging.getLevelName(name), int):
+            level = logging.getLevelName(name)
+        else:
+            unknown_level, level = level, logging.WARNING
+    if json_format is None:
+        json_format = os.getenv('LOG_FORMAT', 'json').lower() != 'text'
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0'))
+
+    output = logging.StreamHandler(sys.stderr)
+    if json_format:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(
+            logging.Formatter(
+                '%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    handler = _QueueHandler(queue.SimpleQueue())
+    root = logging.getLogger()
+    if debug_sample_rate > 0:
+        handler.addFilter(SamplingFilter(level, debug_sample_rate))
+        root.setLevel(logging.DEBUG)
+    else:
+        root.setLevel(level)
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+
+    _listener = QueueListener(handler.queue,
+                              output,
+                              respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    if unknown_level is not None:
+        logging.getLogger(__name__).warning(
+            "Unknown LOG_LEVEL %r, using WARNING; expected one of "
+            "DEBUG, INFO, WARNING, ERROR or CRITICAL", unknown_level)
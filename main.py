@@ -1,31 +1,80 @@
-from flask import Flask, jsonify, request, session, redirect, url_for, flash
-from database import (Database, init_db, add_vendor, get_vendors,
-                      update_vendor, remove_vendor, add_car, get_cars,
-                      add_booking, get_bookings, add_role, get_roles,
-                      check_permission, add_customer, get_customers,
-                      blacklist_customer, add_transaction, get_transactions,
-                      add_account, get_accounts, add_pos_machine,
-                      get_pos_machines, add_language, get_languages,
-                      add_translation, add_vendor_detailed)
+from flask import (Flask, Response, jsonify, request, session, redirect,
+                   url_for, flash)
+from flask.json.provider import DefaultJSONProvider
+from database import (
+    Database, DatabaseUnavailable, init_db, add_vendor, get_vendors,
+    update_vendor, remove_vendor, add_car, get_cars, get_cars_page,
+    get_fleet_board, add_booking, get_bookings, get_bookings_page,
+    get_available_cars, BookingConflictError, add_role, get_roles,
+    check_permission, add_customer, get_customers, get_customers_page,
+    blacklist_customer, add_transaction, get_transactions, add_account,
+    get_accounts, add_pos_machine, get_pos_machines, add_language,
+    get_languages, add_translation, add_vendor_detailed, translation_catalog,
+    query_metrics, prepared_statements, get_dashboard_summary, quote_cars,
+    price_booking, PricingError, register_write_listener, queue_transaction,
+    transaction_ledger, subscribe_changes)
 import os
-from flask_babel import Babel, gettext as _  # Import Babel for translations
+from flask_babel import Babel, gettext as babel_gettext
 import logging
 import time
 import json
+import datetime
+from functools import wraps
+from bulk_import import BulkImporter, IMPORT_SPECS, iter_csv, iter_ndjson
+from exports import EXPORTS, export_stream
+from reporting import pnl_report, account_balances
+from response_cache import ResponseCache, etag_matches
+from ledger import LedgerError
+import serializers
+from customer_search import search_customers
+from log_config import configure_logging
+from translation_cache import request_language
+
+
+class SerializerJSONProvider(DefaultJSONProvider):
+    """Make jsonify() encode through serializers.dumps.
+
+    Bodies are written as the serializer's bytes with no str round trip,
+    keys keep their order, and dates and Decimals are handled.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return serializers.dumps(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(serializers.dumps(obj),
+                                        mimetype=self.mimetype)
+
 
 app = Flask(__name__)
+app.json = SerializerJSONProvider(app)
 app.secret_key = 'your_secret_key_here'  # Replace with a secure key in production
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Leveled logging through a background writer; see log_config.py
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Initialize database
-init_db()
-
 # Flask-Babel configuration (without localeselector for now)
 babel = Babel(app)
 
+
+def _(string, **variables):
+    """gettext that looks in the cached DB translation catalog first.
+
+    The language is the session's `language`, else the Accept-Language
+    header's preferred one (request_language; asgi.py does the same).
+    Falls back to Babel's compiled catalogs when the DB has no entry for
+    the string.
+    """
+    lang_code = request_language(session.get('language'),
+                                 request.headers.get('Accept-Language'))
+    translated = translation_catalog.lookup(lang_code, string)
+    if translated is None:
+        return babel_gettext(string, **variables)
+    return translated % variables if variables else translated
+
+
 # Sample data for dynamic dropdowns and context
 makes = ['Toyota', 'Honda', 'Ford']
 models_by_make = {
@@ -54,6 +103,156 @@ vehicle_status = ['Available', 'Rented', 'Maintenance', 'Unknown']
 vehicle_types = ['Sedan', 'SUV', 'Truck']
 countries = ['USA', 'UK', 'Canada', 'Australia', 'Germany']
 
+MAX_PAGE_SIZE = 1000
+
+# Tables on the change feed, and how often an idle stream sends a comment
+# so proxies keep it open
+CHANGE_FEED_TABLES = ('cars', 'bookings', 'customers')
+CHANGE_FEED_HEARTBEAT = float(os.getenv('CHANGE_FEED_HEARTBEAT', '15'))
+
+# Role checks stay opt-in until vendor logins are backed by the users table.
+# With enforcement off, require_permission returns the view unchanged.
+ENFORCE_PERMISSIONS = os.getenv('ENFORCE_PERMISSIONS',
+                                '').lower() in ('1', 'true', 'yes')
+
+
+def require_permission(permission):
+    """Reject the request with 403 unless the user's role grants `permission`.
+
+    Lookups go through the cached permission resolver, so a cache hit
+    costs no DB round trip.
+    """
+
+    def decorator(view):
+        if not ENFORCE_PERMISSIONS:
+            return view
+
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            username = session.get('username')
+            if username is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Unauthorized'
+                }), 401
+            if not check_permission(username, permission):
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Forbidden'
+                }), 403
+            return view(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+# Polled GET responses, kept until a helper writes the table they read
+response_cache = ResponseCache(max_entries=int(
+    os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024')),
+                               ttl=float(os.getenv('RESPONSE_CACHE_TTL',
+                                                   '30')))
+register_write_listener(response_cache.invalidate)
+
+
+def cached_response(table):
+    """Serve a vendor's GET responses for `table` from response_cache.
+
+    Entries are keyed on (path, vendor_id, query params) and carry an
+    ETag; a matching If-None-Match gets a 304 without running the view.
+    Other methods, anonymous requests and non-200 responses bypass the
+    cache, so the view's own checks still apply. While the database is
+    unavailable the request gets a 503 rather than a cached page.
+    """
+
+    def decorator(view):
+
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if (request.method != 'GET' or 'username' not in session
+                    or session.get('role') != 'vendor'):
+                return view(*args, **kwargs)
+            Database.check_available()
+            vendor_id = session.get('vendor_id', None)
+            key = (request.path, vendor_id,
+                   tuple(sorted(request.args.items(multi=True))))
+            cached = response_cache.get(key)
+            if cached is None:
+                generation = response_cache.generation(table)
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                etag = response_cache.put(key, table, vendor_id,
+                                          response.get_data(), generation)
+            else:
+                etag, body = cached
+                response = app.response_class(body,
+                                              mimetype='application/json')
+            headers = {
+                'ETag': etag,
+                'Cache-Control': 'private, no-cache',
+                'Vary': 'Cookie'
+            }
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                return app.response_class(status=304, headers=headers)
+            response.headers.update(headers)
+            return response
+
+        return wrapped
+
+    return decorator
+
+
+def _page_args():
+    """Read limit/after/fields query parameters, raising ValueError if bad."""
+    limit = request.args.get('limit', type=int)
+    if 'limit' in request.args and limit is None:
+        raise ValueError('limit must be an integer')
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    after = request.args.get('after') or None
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',')
+              if f.strip()] if fields else None
+    return limit, after, fields
+
+
+def _date_args(*names, required=False):
+    """Parse YYYY-MM-DD query parameters, raising ValueError if bad.
+
+    Missing optional parameters come back as None.
+    """
+    dates = []
+    for name in names:
+        value = request.args.get(name)
+        if not value:
+            if required:
+                raise ValueError(f'{name} is required')
+            dates.append(None)
+            continue
+        try:
+            dates.append(datetime.date.fromisoformat(value))
+        except ValueError:
+            raise ValueError(f'{name} must be a YYYY-MM-DD date') from None
+    return dates
+
+
+def _page_response(fetch_page, *args, **kwargs):
+    try:
+        limit, after, fields = _page_args()
+        rows, next_cursor = fetch_page(*args,
+                                       limit=limit,
+                                       after=after,
+                                       fields=fields,
+                                       **kwargs)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({
+        'status': 'success',
+        'data': rows,
+        'next_cursor': next_cursor
+    })
+
 
 # API Endpoints
 @app.route('/api/login', methods=['POST'])
@@ -88,14 +287,16 @@ def api_logout():
 
 
 @app.route('/api/cars', methods=['GET'])
+@require_permission('cars')
+@cached_response('cars')
 def api_get_cars():
     if 'username' not in session or session.get('role') != 'vendor':
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
-    cars = get_cars(session.get('vendor_id', None))
-    return jsonify({'status': 'success', 'data': cars})
+    return _page_response(get_cars_page, session.get('vendor_id', None))
 
 
 @app.route('/api/bookings', methods=['GET', 'POST'])
+@require_permission('bookings')
 def api_bookings():
     if 'username' not in session or session.get('role') != 'vendor':
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
@@ -105,22 +306,155 @@ def api_bookings():
         start_date = request.form.get('start_date')
         end_date = request.form.get('end_date')
         duration = request.form.get('duration')
-        cost = float(request.form.get('cost'))
         contract_number = request.form.get('contract_number')
         payment_type = request.form.get('payment_type')
         account_id = request.form.get('account_id')
-        add_booking(session.get('vendor_id',
-                                None), car_id, user_name, start_date, end_date,
-                    duration, cost, contract_number, payment_type, account_id)
+        # The cost is always priced here; any posted `cost` is ignored
+        insurance = [i for i in request.form.getlist('insurance') if i]
+        try:
+            cost = price_booking(session.get('vendor_id', None), car_id,
+                                 start_date, end_date, insurance)
+        except PricingError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if cost is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Pricing is unavailable'
+            }), 500
+        try:
+            added = add_booking(session.get('vendor_id',
+                                            None), car_id, user_name,
+                                start_date, end_date, duration, cost,
+                                contract_number, payment_type, account_id)
+        except BookingConflictError:
+            return jsonify({
+                'status':
+                'error',
+                'message':
+                _('This car is already booked for the selected dates')
+            }), 409
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if not added:
+            return jsonify({
+                'status': 'error',
+                'message': 'Could not add booking'
+            }), 500
         return jsonify({
             'status': 'success',
             'message': _('Booking added successfully!')
         })
-    bookings = get_bookings(session.get('vendor_id', None), future_only=False)
-    return jsonify({'status': 'success', 'data': bookings})
+    return _page_response(get_bookings_page,
+                          session.get('vendor_id', None),
+                          future_only=False)
+
+
+@app.route('/api/availability', methods=['GET'])
+@require_permission('cars')
+def api_availability():
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    try:
+        start_date, end_date = _date_args('start_date',
+                                          'end_date',
+                                          required=True)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if end_date <= start_date:
+        return jsonify({
+            'status': 'error',
+            'message': 'end_date must be after start_date'
+        }), 400
+    features = request.args.get('features')
+    return _page_response(
+        get_available_cars,
+        session.get('vendor_id', None),
+        start_date.isoformat(),
+        end_date.isoformat(),
+        car_type=request.args.get('type'),
+        status=request.args.get('status'),
+        features=[f.strip() for f in features.split(',')
+                  if f.strip()] if features else None)
+
+
+@app.route('/api/fleet', methods=['GET'])
+@require_permission('cars')
+def api_fleet():
+    """Today's state of every car (Available, Rented, Maintenance or
+    Unknown) and the count in each, from the in-memory fleet view.
+
+    An optional `state` narrows `cars` to that state.
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    state = request.args.get('state')
+    if state is not None and state not in vehicle_status:
+        return jsonify({
+            'status':
+            'error',
+            'message':
+            f"state must be one of {', '.join(vehicle_status)}"
+        }), 400
+    board = get_fleet_board(session.get('vendor_id', None))
+    if board is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Fleet state is unavailable'
+        }), 500
+    if state is not None:
+        board['cars'] = {
+            car_id: car_state
+            for car_id, car_state in board['cars'].items()
+            if car_state == state
+        }
+    return jsonify({'status': 'success', 'data': board})
+
+
+@app.route('/api/quotes', methods=['GET'])
+@require_permission('cars')
+def api_quotes():
+    """Price several cars for one rental in a single call.
+
+    Requires start_date/end_date (YYYY-MM-DD, end exclusive) and car_ids,
+    a comma-separated list; optional `insurance` lists add-on options.
+    Cars that cannot be priced get an `error` instead of a price.
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    try:
+        start_date, end_date = _date_args('start_date',
+                                          'end_date',
+                                          required=True)
+        if end_date <= start_date:
+            raise ValueError('end_date must be after start_date')
+        try:
+            car_ids = [
+                int(c) for c in request.args.get('car_ids', '').split(',')
+                if c.strip()
+            ]
+        except ValueError:
+            raise ValueError('car_ids must be integers') from None
+        if not 1 <= len(car_ids) <= MAX_PAGE_SIZE:
+            raise ValueError(
+                f'car_ids must list between 1 and {MAX_PAGE_SIZE} cars')
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    insurance = request.args.get('insurance')
+    insurance = [i.strip() for i in insurance.split(',')
+                 if i.strip()] if insurance else []
+    quotes = quote_cars(session.get('vendor_id', None), car_ids, start_date,
+                        end_date, insurance)
+    if quotes is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Pricing is unavailable'
+        }), 500
+    return jsonify({'status': 'success', 'data': quotes})
 
 
 @app.route('/api/customers', methods=['GET', 'POST'])
+@require_permission('customers')
+@cached_response('customers')
 def api_customers():
     if 'username' not in session or session.get('role') != 'vendor':
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
@@ -133,7 +467,13 @@ def api_customers():
             license_number = request.form.get('license_number')
             license_country = request.form.get('license_country')
             license_expiry = request.form.get('license_expiry')
-            rating = int(request.form.get('rating'))
+            try:
+                rating = int(request.form.get('rating'))
+            except (TypeError, ValueError):
+                return jsonify({
+                    'status': 'error',
+                    'message': 'rating must be an integer'
+                }), 400
             add_customer(session.get('vendor_id', None), name, email, phone,
                          id_number, license_number, license_country,
                          license_expiry, rating)
@@ -151,8 +491,355 @@ def api_customers():
                 'message':
                 _('Customer status updated successfully!')
             })
-    customers = get_customers(session.get('vendor_id', None))
-    return jsonify({'status': 'success', 'data': customers})
+    return _page_response(get_customers_page, session.get('vendor_id', None))
+
+
+@app.route('/api/customers/search', methods=['GET'])
+@require_permission('customers')
+def api_search_customers():
+    """Ranked, paginated customer search for the booking counter.
+
+    `q` (at least 3 characters) matches name, phone, email and license
+    number by prefix, substring or close spelling; optional `blacklisted`
+    (true/false) filters on the flag. Takes `limit` and `after` like the
+    list routes.
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    blacklisted = request.args.get('blacklisted')
+    try:
+        if blacklisted not in (None, 'true', 'false'):
+            raise ValueError('blacklisted must be true or false')
+        limit = request.args.get('limit', 20, type=int)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+        rows, next_cursor = search_customers(
+            session.get('vendor_id', None),
+            request.args.get('q'),
+            limit=limit,
+            after=request.args.get('after') or None,
+            blacklisted=None if blacklisted is None else blacklisted == 'true')
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({
+        'status': 'success',
+        'data': rows,
+        'next_cursor': next_cursor
+    })
+
+
+@app.route('/api/import/<table>', methods=['POST'])
+@require_permission('import')
+def api_bulk_import(table):
+    """Import a CSV or NDJSON upload into cars, customers or bookings.
+
+    The body may be a multipart upload in `file` or the raw document.
+    The format comes from ?format=, then the file name, then the content
+    type.
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    if table not in IMPORT_SPECS:
+        return jsonify({
+            'status': 'error',
+            'message': f'Bulk import is not supported for {table}'
+        }), 404
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = request.args.get('format')
+    if not fmt:
+        filename = upload.filename if upload else ''
+        if filename.endswith('.csv') or request.mimetype == 'text/csv':
+            fmt = 'csv'
+        else:
+            fmt = 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({
+            'status': 'error',
+            'message': 'format must be csv or ndjson'
+        }), 400
+    rows = iter_csv(stream) if fmt == 'csv' else iter_ndjson(stream)
+    report = BulkImporter(table, session.get('vendor_id', None)).run(rows)
+    return jsonify({'status': 'success', 'data': report})
+
+
+def _change_stream(subscription):
+    try:
+        yield f"retry: {int(CHANGE_FEED_HEARTBEAT * 1000)}\n\n"
+        while not subscription.closed:
+            events = subscription.get(CHANGE_FEED_HEARTBEAT)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                event = dict(event)
+                event_id = event.pop('event_id')
+                kind = 'reset' if event['op'] == 'reset' else 'change'
+                data = serializers.dumps(event).decode()
+                yield f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+    finally:
+        subscription.close()
+
+
+@app.route('/api/changes', methods=['GET'])
+@require_permission('dashboard')
+def api_changes():
+    """Server-Sent Events stream of row changes to cars, bookings and
+    customers, to patch client state instead of polling the list routes.
+
+    Each `change` event carries op (insert, update, delete, or reload
+    after a bulk import), table, vendor_id and id. A `reset` event means
+    changes were missed and the lists must be fetched again. Optional
+    `tables` is a comma-separated subset; reconnecting clients send
+    Last-Event-ID to resume.
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    tables = request.args.get('tables')
+    tables = [t.strip() for t in tables.split(',')
+              if t.strip()] if tables else None
+    unknown = set(tables or ()) - set(CHANGE_FEED_TABLES)
+    if unknown:
+        return jsonify({
+            'status':
+            'error',
+            'message':
+            f"tables must be among {', '.join(CHANGE_FEED_TABLES)}"
+        }), 400
+    try:
+        subscription = subscribe_changes(
+            session.get('vendor_id', None),
+            request.headers.get('Last-Event-ID')
+            or request.args.get('last_event_id'), tables)
+    except OverflowError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+    return Response(_change_stream(subscription),
+                    mimetype='text/event-stream',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
+@app.route('/api/export/<table>', methods=['GET'])
+@require_permission('export')
+def api_export(table):
+    """Stream bookings or transactions as CSV or NDJSON.
+
+    Optional start_date/end_date (inclusive, YYYY-MM-DD) filter on the
+    booking start date or the transaction date.
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    if table not in EXPORTS:
+        return jsonify({
+            'status': 'error',
+            'message': f'Export is not supported for {table}'
+        }), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({
+            'status': 'error',
+            'message': 'format must be csv or ndjson'
+        }), 400
+    try:
+        start_date, end_date = _date_args('start_date', 'end_date')
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        export_stream(table, session.get('vendor_id', None), fmt, start_date,
+                      end_date),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={table}.{fmt}'})
+
+
+@app.route('/api/dashboard/summary', methods=['GET'])
+@require_permission('dashboard')
+def api_dashboard_summary():
+    """Car counts by status, revenue by day and month, VAT and upcoming bookings.
+
+    Optional start_date/end_date (inclusive, YYYY-MM-DD) bound the revenue
+    series, defaulting to the last 30 days; `upcoming` caps the list of
+    next bookings.
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    try:
+        start_date, end_date = _date_args('start_date', 'end_date')
+        upcoming = request.args.get('upcoming', 10, type=int)
+        if not 0 <= upcoming <= MAX_PAGE_SIZE:
+            raise ValueError(f'upcoming must be between 0 and {MAX_PAGE_SIZE}')
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if start_date and end_date and end_date < start_date:
+        return jsonify({
+            'status': 'error',
+            'message': 'end_date must not be before start_date'
+        }), 400
+    summary = get_dashboard_summary(session.get('vendor_id', None), start_date,
+                                    end_date, upcoming)
+    if summary is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Dashboard summary is unavailable'
+        }), 500
+    return jsonify({'status': 'success', 'data': summary})
+
+
+def _report_args():
+    """Parse start_date/end_date (default the current month) and period."""
+    start_date, end_date = _date_args('start_date', 'end_date')
+    end_date = end_date or datetime.date.today()
+    start_date = start_date or end_date.replace(day=1)
+    if end_date < start_date:
+        raise ValueError('end_date must not be before start_date')
+    return start_date, end_date, request.args.get('period', 'month')
+
+
+@app.route('/api/reports/pnl', methods=['GET'])
+@require_permission('reports')
+def api_reports_pnl():
+    """Transaction totals, VAT and net amount per period.
+
+    Optional start_date/end_date (inclusive, YYYY-MM-DD) default to the
+    current month; `period` is day, week, month, quarter or year and
+    `group_by` a comma-separated list of category, account_id and
+    payment_type (default category).
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    group_by = request.args.get('group_by', 'category')
+    group_by = [column.strip() for column in group_by.split(',') if column]
+    try:
+        start_date, end_date, period = _report_args()
+        report = pnl_report(session.get('vendor_id', None), start_date,
+                            end_date, period, group_by)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if report is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'P&L report is unavailable'
+        }), 500
+    return jsonify({'status': 'success', 'data': report})
+
+
+@app.route('/api/reports/balances', methods=['GET'])
+@require_permission('reports')
+def api_reports_balances():
+    """Opening, per-period running and closing balance of each account.
+
+    Takes the same start_date, end_date and period parameters as
+    /api/reports/pnl.
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    try:
+        start_date, end_date, period = _report_args()
+        report = account_balances(session.get('vendor_id', None), start_date,
+                                  end_date, period)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if report is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Account balances are unavailable'
+        }), 500
+    return jsonify({'status': 'success', 'data': report})
+
+
+# Seconds POST /api/transactions?wait=1 waits for its ledger entry
+LEDGER_WAIT_TIMEOUT = float(os.getenv('LEDGER_WAIT_TIMEOUT', '5'))
+
+
+@app.route('/api/transactions', methods=['POST'])
+@require_permission('transactions')
+def api_transactions():
+    """Record a transaction (POS payments and the like).
+
+    With LEDGER_WRITE_BEHIND on, the transaction is queued for a group
+    commit and the response is 202 with its `ledger_seq`; pass wait=1 to
+    get a 201 only once it is in the database (read-your-writes).
+    """
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    form = request.form
+    args = (session.get('vendor_id', None), form.get('category'),
+            form.get('amount'), form.get('description'), form.get('vat_amount')
+            or 0, form.get('account_id') or None, form.get('payment_type'))
+    if transaction_ledger is None:
+        try:
+            added = add_transaction(*args)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if not added:
+            return jsonify({
+                'status': 'error',
+                'message': 'Could not add transaction'
+            }), 500
+        return jsonify({
+            'status': 'success',
+            'message': _('Transaction added successfully!')
+        }), 201
+    try:
+        seq = queue_transaction(*args)
+        written = (request.args.get('wait') == '1'
+                   and transaction_ledger.flush(seq, LEDGER_WAIT_TIMEOUT))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except LedgerError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 422
+    except TimeoutError:
+        return jsonify({
+            'status': 'error',
+            'message': 'Transaction queue is full'
+        }), 503
+    return jsonify({
+        'status': 'success',
+        'message': _('Transaction added successfully!'),
+        'ledger_seq': seq
+    }), 201 if written else 202
+
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    logger.error("Request failed, database unavailable: %s", e)
+    return jsonify({'status': 'error', 'message': 'Database unavailable'}), 503
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is serving requests. Deliberately ignores
+    the database, so an outage does not get workers restarted."""
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: the database answers and the schema is migrated."""
+    state = Database.health()
+    return jsonify({
+        'status': 'ready' if state['ready'] else 'unavailable',
+        'database': state
+    }), 200 if state['ready'] else 503
+
+
+@app.route('/api/pool_stats', methods=['GET'])
+@require_permission('dashboard')
+def api_pool_stats():
+    if 'username' not in session or session.get('role') != 'vendor':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    data = Database.pool_stats()
+    data['prepared_statements'] = prepared_statements.stats()
+    return jsonify({'status': 'success', 'data': data})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(query_metrics.render_prometheus(
+        Database.pool_stats(), prepared_statements.stats()),
+                    mimetype='text/plain; version=0.0.4')
 
 
 # Legacy Routes (for transition)
@@ -186,4 +873,7 @@ def logout():
 
 
 if __name__ == '__main__':
+    # The development server migrates its own database; deployments run
+    # `python database.py migrate` once instead
+    init_db()
     app.run(host='0.0.0.0', port=80, debug=True)
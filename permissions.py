@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+_EMPTY = frozenset()
+
+
+class PermissionResolver:
+    """Caches each user's compiled permission set for `ttl` seconds.
+
+    `loader(username)` returns the role's comma-separated permissions
+    string, or None for an unknown user. Permission strings are compiled
+    into frozensets once and shared between every user holding the same
+    role, so a cache hit is a dict lookup and a set membership test.
+    Beyond `max_users` the least recently used user is dropped.
+    """
+
+    def __init__(self, loader, ttl=60.0, max_users=10000):
+        self._loader = loader
+        self.ttl = ttl
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # username -> (expires_at, frozenset)
+        self._compiled = {}  # permissions string -> frozenset
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _compile(self, permissions):
+        if not permissions:
+            return _EMPTY
+        compiled = self._compiled.get(permissions)
+        if compiled is None:
+            compiled = frozenset(p.strip() for p in permissions.split(',')
+                                 if p.strip())
+            self._compiled[permissions] = compiled
+        return compiled
+
+    def permissions(self, username):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(username)
+            if entry is not None and entry[0] > now:
+                self._users.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        raw = self._loader(username)
+        with self._lock:
+            compiled = self._compile(raw)
+            # Drop the load if permissions were invalidated while it ran
+            if generation == self._generation:
+                self._users[username] = (now + self.ttl, compiled)
+                self._users.move_to_end(username)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+        return compiled
+
+    def has(self, username, permission):
+        return permission in self.permissions(username)
+
+    def invalidate(self, username=None):
+        """Forget one user's permissions, or everyone's when no name is given."""
+        with self._lock:
+            self._generation += 1
+            if username is None:
+                self._users.clear()
+                self._compiled.clear()
+            else:
+                self._users.pop(username, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'roles': len(self._compiled),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
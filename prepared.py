@@ -0,0 +1,121 @@
+import hashlib
+import threading
+import weakref
+
+from psycopg2 import errors as pg_errors
+
+from dialect import ASYNCPG
+
+
+class PreparedStatements:
+    """Fixed statements PREPAREd once per Postgres connection.
+
+    `execute(cursor, sql, params)` runs `sql`, written with the repo's %s
+    placeholders, on a Database.cursor(). The first time a connection
+    sees the statement it is PREPAREd under a name made from a hash of
+    the SQL text; every later call sends only `EXECUTE name (...)`, so
+    Postgres parses and plans the statement once per connection, not per
+    call. The same name means the same statement in every process, which
+    is what makes a session's existing statements safe to reuse when it
+    was prepared by another worker.
+
+    Prepared names are tracked per connection object, weakly, and seeded
+    from pg_prepared_statements the first time a connection is seen. A
+    connection opened after a reconnect therefore starts empty and
+    prepares again, with no stale state to clear. SQLite already keeps
+    compiled statements in each connection's statement cache, so there
+    the call is a plain execute, as it is everywhere with `enabled`
+    off (for poolers in transaction mode, which hand each transaction a
+    different server session).
+
+    A statement that turns out to be missing on the server (a pooler ran
+    DISCARD ALL) fails that call like any other error; the connection's
+    names are forgotten first, so the caller's retry prepares it again.
+    """
+
+    def __init__(self, prefix='rm', enabled=True):
+        self.prefix = prefix
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._names = {}  # sql -> statement name
+        self._prepared = weakref.WeakKeyDictionary()  # connection -> names
+        self.hits = 0
+        self.prepares = 0
+        self.passthrough = 0
+
+    def _name(self, sql):
+        with self._lock:
+            name = self._names.get(sql)
+            if name is None:
+                digest = hashlib.sha1(sql.encode()).hexdigest()[:16]
+                name = f"{self.prefix}_{digest}"
+                self._names[sql] = name
+            return name
+
+    def _connection_names(self, cursor, conn):
+        with self._lock:
+            names = self._prepared.get(conn)
+        if names is None:
+            # A pooled connection may outlive our record of it (or come
+            # from a pooler); ask the server what it already has
+            cursor.execute("SELECT name FROM pg_prepared_statements")
+            names = {
+                row['name'] if isinstance(row, dict) else row[0]
+                for row in cursor.fetchall()
+            }
+            with self._lock:
+                self._prepared[conn] = names
+        return names
+
+    def execute(self, cursor, sql, params=None, many=False):
+        """Execute `sql` with `params` (or executemany with `many`)."""
+        if not self.enabled or cursor.dialect.name != 'postgresql':
+            with self._lock:
+                self.passthrough += 1
+            if many:
+                return cursor.executemany(sql, params)
+            return cursor.execute(sql, params)
+
+        conn = cursor.raw.connection
+        name = self._name(sql)
+        names = self._connection_names(cursor, conn)
+        if name in names:
+            with self._lock:
+                self.hits += 1
+        else:
+            cursor.execute(f"PREPARE {name} AS {ASYNCPG.compile(sql)}")
+            names.add(name)
+            with self._lock:
+                self.prepares += 1
+        arity = sql.count('%s')
+        compiled = f"EXECUTE {name}"
+        if arity:
+            compiled += f" ({', '.join(['%s'] * arity)})"
+        try:
+            return cursor.execute_compiled(sql, compiled, params, many=many)
+        except pg_errors.InvalidSqlStatementName:
+            self.forget(conn)
+            raise
+
+    def forget(self, conn):
+        """Drop what is known about `conn`, e.g. after DISCARD ALL."""
+        with self._lock:
+            self._prepared.pop(conn, None)
+
+    def stats(self):
+        with self._lock:
+            executions = self.hits + self.prepares
+            return {
+                'statements':
+                len(self._names),
+                'connections':
+                len(self._prepared),
+                'hits':
+                self.hits,
+                'prepares':
+                self.prepares,
+                'passthrough':
+                self.passthrough,
+                'hit_rate':
+                round(self.hits / executions, 4) if executions else None,
+            }
@@ -0,0 +1,217 @@
+import json
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+# Days a monthly / weekly tier covers
+MONTH_DAYS = 30
+WEEK_DAYS = 7
+
+_LEAP_YEAR_START = datetime.date(2000, 1, 1).toordinal()
+
+
+class PricingError(ValueError):
+    """Raised when a car's rate table cannot price a quote."""
+
+
+def _day_of_year(day):
+    """Index of a month/day in a leap year, so Feb 29 has its own slot."""
+    return datetime.date(2000, day.month,
+                         day.day).toordinal() - _LEAP_YEAR_START
+
+
+def _month_day(value):
+    try:
+        month, day = (int(part) for part in value.split('-'))
+        return _day_of_year(datetime.date(2000, month, day))
+    except (AttributeError, ValueError):
+        raise PricingError(
+            f"Season dates must be MM-DD, got {value!r}") from None
+
+
+def rental_days(start_date, end_date):
+    """Day-of-year index of every rented day, end date excluded.
+
+    Computed once per date range and shared by all cars priced for it.
+    """
+    if end_date <= start_date:
+        raise ValueError('end_date must be after start_date')
+    return [
+        _day_of_year(start_date + datetime.timedelta(days=offset))
+        for offset in range((end_date - start_date).days)
+    ]
+
+
+class RateTable:
+    """A car's parsed `rates` JSON.
+
+    Recognised keys are `daily`, `weekly` and `monthly` prices (missing
+    tiers default to 7 and 30 daily rates), `seasons`, a list of
+    {start: 'MM-DD', end: 'MM-DD', multiplier} rules where the first
+    matching rule wins and ranges may wrap over new year, and `insurance`,
+    a {option: price per day} map of add-ons. A bare number is read as
+    the daily rate.
+    """
+
+    __slots__ = ('daily', 'weekly', 'monthly', 'insurance', '_multipliers')
+
+    def __init__(self, rates):
+        if isinstance(rates, (str, bytes)):
+            try:
+                rates = json.loads(rates)
+            except ValueError:
+                raise PricingError("Rates are not valid JSON") from None
+        if isinstance(rates, (int, float)):
+            rates = {'daily': rates}
+        if not isinstance(rates, dict):
+            raise PricingError("Rates must be a JSON object")
+        try:
+            daily = rates.get('daily')
+            if daily is None and rates.get('weekly') is not None:
+                daily = rates['weekly'] / WEEK_DAYS
+            if daily is None and rates.get('monthly') is not None:
+                daily = rates['monthly'] / MONTH_DAYS
+            if daily is None:
+                raise PricingError("Rates have no daily, weekly or monthly "
+                                   "price")
+            self.daily = float(daily)
+            self.weekly = float(rates.get('weekly') or daily * WEEK_DAYS)
+            self.monthly = float(rates.get('monthly') or daily * MONTH_DAYS)
+            self.insurance = {
+                str(option): float(price)
+                for option, price in (rates.get('insurance') or {}).items()
+            }
+            self._multipliers = self._compile_seasons(rates.get('seasons'))
+        except PricingError:
+            raise
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise PricingError(f"Invalid rates: {e!r}") from None
+
+    @staticmethod
+    def _compile_seasons(seasons):
+        """Expand season rules into one multiplier per day of the year."""
+        if not seasons:
+            return None
+        multipliers = [None] * 366
+        for season in seasons:
+            first = _month_day(season['start'])
+            last = _month_day(season['end'])
+            multiplier = float(season['multiplier'])
+            days = (range(first, last + 1) if first <= last else
+                    [*range(first, 366), *range(0, last + 1)])
+            for day in days:
+                if multipliers[day] is None:
+                    multipliers[day] = multiplier
+        return [1.0 if m is None else m for m in multipliers]
+
+    def base_price(self, days):
+        """Cheapest mix of monthly, weekly and daily tiers for `days`."""
+        months, days = divmod(days, MONTH_DAYS)
+        weeks, days = divmod(days, WEEK_DAYS)
+        cost = min(days * self.daily, self.weekly)
+        cost = min(weeks * self.weekly + cost, self.monthly)
+        return months * self.monthly + cost
+
+    def quote(self, days, insurance=()):
+        """Price the rented `days` (from rental_days) with add-ons.
+
+        The tier price is spread evenly over the days and each day is
+        scaled by its season multiplier.
+        """
+        count = len(days)
+        base = self.base_price(count)
+        seasonal = 0.0
+        if self._multipliers is not None:
+            factor = sum(self._multipliers[day] for day in days) / count
+            seasonal = base * (factor - 1)
+        add_ons = {}
+        for option in insurance:
+            price = self.insurance.get(option)
+            if price is None:
+                raise PricingError(f"Insurance option {option!r} is not "
+                                   "offered")
+            add_ons[option] = round(price * count, 2)
+        return {
+            'days': count,
+            'base': round(base, 2),
+            'seasonal': round(seasonal, 2),
+            'insurance': add_ons,
+            'total': round(base + seasonal + sum(add_ons.values()), 2),
+        }
+
+
+class RateCache:
+    """Compiled RateTables per car id, loaded in batches.
+
+    `loader(car_ids)` returns {car_id: (vendor_id, rates)} for the cars
+    that exist. Rates are parsed once and kept until `invalidate(car_id)`
+    (called on update and delete) or `ttl` seconds, which picks up writes
+    made by other worker processes. A car whose rates cannot be parsed is
+    cached with the PricingError in place of its table.
+    """
+
+    def __init__(self, loader, max_cars=10000, ttl=None):
+        self._loader = loader
+        self.max_cars = max_cars
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cars = OrderedDict()  # car_id -> (loaded_at, vendor_id, table)
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, car_ids):
+        """Return {car_id: (vendor_id, RateTable or PricingError)}."""
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            generation = self._generation
+            for car_id in car_ids:
+                entry = self._cars.get(car_id)
+                if entry is not None and (self.ttl is None
+                                          or now - entry[0] < self.ttl):
+                    self._cars.move_to_end(car_id)
+                    found[car_id] = entry[1:]
+                    self.hits += 1
+                else:
+                    missing.append(car_id)
+            self.misses += len(missing)
+        if not missing:
+            return found
+
+        loaded = {}
+        for car_id, (vendor_id, rates) in self._loader(missing).items():
+            try:
+                table = RateTable(rates)
+            except PricingError as e:
+                table = e
+            loaded[car_id] = (vendor_id, table)
+        found.update(loaded)
+        with self._lock:
+            # Drop the load if a car was invalidated while it ran
+            if generation == self._generation:
+                for car_id, entry in loaded.items():
+                    self._cars[car_id] = (now, *entry)
+                    self._cars.move_to_end(car_id)
+                while len(self._cars) > self.max_cars:
+                    self._cars.popitem(last=False)
+        return found
+
+    def invalidate(self, car_id=None):
+        """Forget one car's rates, or every car's when no id is given."""
+        with self._lock:
+            self._generation += 1
+            if car_id is None:
+                self._cars.clear()
+            else:
+                self._cars.pop(car_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cars': len(self._cars),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
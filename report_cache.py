@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ReportCache:
+    """LRU of computed reports, each tagged with the tenant and the date
+    range of transactions it was computed from.
+
+    `invalidate(tenant_id, first_day, last_day)` drops every report of
+    that tenant (and every all-tenant report) whose range overlaps the
+    given days, so a new transaction only evicts the periods it lands in.
+    A report whose range starts at None depends on all earlier history,
+    e.g. running balances. `ttl` (seconds, optional) bounds staleness from
+    writes made by other worker processes.
+
+    Take `generation()` before computing a report and pass it to `put`:
+    a report computed while a transaction committed is then not cached.
+    """
+
+    def __init__(self, max_entries=256, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict(
+        )  # key -> (tenant, first, last, at, value)
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None
+                                      or now - entry[3] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[4]
+            self.misses += 1
+            return None
+
+    def put(self, key, tenant_id, first_day, last_day, value, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (tenant_id, first_day, last_day,
+                                  time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tenant_id, first_day, last_day):
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key
+                for key, (tenant, first, last, _, _) in self._entries.items()
+                if tenant in (tenant_id, None) and (
+                    first is None or first <= last_day) and last >= first_day
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,299 @@
+import datetime
+import logging
+
+from database import (db, report_cache, DB_ERRORS, _tenant_filter, _where)
+
+try:
+    import numpy as np
+except ImportError:  # SQLite reports fall back to a plain Python loop
+    np = None
+
+logger = logging.getLogger(__name__)
+
+REPORT_BATCH_SIZE = 50000
+
+# Period buckets; weeks start on Monday like Postgres date_trunc('week')
+PERIODS = ('day', 'week', 'month', 'quarter', 'year')
+
+# Transaction columns a P&L report can be grouped by
+GROUP_COLUMNS = ('category', 'account_id', 'payment_type')
+
+
+def _check_report_args(period, group_by):
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    unknown = [column for column in group_by if column not in GROUP_COLUMNS]
+    if unknown or len(set(group_by)) != len(group_by):
+        raise ValueError(
+            f"group_by must be distinct columns of {', '.join(GROUP_COLUMNS)}")
+
+
+def _range_filter(tenant_id, start_date, end_date):
+    conditions, params = _tenant_filter('tenant_id', tenant_id)
+    if start_date is not None:
+        conditions.append("date >= %s")
+        params.append(start_date.isoformat())
+    conditions.append("date < %s")
+    params.append((end_date + datetime.timedelta(days=1)).isoformat())
+    return conditions, params
+
+
+def _bucket(day, period):
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    if period == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day.replace(month=1, day=1)
+
+
+def _bucket_days(days, period):
+    """Vectorized _bucket over a datetime64[D] array."""
+    if period == 'day':
+        return days
+    if period == 'week':
+        # Day 0 (1970-01-01) was a Thursday, weekday 3 counting from Monday
+        return days - (days.astype('int64') + 3) % 7
+    if period == 'quarter':
+        months = days.astype('datetime64[M]').astype('int64')
+        return (months -
+                months % 3).astype('datetime64[M]').astype('datetime64[D]')
+    unit = 'datetime64[M]' if period == 'month' else 'datetime64[Y]'
+    return days.astype(unit).astype('datetime64[D]')
+
+
+def _sql_totals(tenant_id, start_date, end_date, period, group_by):
+    """Bucket totals computed by Postgres with date_trunc and GROUP BY."""
+    conditions, params = _range_filter(tenant_id, start_date, end_date)
+    columns = ''.join(f", {column}" for column in group_by)
+    positions = ', '.join(str(i) for i in range(1, len(group_by) + 2))
+    query = f"SELECT date_trunc(%s, date)::date{columns}, SUM(amount), COALESCE(SUM(vat_amount), 0), COUNT(*) FROM transactions{_where(conditions)} GROUP BY {positions}"
+    with db.cursor() as cursor:
+        cursor.execute(query, [period] + params)
+        return {
+            (str(row[0]), *row[1:-3]): list(row[-3:])
+            for row in cursor.fetchall()
+        }
+
+
+def _scan(tenant_id, start_date, end_date, group_by, batch_size):
+    """Yield (day, *group_by, amount, vat_amount) rows in batches."""
+    conditions, params = _range_filter(tenant_id, start_date, end_date)
+    conditions.append("date(date) IS NOT NULL")
+    columns = ''.join(f", {column}" for column in group_by)
+    query = f"SELECT date(date){columns}, amount, COALESCE(vat_amount, 0) FROM transactions{_where(conditions)}"
+    with db.cursor() as cursor:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def _accumulate(total, codes, weights, size):
+    total = np.pad(total, (0, size - len(total)))
+    return total + np.bincount(codes, weights=weights, minlength=size)
+
+
+def _numpy_totals(batches, period):
+    """Bucket and sum each batch column-wise.
+
+    Group keys are numbered as they are first seen, so every batch is
+    reduced with a single bincount per measure.
+    """
+    index = {}
+    amount = vat = count = np.zeros(0)
+    for rows in batches:
+        columns = list(zip(*rows))
+        days = np.array(columns[0], dtype='datetime64[D]')
+        buckets = _bucket_days(days, period).astype(str).tolist()
+        keys = zip(buckets, *columns[1:-2])
+        codes = np.fromiter(
+            (index.setdefault(key, len(index)) for key in keys),
+            dtype=np.int64,
+            count=len(rows))
+        size = len(index)
+        amount = _accumulate(amount, codes,
+                             np.array(columns[-2], dtype=np.float64), size)
+        vat = _accumulate(vat, codes, np.array(columns[-1], dtype=np.float64),
+                          size)
+        count = _accumulate(count, codes, None, size)
+    return {
+        key: [float(amount[i]), float(vat[i]),
+              int(count[i])]
+        for key, i in index.items()
+    }
+
+
+def _python_totals(batches, period):
+    totals = {}
+    buckets = {}  # day -> bucket, most days repeat many times
+    for rows in batches:
+        for day, *groups, amount, vat in rows:
+            bucket = buckets.get(day)
+            if bucket is None:
+                bucket = buckets[day] = _bucket(
+                    datetime.date.fromisoformat(day), period).isoformat()
+            entry = totals.get((bucket, *groups))
+            if entry is None:
+                entry = totals[(bucket, *groups)] = [0.0, 0.0, 0]
+            entry[0] += amount
+            entry[1] += vat
+            entry[2] += 1
+    return totals
+
+
+def _bucket_totals(tenant_id,
+                   start_date,
+                   end_date,
+                   period,
+                   group_by,
+                   batch_size=REPORT_BATCH_SIZE):
+    """Map (bucket, *group values) to [amount, vat_amount, transactions].
+
+    Postgres does the whole aggregation. SQLite has no date_trunc, so rows
+    are streamed in batches and bucketed here, with NumPy when installed.
+    """
+    if db.is_postgres:
+        return _sql_totals(tenant_id, start_date, end_date, period, group_by)
+    batches = _scan(tenant_id, start_date, end_date, group_by, batch_size)
+    if np is not None:
+        return _numpy_totals(batches, period)
+    return _python_totals(batches, period)
+
+
+def _sort_key(item):
+    return tuple((value is None, value) for value in item[0])
+
+
+def _money(value):
+    return round(value, 2)
+
+
+def pnl_report(tenant_id,
+               start_date,
+               end_date,
+               period='month',
+               group_by=('category', )):
+    """Transaction totals per period bucket and `group_by` columns.
+
+    Covers transactions dated `start_date` to `end_date` inclusive; the
+    first and last buckets may be partial. Each row has the summed amount,
+    VAT, net (amount less VAT) and transaction count. Results are cached
+    until a transaction for the tenant lands in the range. Returns None
+    on a database error; raises ValueError for a bad period or column.
+    """
+    group_by = tuple(group_by)
+    _check_report_args(period, group_by)
+    key = ('pnl', tenant_id, start_date, end_date, period, group_by)
+    report = report_cache.get(key)
+    if report is not None:
+        return report
+    generation = report_cache.generation()
+    try:
+        totals = _bucket_totals(tenant_id, start_date, end_date, period,
+                                group_by)
+    except DB_ERRORS as e:
+        logger.error("Error building P&L report: %s", e)
+        return None
+
+    rows = []
+    overall = {'amount': 0.0, 'vat_amount': 0.0, 'transactions': 0}
+    for (bucket, *groups), (amount, vat, count) in sorted(totals.items(),
+                                                          key=_sort_key):
+        row = {'period': bucket}
+        row.update(zip(group_by, groups))
+        row.update(amount=_money(amount),
+                   vat_amount=_money(vat),
+                   net_amount=_money(amount - vat),
+                   transactions=count)
+        rows.append(row)
+        overall['amount'] += amount
+        overall['vat_amount'] += vat
+        overall['transactions'] += count
+    report = {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'period': period,
+        'group_by': list(group_by),
+        'rows': rows,
+        'totals': {
+            'amount': _money(overall['amount']),
+            'vat_amount': _money(overall['vat_amount']),
+            'net_amount': _money(overall['amount'] - overall['vat_amount']),
+            'transactions': overall['transactions'],
+        },
+    }
+    report_cache.put(key, tenant_id, start_date, end_date, report, generation)
+    return report
+
+
+def _opening_balances(tenant_id, start_date):
+    conditions, params = _tenant_filter('tenant_id', tenant_id)
+    conditions.append("date < %s")
+    params.append(start_date.isoformat())
+    with db.cursor() as cursor:
+        cursor.execute(
+            f"SELECT account_id, SUM(amount) FROM transactions{_where(conditions)} GROUP BY account_id",
+            params)
+        return dict(cursor.fetchall())
+
+
+def account_balances(tenant_id, start_date, end_date, period='month'):
+    """Per-account movements by period with a running balance.
+
+    The opening balance sums every transaction before `start_date`; each
+    period's balance adds that period's movements to it, and the last one
+    is the closing balance. Accounts with no movement in the range are
+    listed with their opening balance only. Cached like pnl_report, but any
+    new transaction up to `end_date` invalidates it.
+    """
+    _check_report_args(period, ())
+    key = ('balances', tenant_id, start_date, end_date, period)
+    report = report_cache.get(key)
+    if report is not None:
+        return report
+    generation = report_cache.generation()
+    try:
+        opening = _opening_balances(tenant_id, start_date)
+        totals = _bucket_totals(tenant_id, start_date, end_date, period,
+                                ('account_id', ))
+    except DB_ERRORS as e:
+        logger.error("Error building account balances: %s", e)
+        return None
+
+    balances = dict(opening)
+    periods = {account: [] for account in opening}
+    for (bucket, account), (amount, vat, count) in sorted(totals.items(),
+                                                          key=_sort_key):
+        balances[account] = balances.get(account, 0.0) + amount
+        periods.setdefault(account, []).append({
+            'period':
+            bucket,
+            'amount':
+            _money(amount),
+            'vat_amount':
+            _money(vat),
+            'transactions':
+            count,
+            'balance':
+            _money(balances[account]),
+        })
+    accounts = [{
+        'account_id': account,
+        'opening_balance': _money(opening.get(account, 0.0)),
+        'closing_balance': _money(balances[account]),
+        'periods': periods[account],
+    } for account in sorted(periods, key=lambda a: (a is None, a))]
+    report = {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'period': period,
+        'accounts': accounts,
+    }
+    report_cache.put(key, tenant_id, None, end_date, report, generation)
+    return report
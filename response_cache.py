@@ -0,0 +1,100 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_etag(body):
+    """Strong ETag for a serialized response body."""
+    return '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value names `etag` (or is `*`)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate in ('*', etag):
+            return True
+    return False
+
+
+class ResponseCache:
+    """Serialized GET responses with ETags, in a size-bounded LRU.
+
+    Each entry records the table it was read from and the tenant it was
+    read for; `invalidate(table, tenant_id)` (registered as a database
+    write listener) drops exactly those entries, or the table's entries
+    for every tenant when tenant_id is None. `ttl` (seconds) bounds
+    staleness from writes made by other worker processes.
+
+    Take `generation(table)` before running the query and pass it to
+    `put`: a response built while a write to the table committed is then
+    not cached.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (table, tenant_id, stored_at, etag, body)
+        self._entries = OrderedDict()
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, table):
+        with self._lock:
+            return self._generations.get(table, 0)
+
+    def get(self, key):
+        """Return (etag, body) for a fresh entry, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None
+                                      or now - entry[2] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[3], entry[4]
+            self.misses += 1
+            return None
+
+    def put(self, key, table, tenant_id, body, generation):
+        """Store a body and return its ETag."""
+        etag = make_etag(body)
+        with self._lock:
+            if self._generations.get(table, 0) != generation:
+                return etag
+            self._entries[key] = (table, tenant_id, time.monotonic(), etag,
+                                  body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+    def invalidate(self, table, tenant_id=None):
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry[0] == table and (
+                    tenant_id is None or entry[1] in (tenant_id, None))
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,79 @@
+import os
+import json
+import uuid
+import decimal
+import datetime
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder is used instead
+    orjson = None
+
+
+def _default(value):
+    """Encode the non-JSON types our queries return."""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(
+        f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class StdlibSerializer:
+    """json module C encoder, compact separators, UTF-8 output."""
+
+    name = 'stdlib'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(default=_default,
+                                         ensure_ascii=False,
+                                         separators=(',', ':'))
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj).encode()
+
+
+class OrjsonSerializer:
+    """orjson: dates and datetimes are encoded natively, Decimal through
+    the same default hook as the stdlib encoder."""
+
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise RuntimeError("orjson is not installed")
+
+    def dumps(self, obj):
+        return orjson.dumps(obj,
+                            default=_default,
+                            option=orjson.OPT_NON_STR_KEYS)
+
+
+SERIALIZERS = {
+    'stdlib': StdlibSerializer,
+    'orjson': OrjsonSerializer,
+}
+
+
+def get_serializer(name=None):
+    """Build a serializer by name; None or 'auto' picks the fastest
+    installed one."""
+    if name in (None, '', 'auto'):
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown JSON serializer {name!r}")
+    return SERIALIZERS[name]()
+
+
+# JSON_SERIALIZER=stdlib forces the stdlib encoder even if orjson exists
+serializer = get_serializer(os.getenv('JSON_SERIALIZER'))
+
+
+def dumps(obj):
+    """Encode `obj` to UTF-8 JSON bytes with the configured serializer."""
+    return serializer.dumps(obj)
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import (Database, init_db, fleet_state, permission_resolver,
+                      rate_cache, report_cache, translation_catalog)
+
+
+def _clear_caches():
+    # Process-wide caches keyed by row ids, which every test database reuses
+    fleet_state.invalidate()
+    permission_resolver.invalidate()
+    rate_cache.invalidate()
+    report_cache.clear()
+    translation_catalog.clear()
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """A migrated SQLite database in tmp_path, opened as Database's pool."""
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.setattr(Database, 'db_file', str(tmp_path / 'rentmaster.db'))
+    monkeypatch.setattr(Database, 'pool', None)
+    _clear_caches()
+    init_db()
+    yield Database
+    Database.pool.close()
+    _clear_caches()
@@ -0,0 +1,158 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import asgi
+import main
+from database import (BookingConflictError, add_booking, add_car, get_bookings,
+                      get_cars)
+
+
+@pytest.fixture
+def car_id(sqlite_db):
+    add_car(1, 'Corolla', {'daily': 40}, None, 1000, 'full')
+    return get_cars(1)[0]['id']
+
+
+def _book(car_id,
+          start_date='2030-01-01',
+          end_date='2030-01-03',
+          contract_number='C1',
+          account_id=None):
+    return add_booking(1, car_id, 'Ann', start_date, end_date, '2', 80.0,
+                       contract_number, 'card', account_id)
+
+
+def _vendor_client():
+    client = main.app.test_client()
+    with client.session_transaction() as session:
+        session.update(username='vendor1', role='vendor', vendor_id=1)
+    return client
+
+
+def _form(car_id, **values):
+    return dict(
+        dict(car_id=str(car_id),
+             user_name='Ann',
+             start_date='2030-01-01',
+             end_date='2030-01-03',
+             duration='2',
+             contract_number='C1',
+             payment_type='card'), **values)
+
+
+def test_add_booking_returns_true(car_id):
+    assert _book(car_id) is True
+    assert [b['contract_number'] for b in get_bookings(1)] == ['C1']
+
+
+@pytest.mark.parametrize('values', [
+    dict(car_id='one'),
+    dict(start_date='tomorrow'),
+    dict(end_date=None),
+    dict(end_date='2029-12-31'),
+    dict(account_id='cash'),
+])
+def test_add_booking_rejects_bad_values(car_id, values):
+    with pytest.raises(ValueError):
+        _book(**dict(dict(car_id=car_id), **values))
+    assert get_bookings(1) == []
+
+
+def test_add_booking_reports_a_failed_insert(car_id):
+    assert _book(car_id) is True
+    # contract_number is UNIQUE
+    assert _book(car_id, '2030-02-01', '2030-02-03') is False
+
+
+def test_flask_booking_route_maps_errors(car_id):
+    client = _vendor_client()
+    response = client.post('/api/bookings',
+                           data=_form(car_id, account_id='cash'))
+    assert response.status_code == 400
+    response = client.post('/api/bookings', data=_form(car_id))
+    assert response.status_code == 200
+    response = client.post('/api/bookings',
+                           data=_form(car_id,
+                                      start_date='2030-02-01',
+                                      end_date='2030-02-03'))
+    assert response.status_code == 500
+    assert len(get_bookings(1)) == 1
+
+
+def test_asgi_booking_route_maps_errors(car_id):
+    client = TestClient(asgi.app)
+    client.post('/api/login',
+                data={
+                    'username': 'vendor1',
+                    'password': 'vendorpass'
+                })
+    response = client.post('/api/bookings',
+                           data=_form(car_id, account_id='cash'))
+    assert response.status_code == 400
+    response = client.post('/api/bookings', data=_form(car_id))
+    assert response.status_code == 200
+    response = client.post('/api/bookings',
+                           data=_form(car_id,
+                                      start_date='2030-02-01',
+                                      end_date='2030-02-03'))
+    assert response.status_code == 500
+
+
+def test_overlapping_booking_is_rejected(car_id):
+    assert _book(car_id, '2030-01-01', '2030-01-05', 'C1')
+    with pytest.raises(BookingConflictError):
+        _book(car_id, '2030-01-04', '2030-01-06', 'C2')
+    with pytest.raises(BookingConflictError):
+        _book(car_id, '2029-12-30', '2030-01-02', 'C3')
+    assert len(get_bookings(1)) == 1
+
+
+def test_back_to_back_bookings_do_not_overlap(car_id):
+    # Ranges are half-open: a car returned on a day can go out again
+    assert _book(car_id, '2030-01-01', '2030-01-05', 'C1')
+    assert _book(car_id, '2030-01-05', '2030-01-07', 'C2')
+    assert _book(car_id, '2029-12-28', '2030-01-01', 'C3')
+    assert len(get_bookings(1)) == 3
+
+
+def test_concurrent_bookings_of_one_car_admit_exactly_one(car_id):
+    threads = 8
+    start = threading.Barrier(threads)
+    results = []
+
+    def book(number):
+        start.wait()
+        try:
+            results.append(_book(car_id, contract_number=f"C{number}"))
+        except BookingConflictError:
+            results.append('conflict')
+
+    workers = [
+        threading.Thread(target=book, args=(n, )) for n in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+    assert sorted(results, key=str) == [True] + ['conflict'] * (threads - 1)
+    assert len(get_bookings(1)) == 1
+
+
+def test_booking_routes_answer_409_for_an_overlap(car_id):
+    assert _book(car_id, '2030-01-01', '2030-01-05', 'C1')
+    overlap = _form(car_id,
+                    start_date='2030-01-03',
+                    end_date='2030-01-04',
+                    contract_number='C2')
+    assert _vendor_client().post('/api/bookings',
+                                 data=overlap).status_code == 409
+    client = TestClient(asgi.app)
+    client.post('/api/login',
+                data={
+                    'username': 'vendor1',
+                    'password': 'vendorpass'
+                })
+    assert client.post('/api/bookings', data=overlap).status_code == 409
+    assert len(get_bookings(1)) == 1
@@ -0,0 +1,181 @@
+import threading
+import time
+
+import pytest
+
+from connection_pool import ConnectionPool, PoolClosed, PoolTimeout
+
+
+class _Connection:
+
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+        self.resets = 0
+
+    def close(self):
+        self.closed = True
+
+
+class _Factory:
+
+    def __init__(self):
+        self.opened = []
+        self.fail_next = False
+
+    def __call__(self):
+        if self.fail_next:
+            self.fail_next = False
+            raise OSError("connection refused")
+        conn = _Connection(len(self.opened) + 1)
+        self.opened.append(conn)
+        return conn
+
+
+def _is_alive(conn, full=False):
+    return conn.alive
+
+
+def _reset(conn):
+    if not conn.alive:
+        raise RuntimeError("connection is broken")
+    conn.resets += 1
+
+
+@pytest.fixture
+def factory():
+    return _Factory()
+
+
+def _pool(factory, **settings):
+    settings = dict(dict(min_size=0, max_size=2, timeout=1.0), **settings)
+    return ConnectionPool(factory,
+                          is_alive=_is_alive,
+                          reset=_reset,
+                          **settings)
+
+
+def test_min_size_connections_are_opened_up_front(factory):
+    pool = _pool(factory, min_size=2)
+    assert len(factory.opened) == 2
+    assert pool.stats()['idle'] == 2
+
+
+def test_invalid_sizes_are_rejected(factory):
+    with pytest.raises(ValueError):
+        ConnectionPool(factory, min_size=3, max_size=2)
+
+
+def test_released_connection_is_reset_and_reused(factory):
+    pool = _pool(factory)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert second is first
+    assert first.resets == 2
+    assert pool.stats()['checkouts'] == 2
+    assert len(factory.opened) == 1
+
+
+def test_checkout_times_out_when_exhausted(factory):
+    pool = _pool(factory, max_size=1)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.05)
+    assert pool.stats()['timeouts'] == 1
+    pool.release(conn)
+    assert pool.acquire(timeout=0.05) is conn
+
+
+def test_waiter_gets_the_released_connection(factory):
+    pool = _pool(factory, max_size=1)
+    conn = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    while pool.stats()['waiting'] == 0:
+        time.sleep(0.001)
+    pool.release(conn)
+    waiter.join(1.0)
+    assert got == [conn]
+
+
+def test_unhealthy_idle_connection_is_discarded(factory):
+    pool = _pool(factory)
+    with pool.connection() as conn:
+        pass
+    conn.alive = False
+    with pool.connection() as replacement:
+        assert replacement is not conn
+    assert conn.closed
+    stats = pool.stats()
+    assert stats['discarded'] == 1
+    assert stats['size'] == 1
+
+
+def test_connection_broken_in_block_is_discarded(factory):
+    pool = _pool(factory)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.alive = False
+            raise RuntimeError("query failed")
+    assert conn.closed
+    assert pool.stats()['size'] == 0
+
+
+def test_failed_reset_discards_the_connection(factory):
+    pool = _pool(factory)
+    conn = pool.acquire()
+    conn.alive = False
+    pool.release(conn)
+    assert conn.closed
+    assert pool.stats()['idle'] == 0
+
+
+def test_failed_connect_frees_its_slot(factory):
+    pool = _pool(factory, max_size=1)
+    factory.fail_next = True
+    with pytest.raises(OSError):
+        pool.acquire()
+    assert pool.stats()['size'] == 0
+    assert pool.acquire(timeout=0.05) is factory.opened[0]
+
+
+def test_thread_affinity_returns_the_threads_own_connection(factory):
+    pool = _pool(factory, thread_affinity=True)
+    mine = pool.acquire()
+    other = pool.acquire()
+    pool.release(mine)
+    # Released last, so plain LIFO would hand it out next
+    releaser = threading.Thread(target=pool.release, args=(other, ))
+    releaser.start()
+    releaser.join()
+    assert pool.acquire() is mine
+
+
+def test_without_affinity_the_last_released_comes_first(factory):
+    pool = _pool(factory)
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+    releaser = threading.Thread(target=pool.release, args=(second, ))
+    releaser.start()
+    releaser.join()
+    assert pool.acquire() is second
+
+
+def test_closed_pool_closes_idle_connections_and_refuses_checkouts(factory):
+    pool = _pool(factory)
+    in_use = pool.acquire()
+    idle = pool.acquire()
+    pool.release(idle)
+    pool.close()
+    assert idle.closed
+    assert not in_use.closed
+    with pytest.raises(PoolClosed):
+        pool.acquire()
+    pool.release(in_use)
+    assert in_use.closed
+    assert pool.stats()['size'] == 0
@@ -0,0 +1,46 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import asgi
+import main
+from database import get_customers
+
+
+def _flask_client():
+    client = main.app.test_client()
+    with client.session_transaction() as session:
+        session.update(username='vendor1', role='vendor', vendor_id=1)
+    return client.post
+
+
+def _asgi_client():
+    client = TestClient(asgi.app)
+    client.post('/api/login',
+                data={
+                    'username': 'vendor1',
+                    'password': 'vendorpass'
+                })
+    return client.post
+
+
+@pytest.mark.parametrize('client', [_flask_client, _asgi_client])
+@pytest.mark.parametrize('rating', [None, '', 'five'])
+def test_add_customer_rejects_a_bad_rating(sqlite_db, client, rating):
+    form = {'add_customer': '1', 'name': 'Ann'}
+    if rating is not None:
+        form['rating'] = rating
+    response = client()('/api/customers', data=form)
+    assert response.status_code == 400
+    assert get_customers(1) == []
+
+
+@pytest.mark.parametrize('client', [_flask_client, _asgi_client])
+def test_add_customer(sqlite_db, client):
+    response = client()('/api/customers',
+                        data={
+                            'add_customer': '1',
+                            'name': 'Ann',
+                            'rating': '4'
+                        })
+    assert response.status_code == 200
+    assert [(c['name'], c['rating']) for c in get_customers(1)] == [('Ann', 4)]
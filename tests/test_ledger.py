@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+
+import pytest
+
+from database import _write_ledger_transactions, get_transactions
+from ledger import LedgerClosed, LedgerError, LedgerWriter
+
+
+def _entry(ledger_id, amount=10.0):
+    return {
+        'ledger_id': ledger_id,
+        'tenant_id': 1,
+        'category': 'rental',
+        'amount': amount,
+        'description': ledger_id,
+        'vat_amount': 0,
+        'account_id': None,
+        'payment_type': 'card',
+        'date': '2030-01-01 12:00:00',
+    }
+
+
+def _spool_files(spool_dir):
+    return sorted(name for name in os.listdir(spool_dir)
+                  if name.endswith('.spool'))
+
+
+class _Batches:
+    """write_batch that records batches and fails as told."""
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.written = []
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, entries):
+        with self.lock:
+            self.calls += 1
+            if self.failures:
+                raise self.failures.pop(0)
+            for entry in entries:
+                if entry.get('bad'):
+                    raise ValueError(f"bad entry {entry['ledger_id']}")
+            self.written.extend(entry['ledger_id'] for entry in entries)
+
+
+def test_orphaned_spool_is_replayed_once(sqlite_db, tmp_path):
+    spool_dir = tmp_path / 'spool'
+    spool_dir.mkdir()
+    _write_ledger_transactions([_entry('written')])
+    # A dead writer's spool: one entry it committed, one it did not and
+    # a line torn by the crash
+    (spool_dir / 'ledger-1-dead-1.spool').write_text(
+        json.dumps(_entry('written')) + '\n' + json.dumps(_entry('pending')) +
+        '\n' + '{"ledger_id": "torn", "ten')
+
+    ledger = LedgerWriter(_write_ledger_transactions,
+                          spool_dir=str(spool_dir),
+                          fsync=False)
+    ledger.start()
+    assert ledger.flush(timeout=5)
+    ledger.close(5)
+
+    ids = sorted(t['description'] for t in get_transactions(1))
+    assert ids == ['pending', 'written']
+    assert _spool_files(spool_dir) == []
+
+
+def test_spool_of_a_live_writer_is_not_replayed(tmp_path):
+    batches = _Batches()
+    live = LedgerWriter(batches, spool_dir=str(tmp_path), max_delay=60)
+    live.append(_entry('a'))
+    other = LedgerWriter(batches, spool_dir=str(tmp_path), fsync=False)
+    other.start()
+    assert other.flush(timeout=5)
+    assert batches.written == []
+    live.close(5)
+    other.close(5)
+    assert batches.written == ['a']
+    assert _spool_files(tmp_path) == []
+
+
+def test_rejected_entry_raises_on_flush_and_the_rest_are_written(tmp_path):
+    batches = _Batches()
+    ledger = LedgerWriter(batches, spool_dir=str(tmp_path), max_delay=60)
+    good = ledger.append(_entry('good'))
+    bad = ledger.append(dict(_entry('bad'), bad=True))
+    last = ledger.append(_entry('last'))
+    with pytest.raises(LedgerError, match='bad entry bad'):
+        ledger.flush(bad, timeout=5)
+    assert ledger.flush(good, timeout=5)
+    assert ledger.flush(last, timeout=5)
+    assert batches.written == ['good', 'last']
+    assert ledger.stats()['rejected'] == 1
+    with open(tmp_path / 'ledger-rejected.jsonl') as f:
+        assert json.loads(f.read())['entry']['ledger_id'] == 'bad'
+    ledger.close(5)
+
+
+def test_retryable_failure_keeps_the_batch_queued(tmp_path):
+    batches = _Batches(failures=[ConnectionError("database is down")])
+    ledger = LedgerWriter(batches,
+                          spool_dir=str(tmp_path),
+                          max_delay=0.001,
+                          retryable=(ConnectionError, ),
+                          fsync=False)
+    seq = ledger.append(_entry('a'))
+    assert ledger.flush(seq, timeout=5)
+    assert batches.written == ['a']
+    stats = ledger.stats()
+    assert stats['failures'] == 1
+    assert stats['rejected'] == 0
+    ledger.close(5)
+
+
+def test_close_writes_the_queue_and_removes_the_spool(tmp_path):
+    batches = _Batches()
+    ledger = LedgerWriter(batches,
+                          spool_dir=str(tmp_path),
+                          max_delay=60,
+                          segment_entries=2,
+                          fsync=False)
+    for n in range(5):
+        ledger.append(_entry(str(n)))
+    assert len(_spool_files(tmp_path)) == 3
+    ledger.close(5)
+    assert batches.written == ['0', '1', '2', '3', '4']
+    assert _spool_files(tmp_path) == []
+    with pytest.raises(LedgerClosed):
+        ledger.append(_entry('late'))
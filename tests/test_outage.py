@@ -0,0 +1,135 @@
+"""PostgreSQL going away while the app is running: helpers and routes must
+answer 503 instead of empty data or a false success."""
+import psycopg2
+import pytest
+from fastapi.testclient import TestClient
+
+import asgi
+import main
+from database import (Database, DatabaseUnavailable, add_customer,
+                      blacklist_customer, get_bookings)
+
+
+class _DroppedCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, params=None):
+        self.connection.closed = 2
+        raise psycopg2.OperationalError(
+            "server closed the connection unexpectedly")
+
+    executemany = execute
+
+    def close(self):
+        pass
+
+
+class _DroppedConnection:
+    """A pooled connection whose server has gone away: the first query
+    fails and leaves it closed, as psycopg2 does."""
+
+    def __init__(self):
+        self.closed = 0
+
+    def cursor(self, name=None, cursor_factory=None):
+        return _DroppedCursor(self)
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self._check()
+
+    def rollback(self):
+        self._check()
+
+    def close(self):
+        self.closed = 1
+
+    def _check(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+
+
+@pytest.fixture
+def postgres_down(monkeypatch):
+    """Postgres that accepted the pool's first connection, then went down."""
+    connections = [_DroppedConnection()]
+
+    def connect(*args, **kwargs):
+        if connections:
+            return connections.pop()
+        raise psycopg2.OperationalError("could not connect to server")
+
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://rentmaster@db/rentmaster')
+    monkeypatch.setattr(psycopg2, 'connect', connect)
+    monkeypatch.setattr(Database, '_reconnect', classmethod(lambda cls: None))
+    for name, value in (('pool', None), ('available', True),
+                        ('last_error', None), ('_reconnect_thread', None),
+                        ('is_postgres',
+                         Database.is_postgres), ('dialect', Database.dialect)):
+        monkeypatch.setattr(Database, name, value)
+    main.response_cache.clear()
+    asgi.response_cache.clear()
+    yield
+    main.response_cache.clear()
+    asgi.response_cache.clear()
+
+
+def _vendor_client():
+    client = main.app.test_client()
+    with client.session_transaction() as session:
+        session.update(username='vendor1', role='vendor', vendor_id=1)
+    return client
+
+
+def test_helpers_raise_once_the_connection_drops(postgres_down):
+    with pytest.raises(DatabaseUnavailable):
+        get_bookings(1)
+    assert not Database.available
+    # Writes fail fast from then on instead of reporting success
+    with pytest.raises(DatabaseUnavailable):
+        add_customer(1, 'Ann', 'ann@example.com', '555', 'ID1', 'L1', 'US',
+                     '2030-01-01', 5)
+    with pytest.raises(DatabaseUnavailable):
+        blacklist_customer(1, True)
+
+
+def test_flask_routes_answer_503(postgres_down):
+    client = _vendor_client()
+    response = client.get('/api/bookings')
+    assert response.status_code == 503
+    response = client.post('/api/customers',
+                           data={
+                               'add_customer': '1',
+                               'name': 'Ann',
+                               'rating': '5'
+                           })
+    assert response.status_code == 503
+    assert main.response_cache.stats()['entries'] == 0
+
+
+def test_flask_cache_is_bypassed_during_an_outage(postgres_down):
+    key = ('/api/cars', 1, ())
+    main.response_cache.put(key, 'cars', 1, b'{"status":"success"}',
+                            main.response_cache.generation('cars'))
+    client = _vendor_client()
+    assert client.get('/api/cars').status_code == 200
+    assert client.get('/api/bookings').status_code == 503
+    assert client.get('/api/cars').status_code == 503
+
+
+def test_asgi_routes_answer_503(postgres_down):
+    # No lifespan, so reads go through the same sync pool as the writes
+    client = TestClient(asgi.app)
+    client.post('/api/login',
+                data={
+                    'username': 'vendor1',
+                    'password': 'vendorpass'
+                })
+    assert client.get('/api/customers').status_code == 503
+    assert client.get('/api/cars').status_code == 503
+    assert client.get('/api/bookings').status_code == 503
+    assert asgi.response_cache.stats()['entries'] == 0
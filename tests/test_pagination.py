@@ -0,0 +1,102 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import asgi
+import main
+from database import (add_car, cars_page_query, decode_cursor, encode_cursor,
+                      get_cars_page)
+
+
+@pytest.fixture
+def cars(sqlite_db):
+    for n in range(5):
+        add_car(1, f"Car {n}", {'daily': 40}, None, 1000, 'full')
+    add_car(2, 'Other vendor', {'daily': 40}, None, 1000, 'full')
+
+
+def _flask_client():
+    client = main.app.test_client()
+    with client.session_transaction() as session:
+        session.update(username='vendor1', role='vendor', vendor_id=1)
+
+    def get(url):
+        response = client.get(url)
+        return response.status_code, response.get_json()
+
+    return get
+
+
+def _asgi_client():
+    client = TestClient(asgi.app)
+    client.post('/api/login',
+                data={
+                    'username': 'vendor1',
+                    'password': 'vendorpass'
+                })
+
+    def get(url):
+        response = client.get(url)
+        return response.status_code, response.json()
+
+    return get
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(12345)) == 12345
+
+
+@pytest.mark.parametrize('token', ['', '!!', encode_cursor('car')])
+def test_bad_cursor_is_rejected(token):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(token)
+
+
+def test_cursors_walk_every_row_once(cars):
+    names, after, pages = [], None, 0
+    while True:
+        rows, after = get_cars_page(1, limit=2, after=after)
+        names.extend(row['name'] for row in rows)
+        pages += 1
+        if after is None:
+            break
+    assert names == [f"Car {n}" for n in range(5)]
+    assert pages == 3
+
+
+def test_full_last_page_has_no_next_cursor(cars):
+    rows, after = get_cars_page(1, limit=5)
+    assert len(rows) == 5
+    assert after is None
+
+
+def test_projection_always_includes_id(cars):
+    rows, after = get_cars_page(1, limit=2, fields=['name'])
+    assert [sorted(row) for row in rows] == [['id', 'name']] * 2
+    assert decode_cursor(after) == rows[-1]['id']
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(ValueError, match='password'):
+        cars_page_query(1, 10, None, ['name', 'password'])
+
+
+@pytest.mark.parametrize('client', [_flask_client, _asgi_client])
+def test_cars_route_pages_with_cursors(cars, client):
+    get = client()
+    status, first = get('/api/cars?limit=3&fields=name')
+    assert status == 200
+    assert [row['name']
+            for row in first['data']] == ['Car 0', 'Car 1', 'Car 2']
+    _, second = get(
+        f"/api/cars?limit=3&fields=name&after={first['next_cursor']}")
+    assert [row['name'] for row in second['data']] == ['Car 3', 'Car 4']
+    assert second['next_cursor'] is None
+
+
+@pytest.mark.parametrize('client', [_flask_client, _asgi_client])
+@pytest.mark.parametrize(
+    'query', ['after=!!', 'fields=name,password', 'limit=0', 'limit=two'])
+def test_cars_route_rejects_bad_page_arguments(cars, client, query):
+    status, body = client()(f"/api/cars?{query}")
+    assert status == 400
+    assert body['status'] == 'error'
@@ -0,0 +1,48 @@
+import datetime
+
+from report_cache import ReportCache
+
+JAN = (datetime.date(2030, 1, 1), datetime.date(2030, 1, 31))
+FEB = (datetime.date(2030, 2, 1), datetime.date(2030, 2, 28))
+
+
+def _cache_with(cache, *entries):
+    for key, tenant_id, first_day, last_day in entries:
+        cache.put(key, tenant_id, first_day, last_day, key, cache.generation())
+
+
+def test_report_computed_across_a_write_is_not_stored():
+    cache = ReportCache()
+    generation = cache.generation()
+    cache.invalidate(1, *FEB)  # a transaction commits meanwhile
+    cache.put('jan', 1, *JAN, 'report', generation)
+    assert cache.get('jan') is None
+    cache.put('jan', 1, *JAN, 'report', cache.generation())
+    assert cache.get('jan') == 'report'
+
+
+def test_invalidate_drops_overlapping_reports_of_the_tenant():
+    cache = ReportCache()
+    _cache_with(cache, ('jan', 1, *JAN), ('feb', 1, *FEB),
+                ('other-tenant', 2, *FEB), ('all-tenants', None, *FEB),
+                ('balance', 1, None, JAN[1]))
+    cache.invalidate(1, datetime.date(2030, 2, 10), datetime.date(2030, 2, 10))
+    assert cache.get('feb') is None
+    assert cache.get('all-tenants') is None
+    assert cache.get('jan') == 'jan'
+    assert cache.get('other-tenant') == 'other-tenant'
+    # A running balance depends on all earlier history
+    assert cache.get('balance') == 'balance'
+    cache.invalidate(1, *JAN)
+    assert cache.get('balance') is None
+
+
+def test_clear_drops_everything_and_bumps_the_generation():
+    cache = ReportCache()
+    generation = cache.generation()
+    _cache_with(cache, ('jan', 1, *JAN))
+    cache.clear()
+    assert cache.get('jan') is None
+    assert cache.generation() == generation + 1
+    cache.put('jan', 1, *JAN, 'report', generation)
+    assert cache.get('jan') is None
@@ -0,0 +1,64 @@
+from response_cache import ResponseCache, etag_matches, make_etag
+
+
+def _cache_with(cache, *entries):
+    for key, table, tenant_id in entries:
+        cache.put(key, table, tenant_id, key.encode(), cache.generation(table))
+
+
+def test_put_returns_the_etag_and_get_the_body():
+    cache = ResponseCache()
+    etag = cache.put('cars:1', 'cars', 1, b'[]', cache.generation('cars'))
+    assert etag == make_etag(b'[]')
+    assert cache.get('cars:1') == (etag, b'[]')
+    assert cache.get('cars:2') is None
+    assert cache.stats() == {'entries': 1, 'hits': 1, 'misses': 1}
+
+
+def test_response_built_across_a_write_is_not_stored():
+    cache = ResponseCache()
+    generation = cache.generation('cars')
+    cache.invalidate('cars', 1)  # a write commits while the query runs
+    etag = cache.put('cars:1', 'cars', 1, b'[]', generation)
+    assert etag == make_etag(b'[]')
+    assert cache.get('cars:1') is None
+    # Other tables' generations are untouched
+    cache.put('bookings:1', 'bookings', 1, b'[]', generation)
+    assert cache.get('bookings:1') is not None
+
+
+def test_invalidate_drops_only_the_tenants_entries_of_the_table():
+    cache = ResponseCache()
+    _cache_with(cache, ('cars:1', 'cars', 1), ('cars:2', 'cars', 2),
+                ('cars:all', 'cars', None), ('bookings:1', 'bookings', 1))
+    cache.invalidate('cars', 1)
+    assert cache.get('cars:1') is None
+    assert cache.get('cars:all') is None
+    assert cache.get('cars:2') is not None
+    assert cache.get('bookings:1') is not None
+    cache.invalidate('cars')
+    assert cache.get('cars:2') is None
+
+
+def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl=0)
+    _cache_with(cache, ('cars:1', 'cars', 1))
+    assert cache.get('cars:1') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    _cache_with(cache, ('a', 'cars', 1), ('b', 'cars', 1))
+    cache.get('a')
+    _cache_with(cache, ('c', 'cars', 1))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+
+
+def test_etag_matches():
+    etag = make_etag(b'body')
+    assert etag_matches(etag, etag)
+    assert etag_matches('"other", W/' + etag, etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
@@ -0,0 +1,37 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import asgi
+import main
+from database import add_translation
+from translation_cache import request_language
+
+
+@pytest.mark.parametrize('session_language, header, expected', [
+    (None, None, 'en'),
+    (None, 'fr-CH, fr;q=0.9, en;q=0.8', 'fr'),
+    (None, 'en;q=0.5, de', 'de'),
+    (None, '*, es;q=0.1', 'es'),
+    (None, 'x-klingon, 12', 'en'),
+    ('de', 'fr', 'de'),
+])
+def test_request_language(session_language, header, expected):
+    assert request_language(session_language, header) == expected
+
+
+def test_both_apps_translate_for_the_request_language(sqlite_db):
+    add_translation('fr', 'Invalid credentials', 'Identifiants invalides')
+    headers = {'Accept-Language': 'fr-FR,fr;q=0.9,en;q=0.5'}
+    bad_login = {'username': 'vendor1', 'password': 'wrong'}
+
+    response = main.app.test_client().post('/api/login',
+                                           data=bad_login,
+                                           headers=headers)
+    assert response.get_json()['message'] == 'Identifiants invalides'
+    response = TestClient(asgi.app).post('/api/login',
+                                         data=bad_login,
+                                         headers=headers)
+    assert response.json()['message'] == 'Identifiants invalides'
+
+    response = TestClient(asgi.app).post('/api/login', data=bad_login)
+    assert response.json()['message'] == 'Invalid credentials'
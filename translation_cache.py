@@ -0,0 +1,103 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+_LANGUAGE = re.compile(r'[a-z]{2,3}')
+
+
+def request_language(session_language=None,
+                     accept_language=None,
+                     default='en'):
+    """Language code for a request: the one chosen in the session, else
+    the Accept-Language header's preferred language, else `default`.
+
+    Codes are primary subtags, as translations are stored: 'fr-CH' is
+    'fr'. Tags that are not language codes are ignored, so a header
+    cannot fill the catalog cache with made-up languages.
+    """
+    if session_language:
+        return session_language
+    best, best_q = default, 0.0
+    for item in (accept_language or '').split(','):
+        tag, _, params = item.partition(';')
+        tag = tag.strip().split('-')[0].lower()
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q and _LANGUAGE.fullmatch(tag):
+            best, best_q = tag, q
+    return best
+
+
+class TranslationCatalog:
+    """Per-language translation dicts loaded once and held in an LRU.
+
+    `loader(lang_code)` returns the translation rows for a language (dicts
+    with 'key' and 'value'). Each language has a version counter; `bump()`
+    advances it on writes, and a cached catalog whose version is behind is
+    reloaded on next use. `ttl` (seconds, optional) also expires catalogs,
+    which picks up writes made by other worker processes.
+    """
+
+    def __init__(self, loader, max_languages=16, ttl=None):
+        self._loader = loader
+        self.max_languages = max_languages
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._catalogs = OrderedDict()  # lang -> (version, loaded_at, dict)
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self, lang_code):
+        with self._lock:
+            self._versions[lang_code] = self._versions.get(lang_code, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._catalogs.clear()
+
+    def get(self, lang_code):
+        """Return the read-only {key: value} mapping for a language."""
+        now = time.monotonic()
+        with self._lock:
+            version = self._versions.get(lang_code, 0)
+            entry = self._catalogs.get(lang_code)
+            if entry is not None:
+                cached_version, loaded_at, catalog = entry
+                fresh = self.ttl is None or now - loaded_at < self.ttl
+                if cached_version == version and fresh:
+                    self._catalogs.move_to_end(lang_code)
+                    self.hits += 1
+                    return catalog
+            self.misses += 1
+
+        # Load outside the lock; a concurrent load of the same language just
+        # does the work twice and the later result wins.
+        catalog = MappingProxyType(
+            {row['key']: row['value']
+             for row in self._loader(lang_code)})
+        with self._lock:
+            self._catalogs[lang_code] = (version, now, catalog)
+            self._catalogs.move_to_end(lang_code)
+            while len(self._catalogs) > self.max_languages:
+                self._catalogs.popitem(last=False)
+        return catalog
+
+    def lookup(self, lang_code, key, default=None):
+        return self.get(lang_code).get(key, default)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'languages': list(self._catalogs),
+                'hits': self.hits,
+                'misses': self.misses,
+            }